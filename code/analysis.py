@@ -1,4 +1,13 @@
+import asyncio
+import hashlib
 import json
+from batching import get_batched
+from cache import CacheMiss
+from llm import map_concurrent
+from features import game_features
+from structured import parse_json, STUDY_CONFIG
+from tokens import TokenEstimator
+import telemetry
 
 def collect_validated_games(category):
     validated = []
@@ -47,38 +56,55 @@ def experiment_design(agent, description, outcome, game):
         Respond ONLY with the JSON string for the proposed study.
         """
 
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, STUDY_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "study_design")
         return response_json
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during autoformalization: {e}")
         return None
 
 
 
-def theoretical_analysis(agent, games):
+def theoretical_analysis(agent, games, features=None):
+    """
+    Asks for a game-theoretic analysis of a set of validated games, given the features computed
+    by features.game_features rather than the full game definitions.
+
+    Args:
+        agent: A Gemini model object.
+        games: Games collected by collect_validated_games.
+        features: Their game_features, computed here if not given.
+
+    Returns:
+        The analysis as text, or None if an error occurs.
+    """
     try:
+        if features is None:
+            features = game_features(games)
         # Prepare the prompt for the Gemini model.
         prompt = """
         You are an expert game theorist. 
-        You are provided with a set of formal game definitions in JSON format. 
-        They are normal-form two-player games.
+        You are provided with a set of normal-form games, mostly two-player games, each summarized by features computed exactly from its payoffs:
+        the players and their actions, the equilibrium and whether it is pure or mixed and Pareto efficient,
+        whether the game is constant-sum or symmetric, its dominant and (iteratively) dominated actions,
+        and for 2x2 games the Robinson-Goforth ordinal class, with (row rank, column rank) per cell and 4 the best outcome, and the name of well-known symmetric games.
         Your task is to analyze the games and characterize them using game theoretic concepts.
-        For example:
+        Rely on the features for the facts about each game, and interpret them. For example:
         - Are the games cooperative, competitive or mixed games?
-        - Are the utilities symmetric or asymmetric?
-        - Are there dominant strategies?
-        - Are the equilibria strategies pure or mixed?
+        - What do the symmetries or asymmetries of the utilities say about the interactions?
+        - What role do dominant strategies play?
+        - What do pure or mixed equilibria say about the behaviors?
         - Do they fall into certain categories of well-studied games (such as prisoner's dilemma etc.)?
         - Do the game structures have striking commonalities or patterns?
         
         """
 
-        prompt += f"""\nGame Definitions:\n{games}\n\n
+        prompt += f"""\nGame Features:\n{json.dumps(features)}\n\n
 
         Respond with a thorough and professional game-theoretic analysis.
         """
@@ -87,12 +113,140 @@ def theoretical_analysis(agent, games):
 
         return response
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during autoformalization: {e}")
         return None
 
 
-def analyze_validated_set(agent, validated):
+def analysis_records(games, features=None):
+    # what the analysis needs of each game: its features, the observed outcome and the interaction without the article background
+    if features is None:
+        features = game_features(games)
+    return [dict(feature, Interaction=item["Description"].split("Interaction of interest:\n")[-1], Outcome=item["Outcome"])
+            for item, feature in zip(games, features)]
+
+
+def chunk_records(records, token_budget, estimator=None, chunk_games=10):
+    """
+    Splits analysis records into chunks of at most token_budget estimated tokens.
+
+    Besides the budget, a chunk ends after any record whose hash is a multiple of chunk_games, so the boundaries depend
+    on the records themselves and not on their position: adding a game changes only the chunk it falls in.
+
+    Returns:
+        A list of lists of records.
+    """
+    estimator = estimator if estimator is not None else TokenEstimator()
+    chunks = []
+    chunk = []
+    used = 0
+    for record in records:
+        text = json.dumps(record)
+        tokens = estimator.count(text)
+        if chunk and used + tokens > token_budget:
+            chunks.append(chunk)
+            chunk, used = [], 0
+        chunk.append(record)
+        used += tokens
+        if int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % chunk_games == 0:
+            chunks.append(chunk)
+            chunk, used = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def chunk_analysis(agent, records):
+    try:
+        prompt = """
+        You are an expert game theorist. 
+        You are provided with a subset of a larger set of normal-form games, mostly two-player games, each summarized by features computed exactly from its payoffs,
+        with the interaction it models and the outcome observed in nature.
+        Your task is to characterize this subset using game theoretic concepts, as input to an analysis of the whole set:
+        - How many games are cooperative, competitive or mixed, symmetric, constant-sum, dominance solvable?
+        - Which equilibria are pure or mixed, and which are Pareto efficient?
+        - Which ordinal classes or well-studied games (such as prisoner's dilemma etc.) occur?
+        - What commonalities or patterns do the game structures share?
+        Refer to games by their Game_Num and be concise: give the counts and patterns, not a description of every game.
+        """
+
+        prompt += f"""\nGames:\n{json.dumps(records)}\n\n
+
+        Respond with the characterization of this subset.
+        """
+
+        return agent.get_response(prompt)
+
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"Error during chunk analysis: {e}")
+        return None
+
+
+def reduce_analyses(agent, analyses):
+    try:
+        prompt = """
+        You are an expert game theorist. 
+        You are provided with analyses of disjoint subsets of a set of normal-form games modeling animal interactions.
+        Your task is to combine them into a single analysis of the whole set, characterizing the games using game theoretic concepts.
+        Add up the counts, and identify the patterns and well-studied games that recur across the subsets.
+        """
+
+        prompt += f"""\nSubset Analyses:\n""" + "\n\n".join(f"Subset {i + 1}:\n{analysis}" for i, analysis in enumerate(analyses))
+        prompt += """\n\n
+        Respond with a thorough and professional game-theoretic analysis of the whole set.
+        """
+
+        return agent.get_response(prompt)
+
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"Error during reduction of analyses: {e}")
+        return None
+
+
+async def theoretical_analysis_hierarchical(agent, games, features=None, token_budget=8000, chunk_games=10, max_concurrency=None):
+    """
+    Same as theoretical_analysis for validated sets too large for a single prompt:
+    the games are split into chunks under a token budget (see chunk_records), each chunk is analyzed concurrently,
+    and the chunk analyses are combined by reduce_analyses, in groups under the same budget until one is left.
+    With a ResponseCache on the agent, adding games re-runs only the chunks they fall in and the reductions above them.
+
+    Args:
+        agent: A Gemini model object.
+        games: Games collected by collect_validated_games.
+        features: Their game_features, computed here if not given.
+        token_budget: Maximum estimated tokens of games or analyses in one prompt.
+        chunk_games: Expected number of games per chunk, see chunk_records.
+        max_concurrency: Chunks analyzed at once, by default as many as the agent's requests per minute.
+
+    Returns:
+        The analysis as text, or None if no chunk could be analyzed.
+    """
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    estimator = getattr(agent, "estimator", None) or TokenEstimator()
+    chunks = chunk_records(analysis_records(games, features), token_budget, estimator, chunk_games)
+    print(f"analyzing {len(games)} games in {len(chunks)} chunks")
+    with telemetry.context(stage="theoretical_analysis"):
+        analyses = await map_concurrent(lambda chunk: chunk_analysis(agent, chunk), chunks, max_concurrency)
+        analyses = [x for x in analyses if x is not None]
+        while len(analyses) > 1:
+            groups = chunk_records(analyses, token_budget, estimator, chunk_games)
+            if len(groups) == len(analyses):
+                # every analysis fills a prompt on its own: combine them pairwise
+                groups = [analyses[i:i + 2] for i in range(0, len(analyses), 2)]
+            analyses = await map_concurrent(lambda group: reduce_analyses(agent, group), groups, max_concurrency)
+            analyses = [x for x in analyses if x is not None]
+    return analyses[0] if analyses else None
+
+
+def analyze_validated_set(agent, validated, token_budget=None):
+    # token_budget: analyze hierarchically in chunks of that many tokens (see theoretical_analysis_hierarchical)
     for i, item in enumerate(validated):
         description = item["Description"]
         outcome = item["Outcome"]
@@ -100,6 +254,50 @@ def analyze_validated_set(agent, validated):
         proposal = experiment_design(agent, description, outcome, game)
         if proposal is not None:
             validated[i]["ProposedStudy"] = proposal
-    analysis = theoretical_analysis(agent, validated)
+    features = game_features(validated)
+    for i, feature in enumerate(features):
+        validated[i]["Features"] = feature
+    if token_budget is not None:
+        analysis = asyncio.run(theoretical_analysis_hierarchical(agent, validated, features, token_budget))
+    else:
+        analysis = theoretical_analysis(agent, validated, features)
+    print(analysis)
+    return validated, analysis
+
+
+def analyze_validated_set_batched(agent, validated, batch_size=5, token_budget=None):
+    # same as analyze_validated_set, with the study designs of batch_size games packed into each request
+    instructions = """
+        You are an expert biologist. 
+        You are provided with descriptions of animal interactions, each with a formal game definition in JSON format. 
+        Each game is a hypothesized model of the animal behaviors. 
+        The Nash equilibrium of the game fits the most commonly observed outcome of the animal interaction.
+        But we want to know how predictive the game model is of the animal behaviors more generally.
+        Your task is to design, for each game, either a lab experiment or a field study that tests the accuracy of the game model under alternative conditions.
+        
+        Elements of the study that need to be planned:
+        - Goal: succinct formulation of the purpose of the study.
+        - Hypothesis: precise definition of the independent and dependent variables, the null hypothesis and the hypothesis.
+        - Type: whether it's a lab experiment or field study.
+        - Method: the intervention or manipulation in the lab, or the means of observation in the field.
+        - Requirements: the tools, instruments or other preconditions for carrying out the study.
+        - Data: the observations to be collected and their format.
+        - Ethics: ethical considerations in the study design.
+        """
+    schema = """{"Goal": str , "Hypothesis": str, "Type": str ("lab" or "field"), "Method": str, "Instruments": str, "Data": str, "Ethics": str}"""
+    items = {i: f"Description:\n{item['Description']}\n\nUsual Observation:\n{item['Outcome']}\n\nGame Model:\n{item['Game']}"
+             for i, item in enumerate(validated)}
+    proposals = get_batched(agent, instructions, schema, items, lambda i, proposal: isinstance(proposal, dict), batch_size,
+                            stage="study_design")
+    for i, proposal in proposals.items():
+        if proposal is not None:
+            validated[i]["ProposedStudy"] = proposal
+    features = game_features(validated)
+    for i, feature in enumerate(features):
+        validated[i]["Features"] = feature
+    if token_budget is not None:
+        analysis = asyncio.run(theoretical_analysis_hierarchical(agent, validated, features, token_budget))
+    else:
+        analysis = theoretical_analysis(agent, validated, features)
     print(analysis)
     return validated, analysis
@@ -3,6 +3,11 @@ import google.generativeai as genai
 import typing_extensions as typing
 from typing import Dict, Any, Tuple, List, Union
 import json
+from llm import map_concurrent
+from batching import get_batched
+from cache import CacheMiss
+from structured import parse_json, JSON_CONFIG, PLAYERS_ACTIONS_CONFIG
+import telemetry
 
 
 def autoformalize_players_actions(agent, description: str) -> dict:
@@ -33,18 +38,48 @@ def autoformalize_players_actions(agent, description: str) -> dict:
         Return ONLY the JSON.
         """
 
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, PLAYERS_ACTIONS_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "players_actions")
         return response_json
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during autoformalization: {e}")
         return None
 
 
+def utilities_prompt(description: str, player: str, json_str: str) -> str:
+    # prompt for the utilities of one player, given the players and actions of the game as a JSON string
+    prompt = "You are an expert game formalization assistant. You are provided with a description of an animal interaction and a JSON string defining the players and possible actions. "
+    prompt += f"""\nGame Description to formalize:\n{description}\n\nPlayers and their possible actions:\n{json_str}\n"""
+    prompt += f"Your task is to define the utilities of player: {player}"
+    prompt += """        
+        To define the utilities, use the following JSON schema:  
+
+        ```json
+        {action1(str): {response1(str): {"outcome": str, "utility": float}, response2(str): {"outcome": str, utility(float)}, ...}, action2(str): {response1(str): {"outcome": str, "utility": float},...},...]
+        ```
+        """
+    prompt += f"""
+        Where "action"s refers to each of the actions from the list of {player} possible actions, "response"s refers to each of the actions of the *other* player, "outcome" is a textual description of the results from the action/respone pair, and "utility" is the numeric value of that outcome for {player}.
+        Make sure to include every possible action of {player}, and every possible response of the other player, in the utilities.
+        Formalize the utilities for {player} in the precise format and return ONLY the JSON."""
+    others = [x["name"] for x in json.loads(json_str) if x["name"] != player]
+    if len(others) > 1:
+        # one level of responses per other player, in game order (see nplayer.NGame)
+        nested = '{"outcome": str, "utility": float}'
+        for other in reversed(others):
+            nested = f"{{response of {other}(str): {nested}, ...}}"
+        prompt += f"""
+        This game has more than two players, so the responses are nested, one level per other player in this order: {", ".join(others)}.
+        Use this schema instead: {{action1(str): {nested}, action2(str): ...}}
+        Include every combination of responses of the other players."""
+    return prompt
+
+
 def autoformalize_game(agent, description: str, player: str, json_str: str) -> str:
     """
     Autoformalizes a natural language game description into a JSON format based on the provided schema using a Gemini model.
@@ -58,28 +93,16 @@ def autoformalize_game(agent, description: str, player: str, json_str: str) -> s
     """
     try:
         # Prepare the prompt for the Gemini model.
-        prompt = "You are an expert game formalization assistant. You are provided with a description of an animal interaction and a JSON string defining the players and possible actions. "
-        prompt += f"""\nGame Description to formalize:\n{description}\n\nPlayers and their possible actions:\n{json_str}\n"""
-        prompt += f"Your task is to define the utilities of player: {player}"
-        prompt += """        
-        To define the utilities, use the following JSON schema:  
-
-        ```json
-        {action1(str): {response1(str): {"outcome": str, "utility": float}, response2(str): {"outcome": str, utility(float)}, ...}, action2(str): {response1(str): {"outcome": str, "utility": float},...},...]
-        ```
-        """
-        prompt += f"""
-        Where "action"s refers to each of the actions from the list of {player} possible actions, "response"s refers to each of the actions of the *other* player, "outcome" is a textual description of the results from the action/respone pair, and "utility" is the numeric value of that outcome for {player}.
-        Make sure to include every possible action of {player}, and every possible response of the other player, in the utilities.
-        Formalize the utilities for {player} in the precise format and return ONLY the JSON."""
+        prompt = utilities_prompt(description, player, json_str)
 
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, JSON_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "utilities")
         return response_json
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during autoformalization: {e}")
         return None
@@ -104,46 +127,121 @@ def autoformalize_expected_outcomes(agent, description, game_space):
 
         prompt += f"""Interaction of interest: {description}\nFormally defined players and actions: {game_space}\nGame outcome as observed in nature: """
 
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, JSON_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "outcome")
         return response_json
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during autoformalization of game outcome: {e}")
         return None
 
 
+def autoformalize_item(agent, item):
+    if item["Article"] != "Error":
+        description = (f"Background: {item['Article']}"
+                      f"\nInteraction of interest: {item['Description']}")
+        game = autoformalize_players_actions(agent, description)
+        if game is not None:
+            for j, player in enumerate(game):
+                name = player["name"]
+                action_defs = json.dumps(game)
+                utilities = autoformalize_game(agent, description, name, action_defs)
+                if utilities is not None:
+                    game[j]["utilities"] = utilities
+        item["Game"] = game
+    return item
+
+
 def autoformalize_category(agent, category):
     for i, item in enumerate(category):
         print("processing ", i)
-        if item["Article"] != "Error":
-            description = (f"Background: {item['Article']}"
-                          f"\nInteraction of interest: {item['Description']}")
-            game = autoformalize_players_actions(agent, description)
-            if game is not None:
-                for j, player in enumerate(game):
-                    name = player["name"]
-                    action_defs = json.dumps(game)
-                    utilities = autoformalize_game(agent, description, name, action_defs)
-                    if utilities is not None:
-                        game[j]["utilities"] = utilities
-            category[i]["Game"] = game
+        with telemetry.context(case=i):
+            category[i] = autoformalize_item(agent, item)
+    return category
+
+
+async def autoformalize_category_concurrent(agent, category, max_concurrency=None):
+    # same as autoformalize_category, with as many cases in flight as the agent's quota allows
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    category[:] = await map_concurrent(lambda item: autoformalize_item(agent, item), category, max_concurrency)
     return category
 
 
+def autoformalize_category_batched(agent, category, batch_size=5):
+    """
+    Same as autoformalize_category, packing batch_size cases into each request:
+    one request for the players and actions of a batch, and one for the utilities of every player of a batch.
+    """
+    descriptions = {i: (f"Background: {item['Article']}"
+                        f"\nInteraction of interest: {item['Description']}")
+                    for i, item in enumerate(category) if item["Article"] != "Error"}
+    instructions = """
+        You are an expert game formalization assistant. You are provided with descriptions of animal interactions. Your task is to formalize each one as a game. We will start by defining the players and their actions.
+        Adjust the names of the players and their possible actions to fit each description.
+        """
+    schema = """[{"name": str, "actions": list[str]}, {"name": str, "actions": list[str]},...]"""
+    check = lambda i, game: isinstance(game, list) and all(isinstance(x, dict) and "name" in x and isinstance(x.get("actions"), list) for x in game)
+    games = get_batched(agent, instructions, schema, {i: f"Game Description to formalize:\n{text}" for i, text in descriptions.items()},
+                        check, batch_size, stage="players_actions")
+
+    instructions = """
+        You are an expert game formalization assistant. You are provided with descriptions of animal interactions, each with a JSON string defining the players and possible actions.
+        Your task is to define the utilities of every player.
+        For each player, "action"s refers to each of the actions from the list of the player's possible actions, "response"s refers to each of the actions of the *other* player, "outcome" is a textual description of the results from the action/respone pair, and "utility" is the numeric value of that outcome for the player.
+        Make sure to include every possible action of the player, and every possible response of the other player, in the utilities.
+        """
+    schema = """{player(str): {action1(str): {response1(str): {"outcome": str, "utility": float}, response2(str): {"outcome": str, utility(float)}, ...}, action2(str): {response1(str): {"outcome": str, "utility": float},...},...}, player(str): {...}}"""
+    with_players = {i: game for i, game in games.items() if game is not None}
+    check = lambda i, result: isinstance(result, dict) and all(isinstance(result.get(x["name"]), dict) for x in with_players[i])
+    utilities = get_batched(agent, instructions, schema,
+                            {i: f"Game Description to formalize:\n{descriptions[i]}\n\nPlayers and their possible actions:\n{json.dumps(game)}"
+                             for i, game in with_players.items()},
+                            check, batch_size, stage="utilities")
+    for i in descriptions:
+        game = games[i]
+        if game is not None and utilities[i] is not None:
+            for j, player in enumerate(game):
+                game[j]["utilities"] = utilities[i][player["name"]]
+        category[i]["Game"] = game
+    return category
+
+
+def current_game(game):
+    # the latest game definition, from the raw definition of autoformalization or from a list of passes [{"GameDef": ...}]
+    if isinstance(game, list) and game and all(isinstance(x, dict) and "GameDef" in x for x in game):
+        return game[-1]["GameDef"]
+    return game
+
+
+def expected_outcomes_item(agent, item):
+    if item["Article"] != "Error" and isinstance(item.get("Game"), list) and "Error" not in list(item.keys()):
+        description = (f"Background: {item['Article']}"
+                      f"\nInteraction of interest: {item['Description']}")
+        game_string = json.dumps([{x.get("name"): x.get("actions")} for x in current_game(item["Game"]) if isinstance(x, dict)])
+        outcome = autoformalize_expected_outcomes(agent, description, game_string)
+        if outcome is not None:
+            item["Outcome"] = outcome
+    return item
+
+
 def expected_outcomes_category(agent, category):
     for i, item in enumerate(category):
         print("processing ", i)
-        if item["Article"] != "Error" and "Game" in list(item.keys()) and "Error" not in list(item.keys()):
-            description = (f"Background: {item['Article']}"
-                          f"\nInteraction of interest: {item['Description']}")
-            game_string = json.dumps([{x["name"]: x["actions"]} for x in item["Game"]])
-            outcome = autoformalize_expected_outcomes(agent, description, game_string)
-            if outcome is not None:
-                category[i]["Outcome"] = outcome
+        with telemetry.context(case=i):
+            category[i] = expected_outcomes_item(agent, item)
+    return category
+
+
+async def expected_outcomes_category_concurrent(agent, category, max_concurrency=None):
+    # same as expected_outcomes_category, with as many cases in flight as the agent's quota allows
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    category[:] = await map_concurrent(lambda item: expected_outcomes_item(agent, item), category, max_concurrency)
     return category
 
 
@@ -165,28 +263,67 @@ def improve_from_feedback(agent, description, game, outcome, feedback):
         [{"name": player1(str), "actions": list[str], "utilities": {action1(str): {response1(str): {"outcome": str, "utility": float},...},...}, {"name": player2(str)... },...]
         ```
         """
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, JSON_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "improve_from_feedback")
         return response_json
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during automodel improvement: {e}")
         return None
 
 
+def expected_outcomes_category_batched(agent, category, batch_size=5):
+    # same as expected_outcomes_category, packing batch_size cases into each request
+    items = {}
+    for i, item in enumerate(category):
+        if item["Article"] != "Error" and isinstance(item.get("Game"), list) and "Error" not in list(item.keys()):
+            description = (f"Background: {item['Article']}"
+                          f"\nInteraction of interest: {item['Description']}")
+            game_string = json.dumps([{x.get("name"): x.get("actions")} for x in current_game(item["Game"]) if isinstance(x, dict)])
+            items[i] = f"Interaction of interest: {description}\nFormally defined players and actions: {game_string}"
+    instructions = """You are an experienced biologist. You are provided with descriptions of animal interactions, each with a JSON string formally defining the players and possible actions of the game.
+        Your task is to define the most likely outcome of each game as observed in nature.
+        For you answer, use your knowledge, the given description and common sense.
+        "player(str)" refers to the name of the player, and "action(str)" refers to the action selected from the set of possible actions of that player.
+        Use precise player names and action labels from the JSON string defining the game.
+        """
+    schema = """{player(str): action(str), player(str): action(str)}"""
+    check = lambda i, outcome: isinstance(outcome, dict)
+    outcomes = get_batched(agent, instructions, schema, items, check, batch_size, stage="outcome")
+    for i, outcome in outcomes.items():
+        if outcome is not None:
+            category[i]["Outcome"] = outcome
+    return category
+
+
+def update_item(agent, item):
+    if item["Article"] != "Error" and "Game" in list(item.keys()):
+        if "Feedback" in list(item.keys()) and item["Feedback"] != "None":
+            description = (f"Background: {item['Article']}"
+                          f"\nInteraction of interest: {item['Description']}")
+            game = item["Game"]
+            outcome = item["Outcome"]
+            feedback = item["Feedback"]
+            game = improve_from_feedback(agent, description, game, outcome, feedback)
+            if game is not None:
+                item["Updated_Game"] = game
+    return item
+
+
 def update_category(agent, category):
     for i, item in enumerate(category):
         print("processing ", i+1)
-        if item["Article"] != "Error" and "Game" in list(item.keys()):
-            if "Feedback" in list(item.keys()) and item["Feedback"] != "None":
-                description = (f"Background: {item['Article']}"
-                              f"\nInteraction of interest: {item['Description']}")
-                game = item["Game"]
-                outcome = item["Outcome"]
-                feedback = item["Feedback"]
-                game = improve_from_feedback(agent, description, game, outcome, feedback)
-                if game is not None:
-                    category[i]["Updated_Game"] = game
+        with telemetry.context(case=i):
+            category[i] = update_item(agent, item)
+    return category
+
+
+async def update_category_concurrent(agent, category, max_concurrency=None):
+    # same as update_category, with as many cases in flight as the agent's quota allows
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    category[:] = await map_concurrent(lambda item: update_item(agent, item), category, max_concurrency)
     return category
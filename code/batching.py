@@ -0,0 +1,72 @@
+from cache import CacheMiss
+from structured import parse_json, JSON_CONFIG
+import telemetry
+
+
+def batch_prompt(instructions: str, schema: str, items: dict) -> str:
+    # one prompt carrying the shared instructions once and every item under its key
+    prompt = instructions
+    prompt += f"""
+        You are given several items at once, each marked with its key. Handle every item independently.
+        Return ONLY a JSON object mapping every item key to its result, where each result follows this schema:
+
+        {schema}
+
+        ```json
+        {{"key1": result, "key2": result, ...}}
+        ```
+        """
+    for key, text in items.items():
+        prompt += f"\n### Item {key}\n{text}\n"
+    return prompt
+
+
+def get_batched(agent, instructions: str, schema: str, items: dict, check=None, batch_size=5, max_retries=1, config=JSON_CONFIG, stage="batched") -> dict:
+    """
+    Sends items to the model batch_size at a time and splits the keyed JSON response back into per-item results.
+
+    Items whose result is missing or fails check are retried (only those) up to max_retries times.
+
+    Args:
+        agent: A Gemini model object.
+        instructions: Instructions shared by all items.
+        schema: Description of the JSON result expected for one item.
+        items: {key: item text}
+        check: callable(key, result) -> bool validating one result.
+        config: Generation config, JSON output by default.
+        stage: Name under which parse outcomes are counted.
+
+    Returns:
+        {key: result, or None if the item failed every attempt}
+    """
+    results = {key: None for key in items}
+    pending = list(items)
+    for attempt in range(max_retries + 1):
+        failed = []
+        for start in range(0, len(pending), batch_size):
+            keys = pending[start:start + batch_size]
+            prompt = batch_prompt(instructions, schema, {key: items[key] for key in keys})
+            try:
+                # calls and parses are attributed to the enclosing stage, or to this one
+                with telemetry.context(stage=telemetry.current_stage() or stage):
+                    response = agent.get_response(prompt, config)
+                    # parse
+                    response_json = parse_json(response, stage)
+                if not isinstance(response_json, dict):
+                    raise ValueError("batched response is not a JSON object")
+            except CacheMiss:
+                raise
+            except Exception as e:
+                print(f"Error during batched request: {e}")
+                response_json = {}
+            for key in keys:
+                result = response_json.get(str(key))
+                if result is not None and (check is None or check(key, result)):
+                    results[key] = result
+                else:
+                    failed.append(key)
+        if not failed:
+            break
+        print(f"{len(failed)} items failed, retrying" if attempt < max_retries else f"{len(failed)} items failed")
+        pending = failed
+    return results
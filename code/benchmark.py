@@ -0,0 +1,337 @@
+"""
+Benchmarks of the solving and validation pipeline on the games in data/*.json and on synthetic games.
+
+    python benchmark.py run --out baseline.json
+    python benchmark.py run --out current.json --baseline baseline.json
+    python benchmark.py compare baseline.json current.json
+
+Every measurement runs in its own process with a wall-clock budget, so a slow enumeration on a large game is
+recorded as timed out instead of stalling the run. Times are in seconds, peak memory in bytes (tracemalloc).
+"""
+import argparse
+import contextlib
+import copy
+import glob
+import io
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import nashpy as nash
+from equilibria import solve_pure_batch
+from evaluate import (validate_game_formal, create_nashpy_game, calaculate_nash_equilibria, run_algorithm,
+                      solve_category, get_stats_feedback)
+from game import Game
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+RANDOM_SIZES = [(2, 2), (3, 3), (4, 4), (5, 5)]
+DEGENERATE_SIZES = [(2, 2), (3, 3), (4, 4)]
+LARGE_SIZES = [(8, 8), (12, 12), (16, 16), (20, 20)]
+
+
+def nashpy_game(game_data):
+    return nash.Game(*Game.from_json(game_data).matrices())
+
+
+# path: (prepare, run). prepare builds the input of one timed call and is not timed itself.
+GAME_PATHS = {
+    "validate_game_formal": (lambda game_data: game_data, validate_game_formal),
+    "create_nashpy_game": (lambda game_data: game_data, create_nashpy_game),
+    "solve_pure_batch": (lambda game_data: [Game.from_json(game_data).matrices()], solve_pure_batch),
+    "support_enumeration": (nashpy_game, lambda game: run_algorithm(game, "Support")),
+    "vertex_enumeration": (nashpy_game, lambda game: run_algorithm(game, "Vertex")),
+    "lemke_howson_enumeration": (nashpy_game, lambda game: run_algorithm(game, "LemkeHawson")),
+    "calaculate_nash_equilibria": (lambda game_data: (game_data, nashpy_game(game_data)),
+                                   lambda args: calaculate_nash_equilibria(*args)),
+}
+CATEGORY_PATHS = {
+    "solve_category": (copy.deepcopy, solve_category),
+    "get_stats_feedback": (lambda category: solve_category(copy.deepcopy(category)), get_stats_feedback),
+}
+PATHS = {**GAME_PATHS, **CATEGORY_PATHS}
+
+
+def to_gamedef(A: np.ndarray, B: np.ndarray) -> list:
+    # a GameDef with generic names, as the autoformalization would produce it
+    rows = [f"r{i}" for i in range(A.shape[0])]
+    cols = [f"c{j}" for j in range(A.shape[1])]
+    return [{"name": "Row", "actions": rows,
+             "utilities": {r: {c: {"outcome": "", "utility": float(A[i, j])} for j, c in enumerate(cols)} for i, r in enumerate(rows)}},
+            {"name": "Column", "actions": cols,
+             "utilities": {c: {r: {"outcome": "", "utility": float(B[i, j])} for i, r in enumerate(rows)} for j, c in enumerate(cols)}}]
+
+
+def synthetic_games(seed: int = 0, count: int = 3, large: bool = True) -> dict:
+    """
+    Random games with integer utilities, degenerate games (utilities in {0, 1}, so best responses tie and
+    equilibria come in continua) and large random games.
+
+    Returns:
+        {case name: GameDef}
+    """
+    rng = np.random.default_rng(seed)
+    games = {}
+    for m, n in RANDOM_SIZES:
+        for k in range(count):
+            games[f"random/{m}x{n}#{k}"] = to_gamedef(rng.integers(-10, 11, (m, n)), rng.integers(-10, 11, (m, n)))
+    for m, n in DEGENERATE_SIZES:
+        for k in range(count):
+            games[f"degenerate/{m}x{n}#{k}"] = to_gamedef(rng.integers(0, 2, (m, n)), rng.integers(0, 2, (m, n)))
+    if large:
+        for m, n in LARGE_SIZES:
+            games[f"large/{m}x{n}"] = to_gamedef(rng.integers(-100, 101, (m, n)), rng.integers(-100, 101, (m, n)))
+    return games
+
+
+def real_games(data_dir: str = DATA_DIR) -> dict:
+    """
+    Every formally valid GameDef in the data files.
+
+    Returns:
+        {case name: GameDef}
+    """
+    games = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        with open(path) as f:
+            category = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+        # analysis files hold [validated set, analysis text]
+        items = [x for item in category for x in (item if isinstance(item, list) else [item]) if isinstance(x, dict)]
+        for i, item in enumerate(items):
+            # validated sets keep the GameDef itself under "Game"
+            records = item.get("Game") or []
+            if records and isinstance(records[0], dict) and "GameDef" not in records[0]:
+                records = [{"GameDef": records}]
+            for numpass, record in enumerate(records):
+                game_data = record.get("GameDef")
+                if game_data is not None and validate_game_formal(game_data)[0]:
+                    games[f"{name}#{i}/{numpass}"] = game_data
+    return games
+
+
+def real_categories(data_dir: str = DATA_DIR) -> dict:
+    # the data files holding cases (not validated sets), for the category-level paths
+    categories = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        with open(path) as f:
+            category = json.load(f)
+        if all(isinstance(item, dict) and "Article" in item for item in category):
+            categories[os.path.splitext(os.path.basename(path))[0]] = category
+    return categories
+
+
+def measure(path: str, payload, repeat: int = 3) -> dict:
+    """
+    Times repeat calls of one path on one input, then makes one more call under tracemalloc for peak memory,
+    so tracing does not inflate the times.
+    """
+    prepare, run = PATHS[path]
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        # nashpy warns about degenerate games, which the synthetic set has on purpose
+        warnings.simplefilter("ignore")
+        for _ in range(repeat):
+            args = prepare(payload)
+            start = time.perf_counter()
+            run(args)
+            times.append(time.perf_counter() - start)
+        args = prepare(payload)
+        tracemalloc.start()
+        try:
+            run(args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"Status": "ok", "Time": statistics.median(times), "Min": min(times), "Peak": peak}
+
+
+def _measure_worker(path, payload, repeat, connection):
+    try:
+        connection.send(measure(path, payload, repeat))
+    except Exception as e:
+        connection.send({"Status": "failed", "Error": f"{type(e).__name__}: {e}"})
+    connection.close()
+
+
+def measure_isolated(path: str, payload, repeat: int = 3, timeout: float = None) -> dict:
+    # measure in a separate process, killed after timeout seconds
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_measure_worker, args=(path, payload, repeat, sender), daemon=True)
+    process.start()
+    sender.close()
+    if multiprocessing.connection.wait([receiver], timeout=timeout):
+        try:
+            result = receiver.recv()
+        except EOFError:
+            result = {"Status": "failed", "Error": f"worker exited with code {process.exitcode}"}
+        process.join()
+    else:
+        process.terminate()
+        process.join()
+        result = {"Status": "timed out", "Timeout": timeout}
+    receiver.close()
+    return result
+
+
+def run_benchmarks(data_dir: str = DATA_DIR, synthetic: bool = True, large: bool = True, count: int = 3, seed: int = 0,
+                   repeat: int = 3, timeout: float = 10.0, paths=None, isolated: bool = True) -> dict:
+    """
+    Runs every path on every game (and the category paths on every data file).
+
+    Args:
+        paths: Names of the paths to run, all of PATHS by default.
+        isolated: Measure in worker processes with a timeout. Without it nothing can be interrupted,
+                  so large games are better left out.
+
+    Returns:
+        {"Meta": {...}, "Results": {case: {path: {"Status", "Time", "Min", "Peak"}}}}
+    """
+    paths = paths or list(PATHS)
+    cases = {}
+    for name, game_data in real_games(data_dir).items():
+        cases["data/" + name] = (game_data, [x for x in paths if x in GAME_PATHS])
+    if synthetic:
+        for name, game_data in synthetic_games(seed, count, large).items():
+            cases[name] = (game_data, [x for x in paths if x in GAME_PATHS])
+    for name, category in real_categories(data_dir).items():
+        cases["category/" + name] = (category, [x for x in paths if x in CATEGORY_PATHS])
+
+    results = {}
+    for case, (payload, case_paths) in cases.items():
+        results[case] = {}
+        for path in case_paths:
+            if isolated:
+                result = measure_isolated(path, payload, repeat, timeout)
+            else:
+                try:
+                    result = measure(path, payload, repeat)
+                except Exception as e:
+                    result = {"Status": "failed", "Error": f"{type(e).__name__}: {e}"}
+            results[case][path] = result
+            print(f"{case:40} {path:28} {format_result(result)}")
+    meta = {"Date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "Python": platform.python_version(),
+            "NumPy": np.__version__,
+            "Nashpy": getattr(nash, "__version__", "unknown"),
+            "Platform": platform.platform(),
+            "Processor": platform.processor(),
+            "Repeat": repeat,
+            "Timeout": timeout,
+            "Seed": seed}
+    return {"Meta": meta, "Results": results}
+
+
+def format_result(result: dict) -> str:
+    if result["Status"] != "ok":
+        return result["Status"]
+    return f"{result['Time'] * 1000:10.3f} ms {result['Peak'] / 1024:10.1f} KiB"
+
+
+def compare(baseline: dict, current: dict, threshold: float = 1.25, min_delta: float = 1e-3) -> list:
+    """
+    Flags measurements that got slower or heavier than the baseline.
+
+    A time counts as a slowdown when it grows by more than the threshold factor and by more than min_delta seconds,
+    so sub-millisecond jitter is ignored. Paths that ran in the baseline but time out or fail now are flagged too.
+
+    Returns:
+        A list of (case, path, description) for every regression.
+    """
+    regressions = []
+    for case, paths in current["Results"].items():
+        for path, new in paths.items():
+            old = baseline["Results"].get(case, {}).get(path)
+            if old is None:
+                continue
+            if old["Status"] == "ok" and new["Status"] != "ok":
+                regressions.append((case, path, f"was ok, now {new['Status']}"))
+            elif old["Status"] == "ok" and new["Status"] == "ok":
+                if new["Time"] > old["Time"] * threshold and new["Time"] - old["Time"] > min_delta:
+                    regressions.append((case, path, f"time {old['Time'] * 1000:.3f} ms -> {new['Time'] * 1000:.3f} ms "
+                                                    f"(x{new['Time'] / old['Time']:.2f})"))
+                if new["Peak"] > old["Peak"] * threshold and new["Peak"] - old["Peak"] > 64 * 1024:
+                    regressions.append((case, path, f"peak memory {old['Peak'] / 1024:.1f} KiB -> {new['Peak'] / 1024:.1f} KiB "
+                                                    f"(x{new['Peak'] / old['Peak']:.2f})"))
+    return regressions
+
+
+def summarize(results: dict) -> dict:
+    # total time and number of timeouts per path
+    summary = {}
+    for paths in results["Results"].values():
+        for path, result in paths.items():
+            entry = summary.setdefault(path, {"Cases": 0, "Total": 0.0, "Timed out": 0, "Failed": 0})
+            entry["Cases"] += 1
+            if result["Status"] == "ok":
+                entry["Total"] += result["Time"]
+            elif result["Status"] == "timed out":
+                entry["Timed out"] += 1
+            else:
+                entry["Failed"] += 1
+    return summary
+
+
+def report_regressions(regressions: list) -> int:
+    if not regressions:
+        print("No regressions.")
+        return 0
+    print(f"{len(regressions)} regressions:")
+    for case, path, description in regressions:
+        print(f"  {case:40} {path:28} {description}")
+    return 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the solving and validation pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks and save the results")
+    run.add_argument("--out", default="benchmark.json", help="where to save the results (JSON)")
+    run.add_argument("--data", default=DATA_DIR, help="directory of the category JSON files")
+    run.add_argument("--paths", nargs="*", choices=list(PATHS), help="paths to run, all by default")
+    run.add_argument("--repeat", type=int, default=3, help="timed calls per measurement")
+    run.add_argument("--timeout", type=float, default=10.0, help="budget per measurement in seconds")
+    run.add_argument("--count", type=int, default=3, help="synthetic games per size")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--no-synthetic", action="store_true", help="only replay the data files")
+    run.add_argument("--no-large", action="store_true", help="leave out the large synthetic games")
+    run.add_argument("--inline", action="store_true", help="measure in this process, without timeouts")
+    run.add_argument("--baseline", help="compare against these saved results after running")
+    run.add_argument("--threshold", type=float, default=1.25, help="slowdown factor flagged as a regression")
+
+    cmp = commands.add_parser("compare", help="compare saved results against a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=1.25, help="slowdown factor flagged as a regression")
+    cmp.add_argument("--min-delta", type=float, default=1e-3, help="ignore slowdowns smaller than this, in seconds")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_benchmarks(args.data, not args.no_synthetic, not args.no_large, args.count, args.seed,
+                                 args.repeat, args.timeout, args.paths, not args.inline)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=4)
+        for path, entry in summarize(results).items():
+            print(f"{path:28} {entry['Cases']:4} cases {entry['Total']:10.3f} s "
+                  f"{entry['Timed out']:3} timed out {entry['Failed']:3} failed")
+        if args.baseline:
+            with open(args.baseline) as f:
+                return report_regressions(compare(json.load(f), results, args.threshold))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return report_regressions(compare(baseline, current, args.threshold, args.min_delta))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
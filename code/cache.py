@@ -0,0 +1,102 @@
+import sqlite3
+import hashlib
+import threading
+import dataclasses
+import time
+import json
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+def _config_key(config):
+    if config is None or isinstance(config, dict):
+        return config
+    if dataclasses.is_dataclass(config):
+        return dataclasses.asdict(config)
+    return repr(config)
+
+
+class ResponseCache:
+    """
+    Persistent content-addressed cache of LLM responses, stored in SQLite.
+
+    Entries are keyed by a hash of model, prompt and generation config and evicted
+    least-recently-used first once the cache exceeds max_bytes, or once they are older than max_age seconds.
+    In replay_only mode a miss raises CacheMiss instead of letting the request through,
+    so a pipeline re-run is guaranteed to make no API calls.
+    """
+    def __init__(self, path="llm_cache.sqlite", max_bytes=None, max_age=None, replay_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY,
+                               model TEXT,
+                               response TEXT,
+                               size INTEGER,
+                               created REAL,
+                               accessed REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+        self.evict()
+
+    @staticmethod
+    def key(model, prompt, config=None):
+        content = json.dumps({"model": model, "prompt": prompt, "config": _config_key(config)},
+                             sort_keys=True, default=repr)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                if self.replay_only:
+                    raise CacheMiss(f"No cached response for {key} in replay-only mode")
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            return row[0]
+
+    def put(self, key, response, model=None):
+        with self.lock:
+            now = time.time()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, model, response, len(response.encode("utf-8")), now, now))
+            self.db.commit()
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            if self.max_age is not None:
+                self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_bytes is not None:
+                total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall() if total > self.max_bytes else []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"Hits": self.hits, "Misses": self.misses, "Entries": entries, "Bytes": size}
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,138 @@
+import numpy as np
+from scipy.optimize import linprog
+from typing import Dict, List, Tuple
+
+TOLERANCE = 1e-9
+
+
+def pure_dominated(M: np.ndarray) -> Dict[int, int]:
+    """
+    Finds the actions (rows of M, the player's own payoffs against each action of the other player)
+    strictly dominated by another pure action.
+
+    Returns:
+        {dominated row: a dominating row that is not itself dominated}
+    """
+    # better[i, j]: row j beats row i against every column
+    better = (M[None, :, :] > M[:, None, :] + TOLERANCE).all(axis=-1)
+    dominated = better.any(axis=1)
+    # strict dominance is transitive, so every dominated row is dominated by an undominated one
+    return {int(i): int(np.flatnonzero(better[i] & ~dominated)[0]) for i in np.flatnonzero(dominated)}
+
+
+def mixed_dominator(M: np.ndarray, i: int):
+    """
+    Looks for a mixture of the other rows of M that strictly dominates row i, with the linear program
+    max e s.t. sum_j p_j M[j, k] - M[i, k] >= e for every column k, sum_j p_j = 1, p >= 0.
+
+    Returns:
+        {row: probability} of a dominating mixture, or None if row i is not strictly dominated.
+    """
+    others = [j for j in range(M.shape[0]) if j != i]
+    if len(others) < 2:
+        return None
+    # variables: p over the other rows, then e
+    c = np.zeros(len(others) + 1)
+    c[-1] = -1
+    A_ub = np.hstack([-M[others].T, np.ones((M.shape[1], 1))])
+    b_ub = -M[i]
+    A_eq = np.hstack([np.ones((1, len(others))), np.zeros((1, 1))])
+    bounds = [(0, None)] * len(others) + [(None, None)]
+    result = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=[1], bounds=bounds, method="highs")
+    if not result.success or result.x[-1] <= TOLERANCE * max(1.0, float(np.abs(M).max())):
+        return None
+    return {others[j]: float(p) for j, p in enumerate(result.x[:-1]) if p > TOLERANCE}
+
+
+def iterated_dominance(A: np.ndarray, B: np.ndarray, mixed: bool = True) -> Tuple[List[int], List[int], List[dict]]:
+    """
+    Removes strictly dominated actions of a two-player game until none is left, by pure actions first
+    and, once no pure dominance remains, by mixtures (see mixed_dominator).
+
+    Strictly dominated actions are never played in any Nash equilibrium, so the reduced game has exactly the
+    equilibria of the original one, and the order of elimination does not matter.
+
+    Returns:
+        A tuple: (rows kept, columns kept, trace) where the trace lists
+                 {"Round", "Player": 0 or 1, "Action": index, "DominatedBy": {index: probability}, "Kind": "pure" or "mixed"}
+                 with indices of the original game.
+    """
+    kept = [list(range(A.shape[0])), list(range(A.shape[1]))]
+    trace = []
+    rounds = 0
+    while True:
+        rounds += 1
+        removed = False
+        for player in (0, 1):
+            # each player's own payoffs, with own actions as rows
+            M = A[np.ix_(kept[0], kept[1])] if player == 0 else B[np.ix_(kept[0], kept[1])].T
+            if M.shape[0] < 2:
+                continue
+            dominated = pure_dominated(M)
+            for i, j in dominated.items():
+                trace.append({"Round": rounds, "Player": player, "Action": kept[player][i],
+                              "DominatedBy": {kept[player][j]: 1.0}, "Kind": "pure"})
+            kept[player] = [a for k, a in enumerate(kept[player]) if k not in dominated]
+            removed |= bool(dominated)
+        if removed:
+            continue
+        if mixed:
+            for player in (0, 1):
+                M = A[np.ix_(kept[0], kept[1])] if player == 0 else B[np.ix_(kept[0], kept[1])].T
+                # with two actions left, a mixture dominates only if a pure action does
+                if M.shape[0] < 3:
+                    continue
+                for i in range(M.shape[0]):
+                    mixture = mixed_dominator(M, i)
+                    if mixture is not None:
+                        trace.append({"Round": rounds, "Player": player, "Action": kept[player][i],
+                                      "DominatedBy": {kept[player][j]: p for j, p in mixture.items()}, "Kind": "mixed"})
+                        # one at a time, then pure dominance again on the smaller game
+                        del kept[player][i]
+                        removed = True
+                        break
+                if removed:
+                    break
+        if not removed:
+            return kept[0], kept[1], trace
+
+
+def expand_equilibrium(equilibrium, rows: List[int], cols: List[int], shape: Tuple[int, int]):
+    # an equilibrium of the reduced game as one of the original game, with probability 0 on eliminated actions
+    x = np.zeros(shape[0])
+    y = np.zeros(shape[1])
+    x[rows] = equilibrium[0]
+    y[cols] = equilibrium[1]
+    return list(x), list(y)
+
+
+def label_trace(game, trace: List[dict]) -> List[dict]:
+    # the trace with player names and action labels of a Game
+    return [{"Round": step["Round"],
+             "Player": game.names[step["Player"]],
+             "Action": game.actions[step["Player"]][step["Action"]],
+             "DominatedBy": {game.actions[step["Player"]][a]: round(p, 2) for a, p in step["DominatedBy"].items()},
+             "Kind": step["Kind"]}
+            for step in trace]
+
+
+def trace_text(trace: List[dict], outcome: Dict[str, str] = None) -> str:
+    """
+    Feedback text from a labelled trace (see label_trace), pointing out the observed actions that were eliminated.
+    """
+    if not trace:
+        return ""
+    steps = []
+    for step in trace:
+        if step["Kind"] == "pure":
+            by = f"'{next(iter(step['DominatedBy']))}'"
+        else:
+            by = "a mix of " + " and ".join(f"'{a}' ({p})" for a, p in step["DominatedBy"].items())
+        steps.append(f"{step['Player']}'s action '{step['Action']}' is strictly dominated by {by}")
+    text = "Iterated elimination of strictly dominated actions: " + "; then ".join(steps) + ". "
+    if outcome:
+        observed = [step for step in trace if outcome.get(step["Player"]) == step["Action"]]
+        for step in observed:
+            text += (f"The observed action '{step['Action']}' of {step['Player']} is eliminated, so it cannot be part of any equilibrium: "
+                     f"its utilities must be higher relative to the alternatives for it to be chosen. ")
+    return text
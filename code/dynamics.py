@@ -0,0 +1,194 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from equilibria import stack_games
+from game import as_game
+
+DYNAMICS = ("replicator", "discrete", "logit", "best_response")
+
+
+def normalized_stack(matrices: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stacks games padded to a common size, with each player's utilities rescaled to [0, 1].
+
+    Rescaling is a positive affine transform, so it keeps the equilibria and the orbits of every dynamic
+    while making one step size fit all games.
+
+    Returns:
+        A tuple: (A, B, rows, cols) where rows (games, max m) and cols (games, max n) mark real actions
+                 and padded utilities are 0.
+    """
+    A, B, valid = stack_games(matrices)
+    rows = valid.any(axis=2)
+    cols = valid.any(axis=1)
+    scaled = []
+    for X in (A, B):
+        low = np.where(valid, X, np.inf).min(axis=(1, 2), keepdims=True)
+        high = np.where(valid, X, -np.inf).max(axis=(1, 2), keepdims=True)
+        spread = np.where(high > low, high - low, 1.0)
+        scaled.append(np.where(valid, (X - low) / spread, 0.0))
+    return scaled[0], scaled[1], rows, cols
+
+
+def initial_conditions(rows: np.ndarray, cols: np.ndarray, initial: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    # uniform draws from the simplex of each population (flat Dirichlet), zero on padded actions
+    x = rng.exponential(size=(rows.shape[0], initial, rows.shape[1])) * rows[:, None, :]
+    y = rng.exponential(size=(cols.shape[0], initial, cols.shape[1])) * cols[:, None, :]
+    return x / x.sum(axis=-1, keepdims=True), y / y.sum(axis=-1, keepdims=True)
+
+
+def best_response(fitness: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # uniform over the best replies, so ties do not favour the first action
+    fitness = np.where(valid[:, None, :], fitness, -np.inf)
+    best = fitness >= fitness.max(axis=-1, keepdims=True) - 1e-12
+    return best / best.sum(axis=-1, keepdims=True)
+
+
+def logit_response(fitness: np.ndarray, valid: np.ndarray, temperature: float) -> np.ndarray:
+    logits = np.where(valid[:, None, :], fitness / temperature, -np.inf)
+    weights = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+
+def regret(x: np.ndarray, fitness: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # gain from switching the whole population to its best action, 0 at a Nash equilibrium
+    return np.where(valid[:, None, :], fitness, -np.inf).max(axis=-1) - (x * fitness).sum(axis=-1)
+
+
+def step(x: np.ndarray, y: np.ndarray, A: np.ndarray, B: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+         dynamic: str, dt: float, temperature: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One update of both populations, for every game and initial condition at once.
+    x has shape (games, initial conditions, m) and y (games, initial conditions, n).
+    """
+    fx = np.einsum("gij,gkj->gki", A, y)
+    fy = np.einsum("gij,gki->gkj", B, x)
+    if dynamic == "replicator":
+        # Euler step of dx/dt = x (f - x.f)
+        x = x + dt * x * (fx - (x * fx).sum(axis=-1, keepdims=True))
+        y = y + dt * y * (fy - (y * fy).sum(axis=-1, keepdims=True))
+    elif dynamic == "discrete":
+        # x' = x (1 + f) / (1 + x.f), with background fitness 1 so fitness stays positive
+        x = x * (1 + fx) / (1 + (x * fx).sum(axis=-1, keepdims=True))
+        y = y * (1 + fy) / (1 + (y * fy).sum(axis=-1, keepdims=True))
+    elif dynamic == "logit":
+        x = x + dt * (logit_response(fx, rows, temperature) - x)
+        y = y + dt * (logit_response(fy, cols, temperature) - y)
+    elif dynamic == "best_response":
+        x = x + dt * (best_response(fx, rows) - x)
+        y = y + dt * (best_response(fy, cols) - y)
+    else:
+        raise ValueError(f"Unknown dynamic {dynamic}, expected one of {DYNAMICS}")
+    x = np.clip(x, 0.0, None)
+    y = np.clip(y, 0.0, None)
+    return x / x.sum(axis=-1, keepdims=True), y / y.sum(axis=-1, keepdims=True)
+
+
+def simulate(matrices: List[Tuple[np.ndarray, np.ndarray]], dynamic: str = "replicator", initial: int = 100, steps: int = 5000,
+             dt: float = 0.1, tol: float = 1e-7, regret_tol: float = 1e-3, temperature: float = 0.2, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Integrates a population dynamic for many games and many initial conditions in one array computation.
+
+    Each trajectory stops once no population share moves by more than tol in a step and, except for the logit dynamic
+    whose rest points are not equilibria, neither population can gain more than regret_tol by switching action.
+    The second condition keeps replicator orbits that slow down near the boundary (e.g. cycling around a mixed
+    equilibrium) from passing for converged. The whole run stops once every trajectory has converged or after steps updates.
+
+    Args:
+        matrices: A list of (row player payoffs, column player payoffs) pairs, e.g. nashpy's game.payoff_matrices.
+        dynamic: One of "replicator" (continuous), "discrete" (discrete-time replicator), "logit" or "best_response".
+        initial: Number of initial conditions per game, drawn uniformly from the simplices.
+        dt: Step size of the continuous dynamics, in units of the normalized payoff range.
+        temperature: Noise of the logit dynamic, in the same units. Low temperatures need a smaller dt to stay stable.
+
+    Returns:
+        A tuple: (x, y, converged) with the final states (games, initial, max m), (games, initial, max n)
+                 and a (games, initial) mask of the trajectories that converged.
+    """
+    if dynamic not in DYNAMICS:
+        raise ValueError(f"Unknown dynamic {dynamic}, expected one of {DYNAMICS}")
+    A, B, rows, cols = normalized_stack(matrices)
+    rng = np.random.default_rng(seed)
+    x, y = initial_conditions(rows, cols, initial, rng)
+    converged = np.zeros(x.shape[:2], dtype=bool)
+    for _ in range(steps):
+        new_x, new_y = step(x, y, A, B, rows, cols, dynamic, dt, temperature)
+        moved = np.maximum(np.abs(new_x - x).max(axis=-1), np.abs(new_y - y).max(axis=-1))
+        active = ~converged
+        x = np.where(active[..., None], new_x, x)
+        y = np.where(active[..., None], new_y, y)
+        still = moved < tol
+        if dynamic != "logit" and still.any():
+            fx = np.einsum("gij,gkj->gki", A, y)
+            fy = np.einsum("gij,gki->gkj", B, x)
+            still &= (regret(x, fx, rows) < regret_tol) & (regret(y, fy, cols) < regret_tol)
+        converged |= still
+        if converged.all():
+            break
+    return x, y, converged
+
+
+def basins(x: np.ndarray, y: np.ndarray, converged: np.ndarray, decimals: int = 2) -> List[List[dict]]:
+    """
+    Groups the converged end states of each game into attractors.
+
+    Returns:
+        One list per game of {"Row": shares, "Column": shares, "Basin": fraction of all initial conditions},
+        largest basin first.
+    """
+    results = []
+    for g in range(x.shape[0]):
+        found = {}
+        for k in np.flatnonzero(converged[g]):
+            key = tuple(np.round(x[g, k], decimals)) + tuple(np.round(y[g, k], decimals))
+            found[key] = found.get(key, 0) + 1
+        m = x.shape[-1]
+        attractors = [{"Row": np.array(key[:m]), "Column": np.array(key[m:]), "Basin": count / x.shape[1]}
+                      for key, count in found.items()]
+        results.append(sorted(attractors, key=lambda a: -a["Basin"]))
+    return results
+
+
+def describe(game, attractor: dict) -> Dict[str, Dict[str, float]]:
+    # {player: {action: share}} for the real actions of the game
+    shares = (attractor["Row"], attractor["Column"])
+    return {game.names[p]: {action: float(abs(shares[p][a])) for a, action in enumerate(game.actions[p])} for p in range(2)}
+
+
+def dynamics_category(category, dynamic="replicator", initial=100, steps=5000, dt=0.1, tol=1e-7, regret_tol=1e-3, temperature=0.2, seed=0):
+    """
+    Simulates a dynamic on every formally valid game of the category at once, and adds to each game
+    game["Dynamics"][dynamic] = {"Attractors": [{"Strategies", "Basin"}, ...], "Converged": fraction of trajectories,
+                                 "OutcomeAttractor": True if the observed outcome is a pure attractor,
+                                 "OutcomeBasin": fraction of initial conditions ending in it}
+    """
+    games = []
+    keys = []
+    for i, item in enumerate(category):
+        if "Game" not in list(item.keys()):
+            continue
+        for numpass, game in enumerate(item["Game"]):
+            if "Error" in list(game.keys()):
+                continue
+            try:
+                games.append(as_game(game["GameDef"]))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Error setting up game {i}: {e}")
+                continue
+            keys.append((i, numpass))
+    if len(games) == 0:
+        return category
+    x, y, converged = simulate([game.matrices() for game in games], dynamic, initial, steps, dt, tol, regret_tol, temperature, seed)
+    for (i, numpass), game, attractors, done in zip(keys, games, basins(x, y, converged), converged):
+        m, n = len(game.actions[0]), len(game.actions[1])
+        profile = game.profile(category[i].get("Outcome", {}))
+        outcome_basin = 0.0
+        if profile is not None:
+            outcome_basin = sum(a["Basin"] for a in attractors
+                                if a["Row"][profile[0]] == 1 and a["Column"][profile[1]] == 1)
+        report = {"Attractors": [{"Strategies": describe(game, {"Row": a["Row"][:m], "Column": a["Column"][:n]}),
+                                  "Basin": a["Basin"]} for a in attractors],
+                  "Converged": float(done.mean()),
+                  "OutcomeAttractor": outcome_basin > 0,
+                  "OutcomeBasin": outcome_basin}
+        category[i]["Game"][numpass].setdefault("Dynamics", {})[dynamic] = report
+    return category
@@ -0,0 +1,165 @@
+import numpy as np
+from typing import List, Tuple
+
+
+TOLERANCE = 1e-9
+
+
+def stack_games(matrices: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stacks two-player games of possibly different sizes into padded 3-D arrays.
+
+    Padded actions get utility -inf for the player choosing them, so they are never best responses.
+
+    Args:
+        matrices: A list of (row player payoffs, column player payoffs) pairs, each of shape (m, n).
+
+    Returns:
+        A tuple: (A, B, valid) of shape (games, max m, max n), where valid marks real action profiles.
+    """
+    rows = max(a.shape[0] for a, _ in matrices)
+    cols = max(a.shape[1] for a, _ in matrices)
+    A = np.full((len(matrices), rows, cols), -np.inf)
+    B = np.full((len(matrices), rows, cols), -np.inf)
+    valid = np.zeros((len(matrices), rows, cols), dtype=bool)
+    for k, (a, b) in enumerate(matrices):
+        A[k, :a.shape[0], :a.shape[1]] = a
+        B[k, :b.shape[0], :b.shape[1]] = b
+        valid[k, :a.shape[0], :a.shape[1]] = True
+    return A, B, valid
+
+
+def best_responses(A: np.ndarray, B: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Marks best responses for both players, broadcasting over any leading batch dimensions.
+
+    Returns:
+        A tuple: (row_best, col_best) boolean arrays shaped like A, where row_best[..., i, j] is True
+                 if row i is a best response to column j, and col_best[..., i, j] if column j is a best response to row i.
+    """
+    row_best = A >= A.max(axis=-2, keepdims=True) - TOLERANCE
+    col_best = B >= B.max(axis=-1, keepdims=True) - TOLERANCE
+    return row_best, col_best
+
+
+def pure_equilibria(A: np.ndarray, B: np.ndarray, valid: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds all pure Nash equilibria of one game or of a batch of stacked games.
+
+    Returns:
+        A tuple: (equilibria, strict) boolean arrays shaped like A.
+                 strict marks equilibria where both actions are unique best responses.
+    """
+    if valid is None:
+        valid = np.ones(A.shape, dtype=bool)
+    row_best, col_best = best_responses(A, B)
+    row_best &= valid
+    col_best &= valid
+    equilibria = row_best & col_best
+    unique_row = row_best.sum(axis=-2, keepdims=True) == 1
+    unique_col = col_best.sum(axis=-1, keepdims=True) == 1
+    strict = equilibria & unique_row & unique_col
+    return equilibria, strict
+
+
+def dominant_actions(A: np.ndarray, B: np.ndarray, valid: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds strictly dominant actions of both players.
+
+    Returns:
+        A tuple: (row action, column action) index arrays over the batch, -1 where the player has no strictly dominant action.
+    """
+    if valid is None:
+        valid = np.ones(A.shape, dtype=bool)
+    row_best, col_best = best_responses(A, B)
+    row_best &= valid
+    col_best &= valid
+    valid_cols = valid.any(axis=-2)
+    valid_rows = valid.any(axis=-1)
+
+    # a row is strictly dominant if it is the unique best response to every column
+    unique_row = (row_best.sum(axis=-2) == 1) | ~valid_cols
+    row_choice = np.where(valid_cols, row_best.argmax(axis=-2), -1)
+    first_row = row_choice[..., :1]
+    row_dominant = unique_row.all(axis=-1) & ((row_choice == first_row) | ~valid_cols).all(axis=-1)
+
+    unique_col = (col_best.sum(axis=-1) == 1) | ~valid_rows
+    col_choice = np.where(valid_rows, col_best.argmax(axis=-1), -1)
+    first_col = col_choice[..., :1]
+    col_dominant = unique_col.all(axis=-1) & ((col_choice == first_col) | ~valid_rows).all(axis=-1)
+
+    return np.where(row_dominant, first_row[..., 0], -1), np.where(col_dominant, first_col[..., 0], -1)
+
+
+def unique_equilibrium(A: np.ndarray, B: np.ndarray, valid: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Certifies games whose only Nash equilibrium (pure or mixed) is pure, without enumeration.
+
+    If a player has a strictly dominant action, every equilibrium uses it, so the game has a
+    single equilibrium whenever the other player's best response to it is unique.
+    In non-degenerate 2x2 games this covers every game with exactly one pure equilibrium.
+
+    Returns:
+        A tuple: (certified, row, col) over the batch; row and col give the equilibrium where certified.
+    """
+    if valid is None:
+        valid = np.ones(A.shape, dtype=bool)
+    row_dom, col_dom = dominant_actions(A, B, valid)
+    row_best, col_best = best_responses(A, B)
+    row_best &= valid
+    col_best &= valid
+
+    # column player's unique best response to the dominant row
+    col_at_dom = np.take_along_axis(col_best, np.maximum(row_dom, 0)[..., None, None], axis=-2)[..., 0, :]
+    col_reply_unique = col_at_dom.sum(axis=-1) == 1
+    col_reply = col_at_dom.argmax(axis=-1)
+    # row player's unique best response to the dominant column
+    row_at_dom = np.take_along_axis(row_best, np.maximum(col_dom, 0)[..., None, None], axis=-1)[..., 0]
+    row_reply_unique = row_at_dom.sum(axis=-1) == 1
+    row_reply = row_at_dom.argmax(axis=-1)
+
+    by_row = (row_dom >= 0) & col_reply_unique
+    by_col = (col_dom >= 0) & row_reply_unique
+    certified = by_row | by_col
+    row = np.where(by_row, row_dom, np.where(by_col, row_reply, -1))
+    col = np.where(by_row, col_reply, np.where(by_col, col_dom, -1))
+    return certified, row, col
+
+
+def outcome_is_equilibrium(A: np.ndarray, B: np.ndarray, rows, cols, strict=False, valid: np.ndarray = None) -> np.ndarray:
+    """
+    Checks whether the observed action profile of each game is a pure Nash equilibrium.
+
+    Args:
+        rows, cols: observed action indices, one per game (scalars for a single game).
+        strict: require a strict equilibrium.
+    """
+    equilibria, strict_equilibria = pure_equilibria(A, B, valid)
+    found = strict_equilibria if strict else equilibria
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    if found.ndim == 2:
+        return found[rows, cols]
+    return found[np.arange(found.shape[0]), rows, cols]
+
+
+def solve_pure_batch(matrices: List[Tuple[np.ndarray, np.ndarray]]) -> List[dict]:
+    """
+    Solves the pure equilibria of a whole list of games in one vectorized pass.
+
+    Returns:
+        One dict per game: {"Equilibria": [(row, col), ...], "Strict": [bool, ...], "Unique": bool}
+        where "Unique" means the pure equilibrium is certified to be the only equilibrium of the game.
+    """
+    if len(matrices) == 0:
+        return []
+    A, B, valid = stack_games(matrices)
+    equilibria, strict = pure_equilibria(A, B, valid)
+    certified, _, _ = unique_equilibrium(A, B, valid)
+    results = []
+    for k in range(len(matrices)):
+        profiles = np.argwhere(equilibria[k])
+        results.append({"Equilibria": [(int(i), int(j)) for i, j in profiles],
+                        "Strict": [bool(strict[k, i, j]) for i, j in profiles],
+                        "Unique": bool(certified[k])})
+    return results
@@ -1,7 +1,21 @@
 import json
+import os
+import time
+import multiprocessing
+import multiprocessing.connection
 import nashpy as nash
 import numpy as np
 from typing import Dict, Any, Tuple, List, Union
+from llm import map_concurrent
+from batching import get_batched
+from cache import CacheMiss
+from structured import parse_json, JSON_CONFIG
+from equilibria import solve_pure_batch
+from game import Game, as_game
+from repair import repair_game
+from nplayer import NGame, solve_n
+from dominance import iterated_dominance, expand_equilibrium, label_trace, trace_text
+import telemetry
 
 
 def validate_game_semantic(agent, description, game):
@@ -13,7 +27,7 @@ def validate_game_semantic(agent, description, game):
         Your task is to validate the *semantic* correctness of the formal game definition.
         For your answer, use the text description given, your background knowledge and common sense.
         When checking the validity of the game, make sure that the action definitions and the numeric utilities are biologically plausible for the respective species.
-        However, do not add any extra players. We wish to restrict ourselves to two-animal interactions only.
+        However, do not add any extra players: the players are the animals, or groups of animals acting together, that take part in the described interaction.
         Here are some examples of potential issues:
         1. Orders of preferences should make sense, e.g. a player being eaten by a predator should have the lowest utility for that player.
         2. The player actions defined should be mutually exclusive, i.e. the animal is not capable of choosing more than one of the actions in the given situation.
@@ -32,6 +46,8 @@ def validate_game_semantic(agent, description, game):
 
         return response
 
+    except CacheMiss:
+        raise
     except Exception as e:
         comment = f"Error during semantic validation: {e}"
         print(comment)
@@ -56,12 +72,13 @@ def update_game_comment(agent, game, comment):
             If the game is fine as is and requires no change, just return an empty list [].
             """
 
-            response = agent.get_response(prompt)
+            response = agent.get_response(prompt, JSON_CONFIG)
 
             # parse
-            response_json = response.split("```json")[-1].split("```")[0]
-            response_final = json.loads(response_json)
+            response_final = parse_json(response, "update_game_comment")
             break
+        except CacheMiss:
+            raise
         except Exception as e:
             comment = f"Error during semantic validation: {e}"
             game = response
@@ -70,43 +87,102 @@ def update_game_comment(agent, game, comment):
     return response_final
 
 
+def validate_item_semantic(agent, item, comment=None):
+    """
+    Semantically validates the latest game of a single case and replaces it if the model proposes a valid update.
+
+    Args:
+        comment: The semantic review of the game if already obtained (e.g. in a batch), requested here otherwise.
+
+    Returns:
+        A tuple: (updated item, True if the game was modified)
+    """
+    modified = False
+    if "Game" in list(item.keys()):
+        description = item["Description"]
+        game = json.dumps(item["Game"][-1]["GameDef"])
+        if comment is None:
+            comment = validate_game_semantic(agent, description, game)
+        if comment is not None and comment.lower() != "none":
+            newgame = update_game_comment(agent, game, comment)
+            if newgame is not None and newgame != []:
+                item["Game"][-1]["SemanticFeedback"] = comment
+                # make sure new game is valid, fixing mechanical defects locally first
+                newgame, valid, message, changes = repair_and_validate(newgame)
+                if valid is True:
+                    item["Game"][-1]["OldGame"] = item["Game"][-1]["GameDef"]
+                    item["Game"][-1]["GameDef"] = newgame
+                    print("game updated")
+                    modified = True
+                else:
+                    print("invalid game proposed: ", message)
+                    print("trying to fix...")
+                    newgame = update_game_comment(agent, newgame, message)
+                    if newgame is not None and newgame != []:
+                        newgame, valid, message, changes = repair_and_validate(newgame)
+                        if valid is True:
+                            item["Game"][-1]["OldGame"] = item["Game"][-1]["GameDef"]
+                            item["Game"][-1]["GameDef"] = newgame
+                            print("game updated")
+                            modified = True
+                        else:
+                            item["Game"][-1]["ProposedGame"] = newgame
+                            item["Game"][-1]["SemanticFeedback"] = f"New proposed game was not formally valid: {message}"
+    return item, modified
+
+
 def validate_category_semantic(agent, category):
     modifications = 0
     for i, item in enumerate(category):
         print("processing ", i+1)
-        if "Game" in list(item.keys()):
-            description = item["Description"]
-            game = json.dumps(item["Game"][-1]["GameDef"])
-            comment = validate_game_semantic(agent, description, game)
-            if comment is not None and comment.lower() != "none":
-                newgame = update_game_comment(agent, game, comment)
-                if newgame is not None and newgame != []:
-                    category[i]["Game"][-1]["SemanticFeedback"] = comment
-                    # make sure new game is valid
-                    valid, message = validate_game_formal(newgame)
-                    if valid is True:
-                        category[i]["Game"][-1]["OldGame"] = category[i]["Game"][-1]["GameDef"]
-                        category[i]["Game"][-1]["GameDef"] = newgame
-                        print("game updated")
-                        modifications += 1
-                    else:
-                        print("invalid game proposed: ", message)
-                        print("trying to fix...")
-                        newgame = update_game_comment(agent, newgame, message)
-                        if newgame is not None and newgame != []:
-                            valid, message = validate_game_formal(newgame)
-                            if valid is True:
-                                category[i]["Game"][-1]["OldGame"] = category[i]["Game"][-1]["GameDef"]
-                                category[i]["Game"][-1]["GameDef"] = newgame
-                                print("game updated")
-                                modifications += 1
-                            else:
-                                category[i]["Game"][-1]["ProposedGame"] = newgame
-                                category[i]["Game"][-1]["SemanticFeedback"] = f"New proposed game was not formally valid: {message}"
+        with telemetry.context(case=i):
+            category[i], modified = validate_item_semantic(agent, item)
+        modifications += modified
+    print("modifications: ", modifications)
+    return category
+
+
+def validate_category_semantic_batched(agent, category, batch_size=5):
+    """
+    Same as validate_category_semantic, with the semantic review of batch_size games packed into each request.
+    Games that need changes are then updated one at a time, as in validate_item_semantic.
+    """
+    items = {i: f"Interaction of interest: {item['Description']}\n\nGame definition: {json.dumps(item['Game'][-1]['GameDef'])}"
+             for i, item in enumerate(category) if "Game" in list(item.keys())}
+    instructions = """You are an experienced biologist. 
+        You are provided with textual descriptions of animal interactions, each with a JSON string defining a formal game that models this interaction.
+        Your task is to validate the *semantic* correctness of each formal game definition.
+        For your answer, use the text description given, your background knowledge and common sense.
+        When checking the validity of the game, make sure that the action definitions and the numeric utilities are biologically plausible for the respective species.
+        However, do not add any extra players: the players are the animals, or groups of animals acting together, that take part in the described interaction.
+        Here are some examples of potential issues:
+        1. Orders of preferences should make sense, e.g. a player being eaten by a predator should have the lowest utility for that player.
+        2. The player actions defined should be mutually exclusive, i.e. the animal is not capable of choosing more than one of the actions in the given situation.
+        3. The game is not trivial or degenerate, e.g. the animal is not indifferent to its choices. 
+        4. The game has high fidelity to the natural world, i.e. there are no made-up behaviors that don't exist in the description or in nature.
+        """
+    schema = """a string: a detailed comment on what to change and why, or "None" if the game is fine as is and requires no change."""
+    comments = get_batched(agent, instructions, schema, items, lambda i, comment: isinstance(comment, str), batch_size,
+                           stage="semantic")
+    modifications = 0
+    for i, comment in comments.items():
+        print("processing ", i+1)
+        category[i], modified = validate_item_semantic(agent, category[i], comment)
+        modifications += modified
     print("modifications: ", modifications)
     return category
 
 
+async def validate_category_semantic_concurrent(agent, category, max_concurrency=None):
+    # same as validate_category_semantic, with as many cases in flight as the agent's quota allows
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    results = await map_concurrent(lambda item: validate_item_semantic(agent, item), category, max_concurrency)
+    category[:] = [item for item, _ in results]
+    print("modifications: ", sum(modified for _, modified in results))
+    return category
+
+
 def validate_game_formal(game_data: list) -> Tuple[bool, str]:
     """
     Validates a game JSON object against the specified schema,
@@ -120,6 +196,9 @@ def validate_game_formal(game_data: list) -> Tuple[bool, str]:
         A tuple: (True, "Validation successful") if the JSON is valid,
                  or (False, error_message) if invalid.
     """
+    if isinstance(game_data, Game):
+        # a Game can only be built from a valid definition
+        return True, "Validation successful"
 
     # Check for the correct structure (players, actions, responses).
     if not isinstance(game_data, list):
@@ -128,12 +207,20 @@ def validate_game_formal(game_data: list) -> Tuple[bool, str]:
     if len(game_data) < 2:
         return False, "Invalid game data structure: two players required."
 
-    if len(game_data) > 2:
-        return False, "Only accepting 2 player games for now."
-
     for player in game_data:
         if not isinstance(player, dict):
-            return False, f"Invalid game data structure: Player '{player['name']}' has invalid structure, must be dict."
+            return False, f"Invalid game data structure: Player '{player}' has invalid structure, must be dict."
+        for key, kind in (("name", str), ("actions", list), ("utilities", dict)):
+            if not isinstance(player.get(key), kind):
+                return False, f"Invalid game data structure: Player '{player.get('name')}' must have '{key}' of type {kind.__name__}."
+
+    if len(game_data) > 2:
+        # utilities are nested one level per other player, see nplayer.NGame
+        try:
+            NGame.from_json(game_data)
+        except ValueError as e:
+            return False, str(e)
+        return True, "Validation successful"
 
     # Helper function to validate utility values
     def validate_utilities(actions: Dict[str, Any], player_name: str) -> Tuple[bool, str]:
@@ -145,7 +232,7 @@ def validate_game_formal(game_data: list) -> Tuple[bool, str]:
                 if not isinstance(utility, dict):
                     return False, f"Invalid response format: response '{response}' for {player_name} action '{action}' must be a dict"
 
-                if not isinstance(utility['utility'], int) and not isinstance(utility['utility'], float):
+                if not isinstance(utility.get('utility'), int) and not isinstance(utility.get('utility'), float):
                     return False, f"Invalid utility value: utility for {player_name} action '{action}' given response '{response}' must be numeric."
         return True, ""  # Success
 
@@ -158,6 +245,11 @@ def validate_game_formal(game_data: list) -> Tuple[bool, str]:
     # Check action/response consistency.
     responses = {}
     for player in game_data:
+        if not player['actions']:
+            return False, f"Player {player['name']} has no actions"
+        missing = [action for action in player['actions'] if action not in player['utilities']]
+        if missing:
+            return False, f"Player {player['name']} has no utilities for actions {missing}"
         all_responses = [list(player['utilities'][action].keys()) for action in player['actions']]
         if not all([all_responses[x] == all_responses[0] for x in range(len(all_responses))]):
             return False, f"Not all responses equivalent across actions for player {player['name']}"
@@ -167,62 +259,81 @@ def validate_game_formal(game_data: list) -> Tuple[bool, str]:
             if other_player['name'] != player['name']:
                 if not all([x in other_player['actions'] for x in responses[player['name']]]):
                     return False, f"Inconsistent actions and responses.  Player {player['name']}'s responses do not match the actions of {other_player['name']}.\nresponses{responses}\nactions:{other_player['actions']}"
+                uncovered = [x for x in other_player['actions'] if x not in responses[player['name']]]
+                if uncovered:
+                    return False, f"Missing responses. Player {player['name']} has no utilities given {other_player['name']}'s actions {uncovered}."
 
     return True, "Validation successful"
 
 
+def repair_and_validate(game_data) -> Tuple[Any, bool, str, List[str]]:
+    """
+    Formally validates a game, and if it is invalid, repairs its mechanical defects locally (see repair.repair_game)
+    so that only semantic defects are left for the model to fix.
+
+    Returns:
+        A tuple: (the game, or its repaired copy if that is valid, True if valid, validation message, [local changes made])
+        The message of an invalid game lists every defect the local repair could not fix.
+    """
+    valid, message = validate_game_formal(game_data)
+    if valid is True:
+        return game_data, valid, message, []
+    repaired, changes, remaining = repair_game(game_data)
+    if changes:
+        repaired_valid, repaired_message = validate_game_formal(repaired)
+        if repaired_valid is True:
+            print("repaired locally: ", changes)
+            return repaired, repaired_valid, repaired_message, changes
+    if remaining:
+        message += "\n" + "\n".join(remaining)
+    return game_data, valid, message, []
+
+
+def validate_item(item):
+    if "Game" in list(item.keys()):
+        for numpass in range(len(item["Game"])):
+            gamedef, valid, message, changes = repair_and_validate(item["Game"][numpass]["GameDef"])
+            if changes:
+                item["Game"][numpass]["GameDef"] = gamedef
+                item["Game"][numpass]["Repairs"] = changes
+            print(valid, message)
+            if valid is False:
+                item["Game"][numpass]["Error"] = message
+            elif valid is True and "Error" in list(item["Game"][numpass].keys()):
+                item["Game"][numpass].pop("Error")
+    else:
+        print("No game")
+    return item
+
+
 def validate_category(category):
     for i, item in enumerate(category):
         print("game ", i+1)
-        if "Game" in list(item.keys()):
-            for numpass in range(len(item["Game"])):
-                valid, message = validate_game_formal(item["Game"][numpass]["GameDef"])
-                print(valid, message)
-                if valid is False:
-                    category[i]["Game"][numpass]["Error"] = message
-                elif valid is True and "Error" in list(item["Game"][numpass].keys()):
-                    category[i]["Game"][numpass].pop("Error")
-        else:
-            print("No game in ", i)
+        category[i] = validate_item(item)
     return category
 
 
-def create_nashpy_game(game_data: dict) -> Tuple[Union[nash.Game, None], str]:
+def create_nashpy_game(game_data) -> Tuple[Union[nash.Game, None], str]:
     """
     Converts a game JSON object into a Nashpy game object.
 
     Args:
-        game_data: A JSON object representing the game state.
+        game_data: A JSON object representing the game state, or a Game built from it.
 
     Returns:
         A tuple: (nashpy.Game object, "Success") if successful,
                  or (None, error_message) if an error occurs.
     """
-
-    # Create utility matrices
-    utility_matrices: List[np.ndarray] = []
-    for player in game_data:
-        utilities = []
-        # Populate the utility matrix
-        for action in player["actions"]:
-            for other_player in game_data:
-                if player["name"] != other_player["name"]:
-                    utilities.append([player["utilities"][action][response]["utility"] for response in other_player["actions"]])
-
-        utility_matrix = np.array(utilities)
-        utility_matrices.append(utility_matrix)
-
-    # make sure it's a two player game
     try:
-        assert len(utility_matrices) ==2
-    except Exception as e:
-        "Error setting up utilities: not a two player game"
-
-    utility_matrices[1] = utility_matrices[1].transpose()
+        game_def = as_game(game_data)
+    except (ValueError, KeyError, TypeError) as e:
+        message = f"Error setting up utilities: {e}"
+        print(message)
+        return None, message
 
     # Create the Nashpy game object
     try:
-        game = nash.Game(*utility_matrices)
+        game = nash.Game(*game_def.matrices())
     except Exception as e:
         message = f"Error creating Nashpy game: {e}"
         print(message)
@@ -231,65 +342,281 @@ def create_nashpy_game(game_data: dict) -> Tuple[Union[nash.Game, None], str]:
     return game, "Success creating Nashpy game"
 
 
-def calaculate_nash_equilibria(json_def, game):
-    support = []
-    vertex = []
-    lemke_hawson = []
+def label_equilibrium(game_def, eq):
+    # map a pair of mixed strategies to {player: {action: probability}}
+    return {game_def.names[p]: {game_def.actions[p][x]: float(abs(round(eq[p][x], 2))) for x in range(len(eq[p]))} for p in range(2)}
+
+
+def equilibrium_key(eq):
+    # hashable form of an equilibrium at the precision it is reported with
+    return tuple(abs(round(x, 2)) for x in eq[0]) + tuple(abs(round(x, 2)) for x in eq[1])
+
+
+def calaculate_nash_equilibria(json_def, game, pure=None, cache=None, dominance=None):
+    """
+    Solves a game with nashpy's support, vertex and Lemke-Howson enumeration.
+
+    Games whose only equilibrium is certified pure by the vectorized best-response engine
+    skip the enumerations, which would all return that same equilibrium.
+    The others are enumerated after iterated elimination of strictly dominated actions (see run_reduced).
+
+    Args:
+        json_def: The game definition, as JSON or as a Game.
+        game: The nashpy game built from it.
+        pure: A result of equilibria.solve_pure_batch for this game, computed here if not given.
+        cache: An optional fingerprint.EquilibriumCache, so equivalent games are enumerated once.
+        dominance: A result of dominance.iterated_dominance for this game, computed here if not given.
+    """
+    start = time.time()
+    game_def = as_game(json_def)
+    size = "x".join(str(x) for x in game.payoff_matrices[0].shape)
+    if pure is None:
+        pure = solve_pure_batch([game.payoff_matrices])[0]
+    if pure["Unique"]:
+        row, col = pure["Equilibria"][0]
+        rows, cols = game.payoff_matrices[0].shape
+        eq = (np.eye(rows)[row], np.eye(cols)[col])
+        message = "Unique pure equilibrium certified by a dominant strategy. "
+        message += "1 equilibria found in Support. "
+        message += "1 equilibria found in Vertex. "
+        telemetry.record("solve", "solve", Path="certified", Size=size, Latency=time.time() - start)
+        return [label_equilibrium(game_def, eq)], [label_equilibrium(game_def, eq)], [label_equilibrium(game_def, eq)], message
+
+    results = cache.get(*game.payoff_matrices) if cache is not None else None
+    path = "cached"
+    if results is None:
+        path = "enumerated"
+        results = dict(run_reduced(game.payoff_matrices, dominance))
+        if cache is not None:
+            cache.put(*game.payoff_matrices, results)
+    telemetry.record("solve", "solve", Path=path, Size=size, Latency=time.time() - start,
+                     Failed=[algorithm for algorithm in ALGORITHMS if isinstance(results[algorithm], str)])
+    return merge_equilibria(game_def, results)
+
+
+ALGORITHMS = {"Support": "support_enumeration",
+              "Vertex": "vertex_enumeration",
+              "LemkeHawson": "lemke_howson_enumeration"}
+ALGORITHM_LABELS = {"Support": "Support", "Vertex": "Vertex", "LemkeHawson": "Lemke-Hawson"}
+
+
+def run_algorithm(game, algorithm):
+    # raw equilibria of one nashpy algorithm, as pairs of probability lists
+    return [(list(eq[0]), list(eq[1])) for eq in getattr(game, ALGORITHMS[algorithm])()]
+
+
+def run_reduced(payoff_matrices, dominance=None):
+    """
+    Runs the nashpy algorithms on the game left after iterated elimination of strictly dominated actions.
+    The eliminated actions are never played in an equilibrium, so the equilibria are those of the full game,
+    found in a smaller one.
+
+    Args:
+        payoff_matrices: The payoff matrices of the game.
+        dominance: A result of dominance.iterated_dominance for this game, computed here if not given.
+
+    Yields:
+        (algorithm, raw equilibria of the full game, or "failed"), as each algorithm finishes.
+    """
+    A, B = payoff_matrices
+    rows, cols, _ = dominance if dominance is not None else iterated_dominance(A, B)
+    if len(rows) == len(cols) == 1:
+        # one action left for each player: the only equilibrium
+        for algorithm in ALGORITHMS:
+            yield algorithm, [expand_equilibrium(([1.0], [1.0]), rows, cols, A.shape)]
+        return
+    # nashpy needs two actions per player, the other player is then indifferent and the full game degenerate
+    reduced = nash.Game(A[np.ix_(rows, cols)], B[np.ix_(rows, cols)]) if min(len(rows), len(cols)) > 1 else None
+    full = nash.Game(A, B)
+    for algorithm in ALGORITHMS:
+        equilibria = "failed"
+        if reduced is not None and len(rows) * len(cols) < A.size:
+            try:
+                equilibria = [expand_equilibrium(eq, rows, cols, A.shape) for eq in run_algorithm(reduced, algorithm)]
+            except Exception as e:
+                pass
+        # every game has an equilibrium, so none found means a degenerate reduced game lost them: enumerate the full one
+        if isinstance(equilibria, str) or not equilibria:
+            try:
+                equilibria = run_algorithm(full, algorithm)
+            except Exception as e:
+                equilibria = "failed"
+        yield algorithm, equilibria
+
+
+def merge_equilibria(json_def, results):
+    """
+    Labels and cross-checks the raw equilibria of the three algorithms.
+
+    Args:
+        json_def: The game definition, as JSON or as a Game.
+        results: {algorithm: list of raw equilibria, or "failed" / "timed out"}
+
+    Returns:
+        A tuple: (support, vertex, lemke_hawson, message)
+    """
+    game_def = as_game(json_def)
     message = ""
-    try:
-        for eq in game.support_enumeration():
-            support.append({json_def[0]["name"]: {json_def[0]["actions"][x]: abs(round(eq[0][x], 2)) for x in range(len(eq[0]))},
-                            json_def[1]["name"]: {json_def[1]["actions"][x]: abs(round(eq[1][x], 2)) for x in range(len(eq[1]))}})
-    except Exception as e:
-        message += "Support algorithm failed. "
-    try:
-        for eq in game.vertex_enumeration():
-            vertex.append({json_def[0]["name"]: {json_def[0]["actions"][x]: abs(round(eq[0][x], 2)) for x in range(len(eq[0]))},
-                           json_def[1]["name"]: {json_def[1]["actions"][x]: abs(round(eq[1][x], 2)) for x in range(len(eq[1]))}})
-    except Exception as e:
-        message += "Vertex algorithm failed. "
-    try:
-        for eq in game.lemke_howson_enumeration():
-            lemke_hawson.append({json_def[0]["name"]: {json_def[0]["actions"][x]: abs(round(eq[0][x], 2)) for x in range(len(eq[0]))},
-                                 json_def[1]["name"]: {json_def[1]["actions"][x]: abs(round(eq[1][x], 2)) for x in range(len(eq[1]))}})
-    except Exception as e:
-        message += "Lemke-Hawson algorithm failed. "
+    for algorithm in ALGORITHMS:
+        if isinstance(results[algorithm], str):
+            message += f"{ALGORITHM_LABELS[algorithm]} algorithm {results[algorithm]}. "
+    support, vertex, lemke_hawson = [results[algorithm] if not isinstance(results[algorithm], str) else [] for algorithm in ALGORITHMS]
 
     # prepare for comparisons
-    support_json = [json.dumps(x, sort_keys=True) for x in support]
-    vertex_json = [json.dumps(x, sort_keys=True) for x in vertex]
-    lemke_hawson_json = [json.dumps(x, sort_keys=True) for x in lemke_hawson]
-    lemke_hawson_json = list(set(lemke_hawson_json))
-    lemke_hawson = [json.loads(x) for x in lemke_hawson_json]
+    support_keys = set(equilibrium_key(x) for x in support)
+    vertex_keys = set(equilibrium_key(x) for x in vertex)
+    lemke_hawson = list({equilibrium_key(x): x for x in reversed(lemke_hawson)}.values())[::-1]
+    lemke_hawson_keys = set(equilibrium_key(x) for x in lemke_hawson)
 
-    try:
-        assert all([x in support_json for x in lemke_hawson_json])
-        assert all([x in vertex_json for x in lemke_hawson_json])
-    except Exception as e:
+    if not lemke_hawson_keys <= support_keys or not lemke_hawson_keys <= vertex_keys:
         message += "Equilibrium found in Lemke-Hawson that isn't in Support or Vertex. "
-    try:
-        assert all([x in support_json for x in vertex_json])
-        assert all([x in vertex_json for x in support_json])
-    except Exception as e:
+    if support_keys != vertex_keys:
         message += "Equilibria in Support and Vertex not equivalent. "
     message += f"{len(support)} equilibria found in Support. "
     message += f"{len(vertex)} equilibria found in Vertex. "
-    return support, vertex, lemke_hawson, message
+    return ([label_equilibrium(game_def, x) for x in support],
+            [label_equilibrium(game_def, x) for x in vertex],
+            [label_equilibrium(game_def, x) for x in lemke_hawson],
+            message)
+
 
+def _solve_worker(payoff_matrices, connection):
+    for algorithm, equilibria in run_reduced(payoff_matrices):
+        connection.send((algorithm, equilibria))
+    connection.close()
+
+
+def solve_parallel(games, workers=None, timeout=None):
+    """
+    Runs the nashpy algorithms for many games over a pool of worker processes.
+
+    Each game runs in its own process and gets a wall-clock budget of timeout seconds.
+    When the budget runs out the process is killed, and the algorithms that had not finished are recorded as timed out.
+
+    Args:
+        games: {key: nashpy game}
+        workers: Number of processes, defaults to the number of cores.
+        timeout: Budget per game in seconds, or None for no limit.
+
+    Returns:
+        {key: {algorithm: list of raw equilibria, or "failed" / "timed out"}}
+    """
+    workers = workers or os.cpu_count()
+    pending = list(games.items())
+    running = {}  # receiving end of the pipe -> (key, process, deadline)
+    started = {}
+    results = {key: {} for key in games}
+    while pending or running:
+        while pending and len(running) < workers:
+            key, game = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_solve_worker, args=(game.payoff_matrices, sender), daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (key, process, time.time() + timeout if timeout is not None else None)
+            started[key] = time.time()
+        deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+        wait_time = max(0, min(deadlines) - time.time()) if deadlines else None
+        for receiver in multiprocessing.connection.wait(list(running), timeout=wait_time):
+            key, process, _ = running[receiver]
+            try:
+                algorithm, equilibria = receiver.recv()
+                results[key][algorithm] = equilibria
+            except EOFError:
+                # worker is done, or crashed before reporting every algorithm
+                process.join()
+                del running[receiver]
+                for algorithm in ALGORITHMS:
+                    results[key].setdefault(algorithm, "failed")
+                telemetry.record("solve", "solve", case=key[0] if isinstance(key, tuple) else key, Path="parallel",
+                                 Size="x".join(str(x) for x in games[key].payoff_matrices[0].shape), Latency=time.time() - started[key],
+                                 Failed=[algorithm for algorithm in ALGORITHMS if isinstance(results[key][algorithm], str)])
+        now = time.time()
+        for receiver, (key, process, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                for algorithm in ALGORITHMS:
+                    results[key].setdefault(algorithm, "timed out")
+                telemetry.record("solve", "solve", case=key[0] if isinstance(key, tuple) else key, Path="parallel", Status="timed out",
+                                 Size="x".join(str(x) for x in games[key].payoff_matrices[0].shape), Latency=now - started[key])
+    return results
+
+
+def solve_category(category, workers=None, timeout=None, cache=None):
+    """
+    Solves every game of the category and checks whether the observed outcome is in its equilibria.
+
+    Args:
+        category: json list of cases.
+        workers, timeout: if either is given, games are solved in parallel worker processes
+                          with a wall-clock budget of timeout seconds each (see solve_parallel).
+        cache: An optional fingerprint.EquilibriumCache consulted before enumerating any game.
+    """
+    # build every game first, so the pure equilibria of the whole category are found in one vectorized pass
+    game_defs = {}
+    games = {}
+    n_games = {}  # games with more than two players, solved separately by solve_nplayer
+    for i, item in enumerate(category):
+        if "Game" in list(item.keys()):
+            for numpass in range(len(item["Game"])):
+                game_data = item["Game"][numpass].get("GameDef")
+                if "Error" not in list(item["Game"][numpass].keys()) and isinstance(game_data, list) and len(game_data) > 2:
+                    try:
+                        n_games[(i, numpass)] = NGame.from_json(game_data), "Success creating N-player game"
+                    except ValueError as e:
+                        n_games[(i, numpass)] = None, f"Error setting up utilities: {e}"
+                elif "Error" not in list(item["Game"][numpass].keys()):
+                    try:
+                        game_defs[(i, numpass)] = Game.from_json(item["Game"][numpass]["GameDef"])
+                    except (ValueError, KeyError, TypeError) as e:
+                        pass
+                    games[(i, numpass)] = create_nashpy_game(game_defs.get((i, numpass), item["Game"][numpass]["GameDef"]))
+    solvable = [key for key, (game_object, _) in games.items() if game_object is not None]
+    start = time.time()
+    pure = dict(zip(solvable, solve_pure_batch([game_defs[key].matrices() for key in solvable])))
+    telemetry.record("solve", "solve", Path="pure_batch", Games=len(solvable), Latency=time.time() - start)
+    solutions = {}
+    if workers is not None or timeout is not None:
+        raw = {}
+        for key in solvable:
+            if not pure[key]["Unique"] and cache is not None:
+                cached = cache.get(*games[key][0].payoff_matrices)
+                if cached is not None:
+                    raw[key] = cached
+        enumerate_keys = [key for key in solvable if not pure[key]["Unique"] and key not in raw]
+        raw.update(solve_parallel({key: games[key][0] for key in enumerate_keys}, workers, timeout))
+        for key in raw:
+            if cache is not None and key in enumerate_keys:
+                cache.put(*games[key][0].payoff_matrices, raw[key])
+            solutions[key] = merge_equilibria(game_defs[key], raw[key])
 
-def solve_category(category):
     for i, item in enumerate(category):
         print("game", i+1)
         if "Game" in list(item.keys()):
             for numpass in range(len(item["Game"])):
                 val = 0
-                if "Error" not in list(item["Game"][numpass].keys()):
-                    game_object, message = create_nashpy_game(item["Game"][numpass]["GameDef"])
+                if (i, numpass) in n_games:
+                    game_object, message = n_games[(i, numpass)]
+                    print(message)
+                    if game_object is None:
+                        category[i]["Game"][numpass]["Error"] = message
+                    else:
+                        with telemetry.context(case=i):
+                            val += solve_nplayer(category[i]["Game"][numpass], game_object, item.get("Outcome") or {})
+                elif "Error" not in list(item["Game"][numpass].keys()):
+                    game_object, message = games[(i, numpass)]
                     print(message)
                     if game_object is None:
-                        category[i]["Game"]["Error"] = message
+                        category[i]["Game"][numpass]["Error"] = message
                     elif game_object is not None:
-                        equilibria_sup, equilibria_vtx, equilibria_lh, message = calaculate_nash_equilibria(item["Game"][numpass]["GameDef"], game_object)
+                        if (i, numpass) in solutions:
+                            equilibria_sup, equilibria_vtx, equilibria_lh, message = solutions[(i, numpass)]
+                        else:
+                            with telemetry.context(case=i):
+                                equilibria_sup, equilibria_vtx, equilibria_lh, message = calaculate_nash_equilibria(game_defs[(i, numpass)], game_object, pure[(i, numpass)], cache)
                         category[i]["Game"][numpass]["Equilibria"] = {}
                         category[i]["Game"][numpass]["Equilibria"]["Support"] = equilibria_sup
                         category[i]["Game"][numpass]["Equilibria"]["Vertex"] = equilibria_vtx
@@ -299,20 +626,64 @@ def solve_category(category):
                         # Now check if outcome in equilibria
                         equivalent = False
                         print("checking if outcome in equilibrium")
-                        outcome = item["Outcome"]
+                        # a case whose outcome could not be formalized is never validated
+                        outcome = item.get("Outcome") or {}
                         eq = equilibria_sup
-                        players = [x["name"] for x in item["Game"][numpass]["GameDef"]]
+                        players = game_defs[(i, numpass)].names
                         if all([x in players for x in list(outcome.keys())]):
-                            # check if outcome in equilibria
-                            eqs = [{p: max(eq[x][p], key=eq[x][p].get) for p in players} for x in range(len(eq))]
-                            if all([outcome[x] in [best_response[x] for best_response in eqs] for x in players]):
+                            # a pure equilibrium matching the outcome settles it without looking at the mixed ones
+                            profile = game_defs[(i, numpass)].profile(outcome)
+                            if profile is not None and profile in pure[(i, numpass)]["Equilibria"]:
                                 equivalent = True
                                 val += 1
+                            else:
+                                # check if outcome in equilibria
+                                eqs = [{p: max(eq[x][p], key=eq[x][p].get) for p in players} for x in range(len(eq))]
+                                if all([outcome.get(x) in [best_response[x] for best_response in eqs] for x in players]):
+                                    equivalent = True
+                                    val += 1
+                        if not equivalent:
+                            # the elimination trace tells the feedback which observed actions no equilibrium can play
+                            trace = iterated_dominance(*game_object.payoff_matrices)[2]
+                            category[i]["Game"][numpass]["Equilibria"]["Dominance"] = label_trace(game_defs[(i, numpass)], trace)
                         category[i]["Game"][numpass]["Validated"] = equivalent
             print(f"Outcome found in equilibria in {val} games")
     return category
 
 
+def solve_nplayer(game_record, game, outcome):
+    """
+    Solves a game with more than two players (see nplayer.solve_n) into game_record, the same way solve_category does.
+    The mixed equilibria come from an iterative search that may miss some, so they are marked as not complete,
+    and Support and Vertex hold the same list.
+
+    Returns:
+        True if the observed outcome is in the equilibria.
+    """
+    start = time.time()
+    equilibria, pure, message = solve_n(game)
+    telemetry.record("solve", "solve", Path="nplayer", Size="x".join(str(len(x)) for x in game.actions), Latency=time.time() - start)
+    game_record["Equilibria"] = {"Support": equilibria, "Vertex": equilibria, "LemkeHawson": [], "Comments": message, "Complete": False}
+    print(message)
+    equivalent = False
+    print("checking if outcome in equilibrium")
+    players = game.names
+    if all([x in players for x in list(outcome.keys())]):
+        if game.profile(outcome) in pure:
+            equivalent = True
+        else:
+            eqs = [{p: max(eq[p], key=eq[p].get) for p in players} for eq in equilibria]
+            if all([outcome.get(x) in [best_response[x] for best_response in eqs] for x in players]):
+                equivalent = True
+    game_record["Validated"] = equivalent
+    return equivalent
+
+
+def solve_item(item, workers=None, timeout=None, cache=None):
+    # solve_category for a single case, for stages that stream cases one at a time
+    return solve_category([item], workers, timeout, cache)[0]
+
+
 def get_stats_feedback(category, numpass=0):
     total = 0
     failed_article = 0
@@ -345,7 +716,9 @@ def get_stats_feedback(category, numpass=0):
                         semantic_update += 1
                     if "Equilibria" in list(game.keys()) and "Validated" in list(game.keys()):
                         if game["Validated"] is True or game["Validated"] == "True":
-                            if (len(game["Equilibria"]["Support"]) % 2 == 0) or (len(game["Equilibria"]["Support"]) != len(game["Equilibria"]["Vertex"])):
+                            # the parity test needs every equilibrium, which the N-player search does not guarantee
+                            complete = game["Equilibria"].get("Complete", True)
+                            if (complete and len(game["Equilibria"]["Support"]) % 2 == 0) or (len(game["Equilibria"]["Support"]) != len(game["Equilibria"]["Vertex"])):
                                 degenerate += 1
                                 feedback += "The game might be degenerate. Check if one or both players are indifferent to their strategies. "
                             else:
@@ -359,6 +732,7 @@ def get_stats_feedback(category, numpass=0):
                         elif game["Validated"] is False or game["Validated"] == "False":
                             notineq += 1
                             feedback += "The naturally observed outcome of the interaction is not an equilibrium in the game! "
+                            feedback += trace_text(game["Equilibria"].get("Dominance", []), item.get("Outcome"))
 
                 if feedback == "":
                     feedback = "None"
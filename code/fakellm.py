@@ -0,0 +1,385 @@
+import ast
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from google.api_core.exceptions import ResourceExhausted
+from llm import RateLimiter
+from tokens import TokenEstimator
+import telemetry
+
+LATENCIES = ("fixed", "uniform", "exponential", "lognormal")
+MALFORMATIONS = ("prose", "trailing_comma", "truncated", "garbage")
+
+# prompt families, recognized by a phrase of their instructions (batched prompts first, their instructions repeat the others)
+FAMILIES = [("batched", "You are given several items at once"),
+            ("cases", "cases using the following JSON schema"),
+            ("snippet", "Extract the passages from the article"),
+            ("utilities", "Your task is to define the utilities"),
+            ("players_actions", "defining the players and their actions"),
+            ("outcome", "most likely outcome"),
+            ("semantic", "*semantic* correctness"),
+            ("update_game_comment", "Your task is to implement the comments"),
+            ("improve_from_feedback", "update the game configuration"),
+            ("study_design", "either a lab experiment or a field study"),
+            ("theoretical_analysis", "expert game theorist")]
+TEXT_FAMILIES = ("snippet", "semantic", "theoretical_analysis", "text")
+
+SPECIES = ["Lion", "Zebra", "Hawk", "Dove", "Cleaner Wrasse", "Grouper", "Meerkat", "Jackal", "Honeyguide", "Badger",
+           "Cuckoo", "Reed Warbler", "Ant", "Aphid", "Wolf", "Elk", "Oxpecker", "Buffalo", "Remora", "Shark"]
+ACTIONS = ["Attack", "Flee", "Hide", "Cooperate", "Defect", "Forage", "Guard", "Share", "Steal", "Wait",
+           "Display", "Retreat", "Follow", "Ignore", "Signal", "Approach"]
+WORDS = ["the", "animal", "predator", "prey", "forages", "near", "group", "risk", "food", "patch", "observed", "often",
+         "avoids", "when", "cost", "benefit", "territory", "mate", "signal", "season", "behavior", "individuals"]
+
+
+def _seed(*parts) -> int:
+    content = json.dumps(parts, sort_keys=True, default=repr)
+    return int.from_bytes(hashlib.sha256(content.encode("utf-8")).digest()[:8], "big")
+
+
+def detect_family(prompt: str, families=FAMILIES) -> str:
+    for family, phrase in families:
+        if phrase in prompt:
+            return family
+    return "text"
+
+
+def _value_after(text: str, marker: str):
+    """
+    Reads the first JSON (or Python literal) list or dict after marker in a prompt.
+
+    Returns:
+        The value, or None if there is none.
+    """
+    position = text.find(marker)
+    if position < 0:
+        return None
+    starts = [i for i in (text.find("[", position), text.find("{", position)) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    try:
+        return json.JSONDecoder().raw_decode(text[start:])[0]
+    except ValueError:
+        pass
+    # the prompts also embed Python reprs of games, e.g. a game passed back as a list
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] in "[{":
+            depth += 1
+        elif text[i] in "]}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    return ast.literal_eval(text[start:i + 1])
+                except (ValueError, SyntaxError):
+                    return None
+    return None
+
+
+def _players(value):
+    # the list of player definitions in a parsed game, also from case records holding {"GameDef": ...}
+    if isinstance(value, list) and value and all(isinstance(x, dict) for x in value):
+        if "GameDef" in value[-1]:
+            return _players(value[-1]["GameDef"])
+        if all("name" in x and isinstance(x.get("actions"), list) for x in value):
+            return value
+    return None
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def fake_cases(rng, count=10):
+    cases = []
+    for _ in range(count):
+        species = rng.sample(SPECIES, 2)
+        cases.append({"Species": species,
+                      "Description": f"{species[0]} and {species[1]} interaction. " + _sentence(rng, 30),
+                      "Query": f"{species[0]} {species[1]} behavior"})
+    return cases
+
+
+def fake_players_actions(rng):
+    return [{"name": name, "actions": rng.sample(ACTIONS, rng.randint(2, 3))} for name in rng.sample(SPECIES, 2)]
+
+
+def fake_utilities(rng, game, player):
+    # utilities of one player, nested by its own action and then by the actions of every other player in game order
+    others = [x for x in game if x["name"] != player]
+    own = next(x for x in game if x["name"] == player)
+
+    def nest(level, path):
+        if level == len(others):
+            return {"outcome": f"{player} plays {' against '.join(path)}", "utility": rng.randint(0, 10)}
+        return {action: nest(level + 1, path + [action]) for action in others[level]["actions"]}
+
+    return {action: nest(0, [action]) for action in own["actions"]}
+
+
+def fake_game(rng, game):
+    # a complete game for the given players and actions
+    return [{"name": x["name"], "actions": list(x["actions"]), "utilities": fake_utilities(rng, game, x["name"])} for x in game]
+
+
+def fake_outcome(rng, players_actions):
+    # the outcome prompts describe the game as [{player: [actions]}, ...]
+    outcome = {}
+    for player in players_actions or []:
+        if isinstance(player, dict):
+            for name, actions in player.items():
+                if isinstance(actions, list) and actions:
+                    outcome[name] = rng.choice(actions)
+    return outcome
+
+
+def fake_revision(rng, game):
+    # the game with one utility changed, or [] (no change needed) for a game that cannot be read
+    if game is None:
+        return []
+    game = json.loads(json.dumps(game))
+    player = rng.choice(game)
+    entry = player.get("utilities")
+    while isinstance(entry, dict) and "utility" not in entry and entry:
+        entry = entry[rng.choice(list(entry))]
+    if isinstance(entry, dict) and "utility" in entry:
+        entry["utility"] = rng.randint(0, 10)
+    return game
+
+
+def fake_study(rng):
+    study = {key: _sentence(rng) for key in ["Goal", "Hypothesis", "Method", "Instruments", "Data", "Ethics"]}
+    study["Type"] = rng.choice(["lab", "field"])
+    return study
+
+
+class FakeModel:
+    """
+    Offline stand-in for GeminiModel, for load testing the pipeline without a network, an API key or quota.
+
+    Responses are deterministic in the prompt, the generation config and the seed, and valid for the prompt family
+    (see FAMILIES): cases, article snippets, players and actions, utilities (for any number of players), outcomes,
+    semantic reviews, game updates, study designs, analyses and their batched versions.
+    Each request can be delayed, rejected with the 429 error of the real API or have its output malformed,
+    so throughput, retries and the tolerant parser are exercised as in production.
+
+    Args:
+        latency: Typical response latency in seconds (the mean, or the median for lognormal).
+        distribution: One of LATENCIES; uniform spans [0, 2 * latency], lognormal has median latency.
+        spread: Sigma of the lognormal distribution.
+        per_token: Extra latency per response token, as in streaming generation.
+        rate_limit: Probability that a request fails with ResourceExhausted.
+        malformed: Probability that a JSON response is malformed in one of the ways in malformations.
+        revise: Probability that a semantic review asks for changes instead of answering "None".
+        rpm, tpm, rpd: Limits of the local RateLimiter, so concurrency follows the same code path as the real client.
+        seed: Changes every response, error and latency draw.
+    """
+    def __init__(self, modeltype="fake", latency=0.0, distribution="lognormal", spread=0.5, per_token=0.0,
+                 rate_limit=0.0, malformed=0.0, malformations=MALFORMATIONS, revise=0.3,
+                 rpm=600, tpm=100000000, rpd=10000000, cache=None, estimator=None, seed=0):
+        if distribution not in LATENCIES:
+            raise ValueError(f"Unknown latency distribution {distribution}, expected one of {LATENCIES}")
+        self.modeltype = modeltype
+        self.latency = latency
+        self.distribution = distribution
+        self.spread = spread
+        self.per_token = per_token
+        self.rate_limit = rate_limit
+        self.malformed = malformed
+        self.malformations = tuple(malformations)
+        self.revise = revise
+        self.seed = seed
+        self.cache = cache  # optional ResponseCache
+        self.estimator = estimator if estimator is not None else TokenEstimator()
+        self.num_requests = 0
+        self.tokens_used = 0
+        self.rate_limited = 0
+        self.malformed_responses = 0
+        self.families = {}  # requests per prompt family
+        self.attempts = {}  # requests per prompt, so a retried prompt draws new errors and latency
+        self.lock = threading.Lock()
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rpd = rpd
+        self.limiter = RateLimiter(self.rpm, self.tpm, self.rpd)
+        print(f"{self.modeltype} model instantiated")
+
+    def sample_latency(self, rng, tokens=0):
+        if self.distribution == "fixed":
+            delay = self.latency
+        elif self.distribution == "uniform":
+            delay = rng.uniform(0, 2 * self.latency)
+        elif self.distribution == "exponential":
+            delay = rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        else:
+            delay = self.latency * rng.lognormvariate(0, self.spread)
+        return delay + self.per_token * tokens
+
+    def respond(self, prompt, config=None):
+        # the well-formed response to a prompt, with its family
+        rng = random.Random(_seed(self.seed, prompt, config))
+        family = detect_family(prompt)
+        if family == "batched":
+            sections = prompt.split("\n### Item ")
+            # the shared instructions name the family of every item
+            item_family = detect_family(sections[0], FAMILIES[1:])
+            results = {}
+            for section in sections[1:]:
+                key, _, text = section.partition("\n")
+                results[key.strip()] = self._result(item_family, text, random.Random(_seed(self.seed, text, config)), batched=True)
+            return json.dumps(results, indent=2), family
+        result = self._result(family, prompt, rng)
+        if family in TEXT_FAMILIES:
+            return result, family
+        text = json.dumps(result, indent=2)
+        if not (isinstance(config, dict) and config.get("response_mime_type") == "application/json"):
+            text = f"```json\n{text}\n```"
+        return text, family
+
+    def _result(self, family, text, rng, batched=False):
+        if family == "cases":
+            return fake_cases(rng)
+        if family == "snippet":
+            return " ".join(_sentence(rng, 20) for _ in range(rng.randint(3, 8)))
+        if family == "players_actions":
+            return fake_players_actions(rng)
+        if family == "utilities":
+            game = _players(_value_after(text, "Players and their possible actions:"))
+            if game is None:
+                return {}
+            if batched:
+                return {x["name"]: fake_utilities(rng, game, x["name"]) for x in game}
+            player = text.split("define the utilities of player:")[-1].split("\n")[0].strip()
+            if player not in [x["name"] for x in game]:
+                return {}
+            return fake_utilities(rng, game, player)
+        if family == "outcome":
+            return fake_outcome(rng, _value_after(text, "Formally defined players and actions:"))
+        if family == "semantic":
+            return _sentence(rng, 25) if rng.random() < self.revise else "None"
+        if family == "update_game_comment":
+            return fake_revision(rng, _players(_value_after(text, "Game description:")))
+        if family == "improve_from_feedback":
+            game = _players(_value_after(text, "Formally defined game:"))
+            return fake_revision(rng, game) if game is not None else fake_game(rng, fake_players_actions(rng))
+        if family == "study_design":
+            return fake_study(rng)
+        return "\n\n".join(_sentence(rng, 40) for _ in range(rng.randint(2, 5)))
+
+    def malform(self, text, rng):
+        kind = rng.choice(self.malformations)
+        if kind == "prose":
+            return f"Here is the requested JSON:\n```json\n{text}\n```\nLet me know if you need anything else."
+        if kind == "trailing_comma":
+            end = max(text.rfind("}"), text.rfind("]"))
+            return text[:end] + ",\n" + text[end:] if end > 0 else text
+        if kind == "truncated":
+            return text[:rng.randint(len(text) // 2, max(len(text) // 2, len(text) - 1))]
+        return "I am sorry, but I cannot provide a formal game for this interaction."
+
+    def _attempt(self, prompt):
+        # attempts at this prompt before this one
+        with self.lock:
+            attempt = self.attempts.get(prompt, 0)
+            self.attempts[prompt] = attempt + 1
+        return attempt
+
+    def _generate(self, prompt, config, attempt):
+        """
+        Draws the outcome of one attempt at a request.
+
+        Returns:
+            A tuple: (response text, latency in seconds)
+
+        Raises:
+            ResourceExhausted with probability rate_limit.
+        """
+        rng = random.Random(_seed(self.seed, prompt, config, attempt))
+        if rng.random() < self.rate_limit:
+            with self.lock:
+                self.rate_limited += 1
+            raise ResourceExhausted("Resource has been exhausted (e.g. check quota).")
+        text, family = self.respond(prompt, config)
+        with self.lock:
+            self.families[family] = self.families.get(family, 0) + 1
+        if family not in TEXT_FAMILIES and rng.random() < self.malformed:
+            text = self.malform(text, rng)
+            with self.lock:
+                self.malformed_responses += 1
+        return text, self.sample_latency(rng, self.estimator.count(text))
+
+    def _account_usage(self, prompt_tokens, text):
+        response_tokens = self.estimator.count(text)
+        self.limiter.add_tokens(response_tokens)
+        with self.lock:
+            self.tokens_used += prompt_tokens + response_tokens
+            self.num_requests += 1
+        return response_tokens
+
+    def get_response(self, prompt, config=None):
+        stage = telemetry.caller()
+        if self.cache is not None:
+            cache_key = self.cache.key(self.modeltype, prompt, config)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                telemetry.record("llm", stage, Model=self.modeltype, Cached=True)
+                return cached
+        prompt_tokens = self.estimator.count(prompt)
+        slept = self.limiter.acquire(prompt_tokens)
+        drawn = self._attempt(prompt)
+        # a pool's failovers count across its agents, this model only sees its own attempts
+        attempt = telemetry.current_attempt() or drawn + 1
+        start = time.time()
+        try:
+            response, delay = self._generate(prompt, config, drawn)
+        except ResourceExhausted as e:
+            telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, Latency=time.time() - start, Sleep=slept,
+                             Attempt=attempt, Error=repr(e))
+            raise
+        time.sleep(delay)
+        response_tokens = self._account_usage(prompt_tokens, response)
+        telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, ResponseTokens=response_tokens,
+                         Latency=time.time() - start, Sleep=slept, Attempt=attempt)
+        if self.cache is not None:
+            self.cache.put(cache_key, response, self.modeltype)
+        return response
+
+    async def aget_response(self, prompt, config=None):
+        stage = telemetry.caller()
+        if self.cache is not None:
+            cache_key = self.cache.key(self.modeltype, prompt, config)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                telemetry.record("llm", stage, Model=self.modeltype, Cached=True)
+                return cached
+        prompt_tokens = self.estimator.count(prompt)
+        slept = await self.limiter.aacquire(prompt_tokens)
+        drawn = self._attempt(prompt)
+        # a pool's failovers count across its agents, this model only sees its own attempts
+        attempt = telemetry.current_attempt() or drawn + 1
+        start = time.time()
+        try:
+            response, delay = self._generate(prompt, config, drawn)
+        except ResourceExhausted as e:
+            telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, Latency=time.time() - start, Sleep=slept,
+                             Attempt=attempt, Error=repr(e))
+            raise
+        await asyncio.sleep(delay)
+        response_tokens = self._account_usage(prompt_tokens, response)
+        telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, ResponseTokens=response_tokens,
+                         Latency=time.time() - start, Sleep=slept, Attempt=attempt)
+        if self.cache is not None:
+            self.cache.put(cache_key, response, self.modeltype)
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {"Requests": self.num_requests,
+                    "Tokens": self.tokens_used,
+                    "RateLimited": self.rate_limited,
+                    "Malformed": self.malformed_responses,
+                    "Families": dict(self.families)}
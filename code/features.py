@@ -0,0 +1,132 @@
+import numpy as np
+from typing import List, Optional
+from equilibria import stack_games, dominant_actions, TOLERANCE
+from dominance import iterated_dominance
+from game import Game
+
+# symmetric 2x2 games by the order of R (both play C), S (C against D), T (D against C) and P (both play D)
+NAMED_GAMES = {("T", "R", "P", "S"): "Prisoner's Dilemma",
+               ("T", "R", "S", "P"): "Chicken",
+               ("R", "T", "P", "S"): "Stag Hunt",
+               ("T", "P", "R", "S"): "Deadlock",
+               ("R", "T", "S", "P"): "Harmony"}
+
+
+def ordinal_ranks(payoffs: np.ndarray) -> np.ndarray:
+    # rank of each cell among the cells of its game, 1 for the lowest, tied cells sharing the lower rank
+    flat = payoffs.reshape(payoffs.shape[0], -1)
+    ranks = (flat[:, :, None] > flat[:, None, :] + TOLERANCE).sum(axis=-1) + 1
+    return ranks.reshape(payoffs.shape)
+
+
+def ordinal_class(row_ranks: np.ndarray, col_ranks: np.ndarray) -> str:
+    """
+    Robinson-Goforth class of a 2x2 game: the ordinal game up to swapping the rows or the columns,
+    written as the lowest of those four arrangements, cell by cell (row player's rank, column player's rank).
+    Strict ordinal games fall into 144 classes.
+    """
+    arrangements = []
+    for r in ((0, 1), (1, 0)):
+        for c in ((0, 1), (1, 0)):
+            a = row_ranks[np.ix_(r, c)]
+            b = col_ranks[np.ix_(r, c)]
+            arrangements.append(tuple((int(a[i, j]), int(b[i, j])) for i in range(2) for j in range(2)))
+    cells = min(arrangements)
+    return f"({cells[0][0]},{cells[0][1]}) ({cells[1][0]},{cells[1][1]}); ({cells[2][0]},{cells[2][1]}) ({cells[3][0]},{cells[3][1]})"
+
+
+def ordinal_name(row_ranks: np.ndarray, col_ranks: np.ndarray) -> Optional[str]:
+    # name of a strict symmetric 2x2 game (see NAMED_GAMES), trying either action as C
+    if len(set(row_ranks.flatten())) < 4 or not (row_ranks == col_ranks.T).all():
+        return None
+    for c in (0, 1):
+        d = 1 - c
+        values = {"R": row_ranks[c, c], "S": row_ranks[c, d], "T": row_ranks[d, c], "P": row_ranks[d, d]}
+        order = tuple(sorted(values, key=values.get, reverse=True))
+        if order in NAMED_GAMES:
+            return NAMED_GAMES[order]
+    return None
+
+
+def equilibrium_type(equilibrium: dict) -> str:
+    # "pure" if every player plays a single action, at the precision equilibria are reported with
+    return "pure" if all(max(strategy.values()) >= 1 - 0.01 for strategy in equilibrium.values()) else "mixed"
+
+
+def game_features(validated: List[dict]) -> List[dict]:
+    """
+    Game-theoretic features of the games collected by collect_validated_games, computed exactly from their payoffs.
+    The two-player games are stacked (see equilibria.stack_games) so each feature is computed for all of them at once.
+
+    Returns:
+        One dict per game, in the same order: {"Game_Num", "Players": {player: actions},
+        "Equilibrium": {player: action, or {action: probability} if mixed}, "EquilibriumType": "pure" or "mixed",
+        and for two-player games "ConstantSum", "ZeroSum", "Symmetric", "DominantActions": {player: action or None},
+        "DominatedActions": {player: actions eliminated by iterated strict dominance}, "DominanceSolvable",
+        "ParetoEfficient": no action profile is at least as good for both players and better for one,
+        and for 2x2 games "OrdinalClass" (see ordinal_class), "StrictOrdinal" and "NamedGame" (see NAMED_GAMES)}
+    """
+    features = []
+    two_player = []
+    for item in validated:
+        equilibrium = item["Equilibria"]["Support"][0]
+        feature = {"Game_Num": item["Game_Num"],
+                   "Players": {player["name"]: list(player["actions"]) for player in item["Game"]},
+                   "Equilibrium": {player: max(strategy, key=strategy.get) if equilibrium_type({player: strategy}) == "pure"
+                                   else {action: p for action, p in strategy.items() if p > 0}
+                                   for player, strategy in equilibrium.items()},
+                   "EquilibriumType": equilibrium_type(equilibrium)}
+        features.append(feature)
+        if len(item["Game"]) == 2:
+            two_player.append((feature, Game.from_json(item["Game"]), equilibrium))
+    if not two_player:
+        return features
+
+    games = [game for _, game, _ in two_player]
+    A, B, valid = stack_games([game.matrices() for game in games])
+    total = np.where(valid, A + B, np.nan)
+    spread = np.nanmax(total, axis=(1, 2)) - np.nanmin(total, axis=(1, 2))
+    constant_sum = spread <= TOLERANCE
+    zero_sum = constant_sum & (np.abs(np.nanmax(total, axis=(1, 2))) <= TOLERANCE)
+    square = np.array([len(game.actions[0]) == len(game.actions[1]) for game in games])
+    # compare A with the transpose of B on square padding, which holds every square game in the batch
+    size = max(A.shape[1:])
+    padding = ((0, 0), (0, size - A.shape[1]), (0, size - A.shape[2]))
+    square_A, square_B = np.pad(np.where(valid, A, 0), padding), np.pad(np.where(valid, B, 0), padding)
+    symmetric = square & (np.abs(square_A - square_B.transpose(0, 2, 1)) <= TOLERANCE).all(axis=(1, 2))
+    row_dominant, col_dominant = dominant_actions(A, B, valid)
+
+    # expected payoffs of the equilibrium against those of every action profile
+    x = np.zeros(A.shape[:2])
+    y = np.zeros((A.shape[0], A.shape[2]))
+    for k, (_, game, equilibrium) in enumerate(two_player):
+        x[k, :len(game.actions[0])] = [equilibrium[game.names[0]][action] for action in game.actions[0]]
+        y[k, :len(game.actions[1])] = [equilibrium[game.names[1]][action] for action in game.actions[1]]
+    filled_A = np.where(valid, A, 0)
+    filled_B = np.where(valid, B, 0)
+    value_A = np.einsum("ki,kij,kj->k", x, filled_A, y)[:, None, None]
+    value_B = np.einsum("ki,kij,kj->k", x, filled_B, y)[:, None, None]
+    better = valid & (A >= value_A - TOLERANCE) & (B >= value_B - TOLERANCE) & ((A > value_A + TOLERANCE) | (B > value_B + TOLERANCE))
+    pareto = ~better.any(axis=(1, 2))
+
+    small = {k: s for s, k in enumerate(k for k, game in enumerate(games) if len(game.actions[0]) == len(game.actions[1]) == 2)}
+    if small:
+        row_ranks = ordinal_ranks(A[list(small), :2, :2])
+        col_ranks = ordinal_ranks(B[list(small), :2, :2])
+    for k, (feature, game, _) in enumerate(two_player):
+        rows, cols, trace = iterated_dominance(*game.matrices())
+        feature.update({"ConstantSum": bool(constant_sum[k]),
+                        "ZeroSum": bool(zero_sum[k]),
+                        "Symmetric": bool(symmetric[k]),
+                        "DominantActions": {game.names[0]: game.actions[0][row_dominant[k]] if row_dominant[k] >= 0 else None,
+                                            game.names[1]: game.actions[1][col_dominant[k]] if col_dominant[k] >= 0 else None},
+                        "DominatedActions": {name: [game.actions[p][step["Action"]] for step in trace if step["Player"] == p]
+                                             for p, name in enumerate(game.names)},
+                        "DominanceSolvable": len(rows) == len(cols) == 1,
+                        "ParetoEfficient": bool(pareto[k])})
+        if k in small:
+            s = small[k]
+            feature.update({"OrdinalClass": ordinal_class(row_ranks[s], col_ranks[s]),
+                            "StrictOrdinal": len(set(row_ranks[s].flatten())) == len(set(col_ranks[s].flatten())) == 4,
+                            "NamedGame": ordinal_name(row_ranks[s], col_ranks[s])})
+    return features
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from urllib3.util.retry import Retry
+
+
+class WikiFetcher:
+    """
+    Pooled, retrying and caching HTTP layer for Wikipedia search and article retrieval.
+
+    A single requests.Session keeps connections alive across calls (up to max_connections per host).
+    Failed requests (connection errors, 429 and 5xx) are retried with exponential backoff; successful ones are not repeated.
+    Responses are cached on disk with their ETag / Last-Modified headers and revalidated with conditional requests,
+    or served straight from the cache when revalidate is False.
+    The API and wiki base URLs are parameters, so the fetcher can be pointed at a local stand-in server.
+    """
+    def __init__(self, cache_dir="wiki_cache", api_base="https://api.wikimedia.org/core/v1/wikipedia/",
+                 wiki_base="https://{language}.wikipedia.org/wiki/", max_connections=8, retries=3, backoff=1.0,
+                 timeout=30, revalidate=True, user_agent="***"):  # Replace with your app name and contact
+        self.cache_dir = cache_dir
+        self.api_base = api_base
+        self.wiki_base = wiki_base
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.revalidate = revalidate
+        self.requests_sent = 0
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": user_agent})
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET"], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _cache_path(self, url, params):
+        key = hashlib.sha256(json.dumps([url, params], sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, url, params=None):
+        """
+        GETs a URL through the cache.
+
+        Returns:
+            The response body as text.
+
+        Raises:
+            requests.exceptions.RequestException if the request fails after the retries.
+        """
+        cached = None
+        path = None
+        if self.cache_dir is not None:
+            path = self._cache_path(url, params)
+            if os.path.exists(path):
+                with open(path) as f:
+                    cached = json.load(f)
+                if not self.revalidate:
+                    return cached["Body"]
+        headers = {}
+        if cached is not None:
+            if cached.get("ETag"):
+                headers["If-None-Match"] = cached["ETag"]
+            if cached.get("LastModified"):
+                headers["If-Modified-Since"] = cached["LastModified"]
+        with self.lock:
+            self.requests_sent += 1
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            return cached["Body"]
+        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+        if path is not None and (response.headers.get("ETag") or response.headers.get("Last-Modified") or not self.revalidate):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"ETag": response.headers.get("ETag"), "LastModified": response.headers.get("Last-Modified"),
+                           "Body": response.text}, f)
+            os.replace(tmp_path, path)
+        return response.text
+
+    def search(self, query, language_code="en", limit=1):
+        url = self.api_base + language_code + "/search/page"
+        return json.loads(self.get(url, {"q": query, "limit": limit}))
+
+    def article_url(self, article_key, language_code="en"):
+        return self.wiki_base.format(language=language_code) + quote(article_key)  # Use quote for url encoding
+
+    def fetch_many(self, queries, language_code="en", max_workers=None):
+        """
+        Runs wikimedia_search for many queries with at most max_workers (default max_connections) in flight.
+
+        Returns:
+            {query: article text or error message}
+        """
+        from generate_cases import wikimedia_search
+        queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_connections) as executor:
+            articles = executor.map(lambda query: wikimedia_search(query, language_code, self), queries)
+            return dict(zip(queries, articles))
+
+
+_default_fetcher = None
+
+
+def default_fetcher():
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = WikiFetcher()
+    return _default_fetcher
@@ -0,0 +1,190 @@
+import hashlib
+import itertools
+import json
+import math
+import sqlite3
+import threading
+import numpy as np
+from typing import Tuple
+
+
+DECIMALS = 6
+MAX_PERMUTATIONS = 5040  # exact canonical form up to 7 actions on the smaller side
+
+
+def normalize_payoffs(utilities: np.ndarray) -> np.ndarray:
+    # rescale to [0, 1], which removes any positive affine transformation of a player's utilities
+    low, high = utilities.min(), utilities.max()
+    if high - low == 0:
+        return np.zeros(utilities.shape)
+    return np.round((utilities - low) / (high - low), DECIMALS) + 0.0
+
+
+def _ranks(signatures):
+    # rank of each signature among the distinct ones, in sorted order
+    index = {signature: k for k, signature in enumerate(sorted(set(signatures)))}
+    return [index[signature] for signature in signatures]
+
+
+def refine_ranks(payoffs: np.ndarray) -> Tuple[list, list]:
+    """
+    Ranks the rows and columns of a payoff array of shape (m, n, 2) by signatures that do not depend on action order.
+
+    A row starts with the sorted payoff pairs of its cells, and a column likewise. Each round then refines the ranks
+    with the sorted pairs labelled by the rank of the other player's action in that cell, until no more actions are
+    told apart. Actions ranked equally are not necessarily interchangeable.
+
+    Returns:
+        A tuple: (rank of each row, rank of each column), lower ranks sorting first.
+    """
+    rows, cols = payoffs.shape[:2]
+    cells = [[tuple(payoffs[i, j]) for j in range(cols)] for i in range(rows)]
+    row_ranks, col_ranks = [0] * rows, [0] * cols
+    for _ in range(rows + cols):
+        new_rows = _ranks([(row_ranks[i], tuple(sorted((cells[i][j], col_ranks[j]) for j in range(cols)))) for i in range(rows)])
+        new_cols = _ranks([(col_ranks[j], tuple(sorted((cells[i][j], row_ranks[i]) for i in range(rows)))) for j in range(cols)])
+        # each round only splits ranks, so an unchanged number of them is a fixed point
+        done = len(set(new_rows)) == len(set(row_ranks)) and len(set(new_cols)) == len(set(col_ranks))
+        row_ranks, col_ranks = new_rows, new_cols
+        if done:
+            break
+    return row_ranks, col_ranks
+
+
+def canonical_form(A: np.ndarray, B: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Brings a two-player game to a canonical form invariant to action order and to per-player positive affine transforms.
+
+    Both players' utilities are rescaled to [0, 1]. The actions of the player with fewer actions are tried in every order
+    (up to MAX_PERMUTATIONS), the other player's actions are sorted, and the lexicographically smallest layout is kept.
+    Larger games order their actions by permutation-invariant signatures (see refine_ranks), then break ties by
+    alternately sorting rows and columns until stable. That layout is invariant whenever the signatures tell every
+    action apart, as they do for games without repeated payoffs; games with actions the signatures cannot tell apart
+    may get a different layout for another action order, which costs a cache miss but never equates games
+    that are not equivalent.
+
+    Returns:
+        A tuple: (canonical payoffs of shape (m, n, 2), row order, column order), where the orders give
+                 the original index of each canonical action.
+    """
+    payoffs = np.stack([normalize_payoffs(np.asarray(A, dtype=float)), normalize_payoffs(np.asarray(B, dtype=float))], axis=-1)
+    transposed = payoffs.shape[0] > payoffs.shape[1]
+    if transposed:
+        payoffs = payoffs.transpose(1, 0, 2)
+    rows, cols = payoffs.shape[:2]
+
+    if math.factorial(rows) <= MAX_PERMUTATIONS:
+        perms = np.array(list(itertools.permutations(range(rows))))
+        permuted = payoffs[perms]  # (perms, rows, cols, 2)
+        # sort the columns of every row order, comparing column vectors lexicographically row by row
+        columns = permuted.transpose(0, 2, 1, 3).reshape(len(perms), cols, rows * 2)
+        col_orders = np.lexsort(columns.transpose(2, 0, 1)[::-1], axis=-1)
+        layouts = np.take_along_axis(columns, col_orders[..., None], axis=1).reshape(len(perms), -1)
+        best = np.lexsort(layouts.T[::-1])[0]
+        row_order, col_order = list(perms[best]), list(col_orders[best])
+    else:
+        row_ranks, col_ranks = refine_ranks(payoffs)
+        row_order = sorted(range(rows), key=lambda i: row_ranks[i])
+        col_order = sorted(range(cols), key=lambda j: col_ranks[j])
+        for _ in range(rows + cols):
+            permuted = payoffs[row_order][:, col_order]
+            new_rows = [row_order[i] for i in sorted(range(rows), key=lambda i: (row_ranks[row_order[i]], tuple(permuted[i].ravel())))]
+            permuted = payoffs[new_rows][:, col_order]
+            new_cols = [col_order[j] for j in sorted(range(cols), key=lambda j: (col_ranks[col_order[j]], tuple(permuted[:, j].ravel())))]
+            if new_rows == row_order and new_cols == col_order:
+                break
+            row_order, col_order = new_rows, new_cols
+
+    canonical = payoffs[row_order][:, col_order]
+    if transposed:
+        return canonical.transpose(1, 0, 2), np.array(col_order), np.array(row_order)
+    return canonical, np.array(row_order), np.array(col_order)
+
+
+def _hash_canonical(canonical: np.ndarray) -> str:
+    content = f"{canonical.shape[0]}x{canonical.shape[1]}:".encode("utf-8") + canonical.tobytes()
+    return hashlib.sha256(content).hexdigest()
+
+
+def game_fingerprint(A: np.ndarray, B: np.ndarray) -> str:
+    # stable hash shared by all games equivalent up to action order and positive affine utility transforms
+    canonical, _, _ = canonical_form(A, B)
+    return _hash_canonical(canonical)
+
+
+class EquilibriumCache:
+    """
+    Persistent cache of nashpy results keyed by the canonical game fingerprint.
+
+    Equilibria are stored in canonical action order and mapped back to the action order of the game being looked up,
+    so games equivalent up to relabeling or rescaling of utilities are solved once.
+    Results containing a timed out algorithm are not stored, since they depend on the time budget.
+    """
+    def __init__(self, path="equilibria_cache.sqlite"):
+        self.path = path
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # entries are cheap to recompute, so trade durability of the last writes for fast commits
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS equilibria (fingerprint TEXT PRIMARY KEY, results TEXT)")
+        self.db.commit()
+
+    @staticmethod
+    def _key(A, B):
+        canonical, row_order, col_order = canonical_form(A, B)
+        return _hash_canonical(canonical), row_order, col_order
+
+    def get(self, A, B):
+        """
+        Returns:
+            {algorithm: list of raw equilibria, or "failed"} in the action order of this game, or None on a miss.
+        """
+        fingerprint, row_order, col_order = self._key(A, B)
+        with self.lock:
+            stored = self.memory.get(fingerprint)
+            if stored is None:
+                row = self.db.execute("SELECT results FROM equilibria WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                if row is not None:
+                    stored = self.memory[fingerprint] = json.loads(row[0])
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        results = {}
+        for algorithm, equilibria in stored.items():
+            if isinstance(equilibria, str):
+                results[algorithm] = equilibria
+                continue
+            results[algorithm] = []
+            for sigma_row, sigma_col in equilibria:
+                original_row, original_col = np.zeros(len(row_order)), np.zeros(len(col_order))
+                original_row[row_order] = sigma_row
+                original_col[col_order] = sigma_col
+                results[algorithm].append((list(original_row), list(original_col)))
+        return results
+
+    def put(self, A, B, results):
+        if any(equilibria == "timed out" for equilibria in results.values()):
+            return
+        fingerprint, row_order, col_order = self._key(A, B)
+        stored = {}
+        for algorithm, equilibria in results.items():
+            if isinstance(equilibria, str):
+                stored[algorithm] = equilibria
+            else:
+                stored[algorithm] = [([float(sigma_row[i]) for i in row_order], [float(sigma_col[j]) for j in col_order])
+                                     for sigma_row, sigma_col in equilibria]
+        with self.lock:
+            self.memory[fingerprint] = stored
+            self.db.execute("INSERT OR REPLACE INTO equilibria VALUES (?, ?)", (fingerprint, json.dumps(stored)))
+            self.db.commit()
+
+    def stats(self):
+        return {"Hits": self.hits, "Misses": self.misses, "Entries": self.db.execute("SELECT COUNT(*) FROM equilibria").fetchone()[0]}
+
+    def close(self):
+        self.db.close()
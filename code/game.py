@@ -0,0 +1,134 @@
+import sys
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+class Game:
+    """
+    Compact two-player normal-form game, built once from a GameDef.
+
+    payoffs[p][i, j] is the utility of player p when the first player plays action i and the second plays action j,
+    so payoffs[0] and payoffs[1] are the row and column matrices expected by nashpy.
+    Outcome descriptions are interned strings in the same layout. The original key order, integer utilities and any
+    extra keys are kept, so to_json() reproduces the GameDef it was built from.
+    """
+    __slots__ = ("names", "actions", "player_index", "action_index", "payoffs", "outcomes",
+                 "integral", "utility_orders", "player_keys", "extras")
+
+    def __init__(self, names, actions, payoffs, outcomes=None, integral=None, utility_orders=None, player_keys=None, extras=None):
+        self.names = tuple(names)
+        self.actions = tuple(tuple(x) for x in actions)
+        self.player_index = {name: p for p, name in enumerate(self.names)}
+        self.action_index = tuple({action: i for i, action in enumerate(x)} for x in self.actions)
+        self.payoffs = np.asarray(payoffs, dtype=float)
+        shape = self.payoffs.shape[1:]
+        self.outcomes = outcomes if outcomes is not None else tuple(np.full(shape, "", dtype=object) for _ in self.names)
+        self.integral = integral if integral is not None else np.zeros(self.payoffs.shape, dtype=bool)
+        # per player: order of own actions and of responses as keys of the utilities dict
+        self.utility_orders = utility_orders if utility_orders is not None else tuple((tuple(range(len(x))), tuple(range(len(y))))
+                                                                                     for x, y in [self.actions, self.actions[::-1]])
+        self.player_keys = player_keys if player_keys is not None else tuple(("name", "actions", "utilities") for _ in self.names)
+        self.extras = extras if extras is not None else {}
+
+    @classmethod
+    def from_json(cls, game_data: List[dict]) -> "Game":
+        """
+        Builds a Game from the JSON definition [{"name", "actions", "utilities": {action: {response: {"outcome", "utility"}}}}, ...].
+
+        Raises:
+            ValueError if the definition is not a two-player game with a utility for every action profile.
+        """
+        if not isinstance(game_data, list) or len(game_data) != 2:
+            raise ValueError("Game definition must be a list of two players")
+        names = [player["name"] for player in game_data]
+        actions = [list(player["actions"]) for player in game_data]
+        shape = (len(actions[0]), len(actions[1]))
+        payoffs = np.zeros((2,) + shape)
+        integral = np.zeros((2,) + shape, dtype=bool)
+        outcomes = tuple(np.full(shape, "", dtype=object) for _ in range(2))
+        action_index = [{action: i for i, action in enumerate(x)} for x in actions]
+        utility_orders = []
+        player_keys = []
+        extras = {}
+        for p, player in enumerate(game_data):
+            other = 1 - p
+            player_keys.append(tuple(player.keys()))
+            for key in player.keys():
+                if key not in ("name", "actions", "utilities"):
+                    extras[(p, key)] = player[key]
+            utilities = player["utilities"]
+            try:
+                own_order = tuple(action_index[p][action] for action in utilities)
+                response_order = tuple(action_index[other][response] for response in next(iter(utilities.values())))
+            except (KeyError, StopIteration) as e:
+                raise ValueError(f"Utilities of {player['name']} do not match the actions of the game: {e}")
+            if sorted(own_order) != list(range(len(actions[p]))) or sorted(response_order) != list(range(len(actions[other]))):
+                raise ValueError(f"Utilities of {player['name']} do not cover every action profile")
+            utility_orders.append((own_order, response_order))
+            for action in actions[p]:
+                for response in actions[other]:
+                    try:
+                        entry = utilities[action][response]
+                    except KeyError:
+                        raise ValueError(f"Missing utility for {player['name']} action '{action}' given response '{response}'")
+                    value = entry["utility"]
+                    if not isinstance(value, (int, float)):
+                        raise ValueError(f"Utility for {player['name']} action '{action}' given response '{response}' must be numeric")
+                    profile = (action_index[p][action], action_index[other][response])[::1 if p == 0 else -1]
+                    payoffs[(p,) + profile] = value
+                    integral[(p,) + profile] = isinstance(value, int)
+                    outcomes[p][profile] = sys.intern(entry.get("outcome", ""))
+                    if list(entry.keys()) != ["outcome", "utility"]:
+                        extras[(p,) + profile] = {key: entry[key] for key in entry}
+        return cls(names, actions, payoffs, outcomes, integral, tuple(utility_orders), tuple(player_keys), extras)
+
+    def to_json(self) -> List[dict]:
+        game_data = []
+        for p in range(2):
+            other = 1 - p
+            own_order, response_order = self.utility_orders[p]
+            utilities = {}
+            for i in own_order:
+                utilities[self.actions[p][i]] = {}
+                for j in response_order:
+                    profile = (i, j) if p == 0 else (j, i)
+                    value = self.payoffs[(p,) + profile]
+                    value = int(value) if self.integral[(p,) + profile] else float(value)
+                    if (p,) + profile in self.extras:
+                        entry = dict(self.extras[(p,) + profile])
+                        entry["utility"] = value
+                        if "outcome" in entry:
+                            entry["outcome"] = self.outcomes[p][profile]
+                    else:
+                        entry = {"outcome": self.outcomes[p][profile], "utility": value}
+                    utilities[self.actions[p][i]][self.actions[other][j]] = entry
+            player = {}
+            for key in self.player_keys[p]:
+                if key == "name":
+                    player[key] = self.names[p]
+                elif key == "actions":
+                    player[key] = list(self.actions[p])
+                elif key == "utilities":
+                    player[key] = utilities
+                else:
+                    player[key] = self.extras[(p, key)]
+            game_data.append(player)
+        return game_data
+
+    def matrices(self) -> Tuple[np.ndarray, np.ndarray]:
+        # (row player payoffs, column player payoffs) as expected by nashpy
+        return self.payoffs[0], self.payoffs[1]
+
+    def profile(self, outcome: Dict[str, str]):
+        # action indices of an outcome {player: action}, or None if it does not name an action of each player
+        try:
+            return tuple(self.action_index[p][outcome[name]] for p, name in enumerate(self.names))
+        except (KeyError, TypeError):
+            return None
+
+    def __repr__(self):
+        return f"Game({self.names[0]} {len(self.actions[0])} x {self.names[1]} {len(self.actions[1])})"
+
+
+def as_game(game_data) -> Game:
+    return game_data if isinstance(game_data, Game) else Game.from_json(game_data)
@@ -1,7 +1,11 @@
 import requests
-from urllib.parse import quote  # Import for URL encoding
-import time
 import json
+from cache import CacheMiss
+from fetch import default_fetcher
+from passages import select_passages
+from structured import parse_json, CASES_CONFIG
+from llm import map_concurrent
+import telemetry
 
 
 def get_cases(agent, category):
@@ -12,7 +16,7 @@ def get_cases(agent, category):
         They may be in-species or inter-species interactions.
         Make sure that they are documented real-life cases with clearly observed and recorded behaviors.
         Also, make sure that the cases are interesting, in the sense that they present some non-trivial dilemma for the animals involved.
-        Restrict yourself to interaction between two animals only.
+        Prefer interactions between two animals, but an interaction among a few animals (or groups acting together) with distinct roles is welcome too.
         Finally, formulate a search query that will retrieve an article on the subject.
         """
         prompt += """
@@ -26,19 +30,20 @@ def get_cases(agent, category):
         Only provide the JSON in the precise schema, without any other text.
         """
 
-        response = agent.get_response(prompt)
+        response = agent.get_response(prompt, CASES_CONFIG)
 
         # parse
-        response_json = response.split("```json")[-1].split("```")[0]
-        response_json = json.loads(response_json)
+        response_json = parse_json(response, "cases")
         return response_json
 
+    except CacheMiss:
+        raise
     except Exception as e:
         print(f"Error during case generation: {e}")
         return None
 
 
-def wikimedia_search(query: str, language_code: str = 'en') -> str:
+def wikimedia_search(query: str, language_code: str = 'en', fetcher=None) -> str:
     """
     Searches Wikimedia for a given query and returns the full text of the most relevant article.
 
@@ -50,47 +55,24 @@ def wikimedia_search(query: str, language_code: str = 'en') -> str:
         query: The search query string.
         language_code: The language code for the Wikipedia search (e.g., 'en', 'fr', 'de').
                        Defaults to 'en' (English).
+        fetcher: The fetch.WikiFetcher to use (pooled session, retries and cache); defaults to a shared one.
 
     Returns:
         A string containing the full text of the Wikipedia article, or an error message
         if the search fails or no suitable article is found.
     """
+    fetcher = fetcher if fetcher is not None else default_fetcher()
     try:
         # 1. Search for the article
-        search_query = query  # Use the input query
-        number_of_results = 1
-        headers = {
-            'User-Agent': '***' # Replace with your app name and contact
-        }
-
-        base_url = 'https://api.wikimedia.org/core/v1/wikipedia/'
-        endpoint = '/search/page'
-        url = base_url + language_code + endpoint
-        parameters = {'q': search_query, 'limit': number_of_results}
-        search_response = requests.get(url, headers=headers, params=parameters)
-        search_response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        search_results = search_response.json()
+        search_results = fetcher.search(query, language_code)
 
         if not search_results['pages']:
             return "No results found for your search query."
 
         # 2. Get the article title (URL-friendly key)
         article_key = search_results['pages'][0]['key']
-        article_title = search_results['pages'][0]['title'] # get title
-        # 3. Construct the article URL
-        article_url = f"https://{language_code}.wikipedia.org/wiki/{quote(article_key)}" # Use quote for url encoding
-
-        # 4. Retrieve the article content using a different API endpoint, and handling potential errors.
-
-        article_response = requests.get(article_url, headers=headers)
-        article_response.raise_for_status()  # Raise HTTPError for bad responses
-        if article_response.status_code == 200:
-            article_text = article_response.text  # Get the full HTML content
-            return article_text
-
-        else:
-            print("Failed to retrieve article")
-            return f"Failed to retrieve the article: HTTP Status Code {article_response.status_code}"
+        # 3. Retrieve the article content (full HTML), retried by the fetcher only if the request fails
+        return fetcher.get(fetcher.article_url(article_key, language_code))
 
     except requests.exceptions.RequestException as e:
         return f"An error occurred during the API request: {e}"
@@ -100,33 +82,55 @@ def wikimedia_search(query: str, language_code: str = 'en') -> str:
         return f"An error occurred: {e}"
 
 
+def get_wiki_article(agent, item, article=None, token_budget=4000):
+    """
+    :param agent: Gemini model object
+    :param item: case with a wikipedia query
+    :param article: the article for the query if already fetched
+    :param token_budget: estimated tokens of article passages sent to the model
+    :return: the case with the article snippet embedded
+    """
+    if article is None:
+        article = wikimedia_search(item["Query"])
+    if article.startswith("No results") or article.startswith("An error"):
+        print(article)
+        snippet = "Error"
+    else:
+        # rank the article's passages locally and send only the most relevant ones
+        query = item["Description"] + " " + " ".join(item.get("Species", []))
+        passages = select_passages(article, query, token_budget, estimator=getattr(agent, "estimator", None))
+        if not passages:
+            print("No passages in article")
+            snippet = "Error"
+        else:
+            snippet = agent.get_response(f"We are interested in the following phenomenon: {item['Description']}. "
+                                         f"\nYou are provided with passages from a wikipedia article. "
+                                         f"\nExtract the passages from the article that are relevant to the phenomenon of interest. "
+                                         f"\nWikipedia article passages: {passages}"
+                                         f"\nProvide just the plain text of the relevant passages.")
+    item["Article"] = snippet
+    return item
+
+
 def get_wiki_articles(agent, category):
     """
     :param agent: Gemini model object
     :param category: json list of items with wikipedia queries
     :return: updated json list with the article snippets embedded
     """
+    # fetch all articles concurrently first, then extract the snippets
+    articles = default_fetcher().fetch_many([item["Query"] for item in category])
     for i, item in enumerate(category):
         print("Querying item ", i)
-        for trial in range(3):
-            article = wikimedia_search(item["Query"])
-            if article.startswith("No results") or article.startswith("An error"):
-                print(article)
-                error = True
-                break
-            else:
-                error = False
-                time.sleep(3)
-        if error is False:
-            snippet = agent.get_response(f"We are interested in the following phenomenon: {item['Description']}. "
-                                         f"\nYou are provided with a wikipedia article in HTML format. "
-                                         f"\nExtract the passages from the article that are relevant to the phenomenon of interest. "
-                                         f"\nWikipedia article: {article}"
-                                         f"\nProvide just the plain text of the relevant passages *without* HTML formatting.")
-        elif error is True:
-            snippet = "Error"
-        category[i]["Article"] = snippet
+        with telemetry.context(case=i):
+            category[i] = get_wiki_article(agent, item, articles[item["Query"]])
     return category
 
 
-
+async def get_wiki_articles_concurrent(agent, category, max_concurrency=None):
+    # same as get_wiki_articles, with as many cases in flight as the agent's quota allows
+    if max_concurrency is None:
+        max_concurrency = getattr(agent, "rpm", 10)
+    articles = default_fetcher().fetch_many([item["Query"] for item in category])
+    category[:] = await map_concurrent(lambda item: get_wiki_article(agent, item, articles[item["Query"]]), category, max_concurrency)
+    return category
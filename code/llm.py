@@ -1,17 +1,153 @@
 #from google import genai
 import google.generativeai as genai  # using the deprecated sdk
+import google.generativeai.client as genai_client
+import asyncio
+import contextvars
+import threading
 import time
 import os
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from tokens import TokenEstimator
+import telemetry
+
+
+# the sdk keeps a single global key; clients of their own per key go through its client manager,
+# whose interface is only known for the last release of the deprecated sdk, 0.8
+PER_KEY_CLIENTS = genai.__version__.startswith("0.8.") and hasattr(genai_client, "_ClientManager")
+GLOBAL_KEYS = set()  # keys configured globally when per-key clients are not available
+
+# free tier limits: (requests per minute, tokens per minute, requests per day)
+LIMITS = {"gemini-2.5-flash": (10, 250000, 250),
+          "gemini-2.5-pro": (5, 250000, 100)}
+
+
+class DailyLimitReached(Exception):
+    pass
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter tracking requests per minute, tokens per minute and requests per day together.
+    Reservations are made under a lock and return the time the caller still has to wait,
+    so the same limiter serves the blocking and the asyncio clients (and threads sharing one agent).
+    """
+    def __init__(self, rpm, tpm, rpd):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rpd = rpd
+        self.requests = deque()  # timestamps of requests in the last minute
+        self.tokens = deque()  # (timestamp, tokens) in the last minute
+        self.daily = deque()  # timestamps of requests in the last day
+        self.lock = threading.Lock()
+
+    def _prune(self, now):
+        while self.requests and now - self.requests[0] >= 60:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= 60:
+            self.tokens.popleft()
+        while self.daily and now - self.daily[0] >= 86400:
+            self.daily.popleft()
+
+    def tokens_in_window(self):
+        return sum(n for _, n in self.tokens)
+
+    def _wait(self, now, tokens):
+        wait = 0
+        if len(self.requests) >= self.rpm:
+            wait = max(wait, self.requests[0] + 60 - now)
+        # a single request larger than the whole budget only waits for an empty window
+        excess = self.tokens_in_window() + min(tokens, self.tpm) - self.tpm
+        if excess > 0:
+            for t, n in self.tokens:
+                excess -= n
+                if excess <= 0:
+                    wait = max(wait, t + 60 - now)
+                    break
+        return wait
+
+    def wait_time(self, tokens=0):
+        # seconds a request would wait now, without reserving it (inf once the daily limit is reached)
+        with self.lock:
+            now = time.time()
+            self._prune(now)
+            if len(self.daily) >= self.rpd:
+                return float("inf")
+            return self._wait(now, tokens)
+
+    def remaining_daily(self):
+        with self.lock:
+            self._prune(time.time())
+            return self.rpd - len(self.daily)
+
+    def restore(self, timestamps):
+        # requests made before this limiter existed (e.g. by an earlier run), counted against the daily limit
+        with self.lock:
+            self.daily = deque(sorted(set(self.daily) | set(timestamps)))
+            self._prune(time.time())
+
+    def reserve(self, tokens=0):
+        """
+        Try to reserve one request carrying the given number of tokens.
+
+        Returns:
+            0 if the request was recorded and may be sent now,
+            otherwise the number of seconds to wait before trying again.
+        """
+        with self.lock:
+            now = time.time()
+            self._prune(now)
+            if len(self.daily) >= self.rpd:
+                raise DailyLimitReached(f"Daily limit of {self.rpd} requests reached")
+            wait = self._wait(now, tokens)
+            if wait > 0:
+                return wait
+            self.requests.append(now)
+            self.daily.append(now)
+            if tokens:
+                self.tokens.append((now, tokens))
+            return 0
+
+    def add_tokens(self, tokens):
+        # account for tokens known only after the request was made (e.g. the response)
+        with self.lock:
+            self.tokens.append((time.time(), tokens))
+
+    def acquire(self, tokens=0):
+        slept = 0
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                return slept
+            time.sleep(wait)
+            slept += wait
+
+    async def aacquire(self, tokens=0):
+        slept = 0
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                return slept
+            await asyncio.sleep(wait)
+            slept += wait
 
 
 class GeminiModel:
-    def __init__(self, modeltype, key, func=None):
+    """
+    Args:
+        modeltype: Gemini model name.
+        key: Name of the environment variable holding the API key.
+        limits: (rpm, tpm, rpd) of the key's tier, the free tier limits of LIMITS by default.
+    """
+    def __init__(self, modeltype, key, func=None, cache=None, estimator=None, limits=None):
         self.modeltype = modeltype
         self.key = key
+        self.cache = cache  # optional ResponseCache
+        self.estimator = estimator if estimator is not None else TokenEstimator()
         self.num_requests = 0
         self.tokens_used = 0
-        self.last_time = time.time()
+        self.lock = threading.Lock()  # the counters are shared by the threads and tasks using this model
         self.safety_config = {"HARM_CATEGORY_HARASSMENT": "block_none",
                               "HARM_CATEGORY_DANGEROUS": "block_none",
                               "HARM_CATEGORY_HATE_SPEECH": "block_none",
@@ -19,40 +155,121 @@ class GeminiModel:
         GOOGLE_API_KEY = os.environ.get(self.key)
         genai.configure(api_key=GOOGLE_API_KEY)
         self.model = genai.GenerativeModel(self.modeltype, safety_settings=self.safety_config) 
-        # free tier limits
-        if self.modeltype == "gemini-2.5-flash":
-            self.rpm = 10
-            self.tpm = 250000
-            self.rpd = 250
-        elif self.modeltype == "gemini-2.5-pro":
-            self.rpm = 5
-            self.tpm = 250000
-            self.rpd = 100
+        if PER_KEY_CLIENTS:
+            # give this model clients of its own, so agents with different keys can coexist
+            self.clients = genai_client._ClientManager()
+            self.clients.configure(api_key=GOOGLE_API_KEY)
+            self.model._client = self.clients.make_client("generative")
+        else:
+            # every model shares the global key, which is only safe while there is a single one
+            self.clients = None
+            GLOBAL_KEYS.add(GOOGLE_API_KEY)
+            if len(GLOBAL_KEYS) > 1:
+                raise RuntimeError(f"google-generativeai {genai.__version__} supports a single API key per process, pin it to 0.8 to use several")
+        if limits is None:
+            if self.modeltype not in LIMITS:
+                raise ValueError(f"No rate limits known for model {self.modeltype}")
+            limits = LIMITS[self.modeltype]
+        self.rpm, self.tpm, self.rpd = limits
+        self.limiter = RateLimiter(self.rpm, self.tpm, self.rpd)
         print(f"{self.modeltype} model instantiated")
 
+    def _account_usage(self, prompt, prompt_tokens, response):
+        # exact counts come back with the response; use them to correct the limiter and calibrate the estimator
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and usage.total_token_count:
+            self.estimator.observe(prompt, usage.prompt_token_count)
+            total_tokens = usage.total_token_count
+        else:
+            total_tokens = prompt_tokens + self.estimator.count(response.text)
+        self.limiter.add_tokens(total_tokens - prompt_tokens)
+        with self.lock:
+            self.tokens_used += total_tokens
+        return total_tokens
+
     def get_response(self, prompt, config=None):
+        stage = telemetry.caller()
+        if self.cache is not None:
+            cache_key = self.cache.key(self.modeltype, prompt, config)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                telemetry.record("llm", stage, Model=self.modeltype, Cached=True)
+                return cached
         # make sure not to go over model limitations
-        now = time.time()
-        if (self.num_requests % self.rpm == self.rpm - 1) and (now - self.last_time) >= 60:
-            time.sleep(60)
-            self.last_time = time.time()
-        self.tokens_used += self.model.count_tokens(prompt).total_tokens
-        if (self.tokens_used > self.tpm) and (now - self.last_time) >= 60:
-            time.sleep(60)
-            self.tokens_used = 0
-            self.last_time = time.time()
-        if config is not None:
-            response = self.model.generate_content(prompt, generation_config=config)
-        else:
-            response = self.model.generate_content(prompt)
-        response = response.text
+        prompt_tokens = self.estimator.count(prompt)
+        slept = self.limiter.acquire(prompt_tokens)
+        start = time.time()
+        try:
+            if config is not None:
+                response = self.model.generate_content(prompt, generation_config=config)
+            else:
+                response = self.model.generate_content(prompt)
+        except Exception as e:
+            telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, Latency=time.time() - start, Sleep=slept,
+                             Attempt=telemetry.current_attempt() or 1, Error=repr(e))
+            raise
         # check token usage also after generation
-        now = time.time()
-        self.tokens_used += self.model.count_tokens(response).total_tokens
-        if (self.tokens_used > self.tpm) and (now - self.last_time) >= 60:
-            time.sleep(60)
-            self.tokens_used = 0
-            self.last_time = time.time()
-        self.num_requests += 1
+        total_tokens = self._account_usage(prompt, prompt_tokens, response)
+        telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, ResponseTokens=total_tokens - prompt_tokens,
+                         Latency=time.time() - start, Sleep=slept, Attempt=telemetry.current_attempt() or 1)
+        response = response.text
+        with self.lock:
+            self.num_requests += 1
+        if self.cache is not None:
+            self.cache.put(cache_key, response, self.modeltype)
         return response
 
+    async def aget_response(self, prompt, config=None):
+        # taken before the first await, while the calling coroutine is still the frame above
+        stage = telemetry.caller()
+        if self.cache is not None:
+            cache_key = self.cache.key(self.modeltype, prompt, config)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                telemetry.record("llm", stage, Model=self.modeltype, Cached=True)
+                return cached
+        prompt_tokens = self.estimator.count(prompt)
+        slept = await self.limiter.aacquire(prompt_tokens)
+        if self.clients is not None and self.model._async_client is None:
+            # asyncio clients need a running loop, so they are only made here
+            self.model._async_client = self.clients.make_client("generative_async")
+        start = time.time()
+        try:
+            if config is not None:
+                response = await self.model.generate_content_async(prompt, generation_config=config)
+            else:
+                response = await self.model.generate_content_async(prompt)
+        except Exception as e:
+            telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, Latency=time.time() - start, Sleep=slept,
+                             Attempt=telemetry.current_attempt() or 1, Error=repr(e))
+            raise
+        total_tokens = self._account_usage(prompt, prompt_tokens, response)
+        telemetry.record("llm", stage, Model=self.modeltype, PromptTokens=prompt_tokens, ResponseTokens=total_tokens - prompt_tokens,
+                         Latency=time.time() - start, Sleep=slept, Attempt=telemetry.current_attempt() or 1)
+        response = response.text
+        with self.lock:
+            self.num_requests += 1
+        if self.cache is not None:
+            self.cache.put(cache_key, response, self.modeltype)
+        return response
+
+
+async def map_concurrent(worker, items, max_concurrency=10):
+    """
+    Applies a blocking worker to every item with up to max_concurrency calls in flight.
+    The concurrency is thread-based: each call runs in a worker thread of a ThreadPoolExecutor and uses the agent's
+    blocking get_response, not aget_response. The agent's rate limiter decides how many of them actually reach the API at once.
+
+    Returns:
+        A list of worker results in the order of the items.
+    """
+    loop = asyncio.get_running_loop()
+
+    def run(index, item):
+        # executor threads do not inherit the caller's context; each item is the case at its index
+        with telemetry.context(case=index):
+            return worker(item)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return await asyncio.gather(*[loop.run_in_executor(executor, contextvars.copy_context().run, run, i, item)
+                                      for i, item in enumerate(items)])
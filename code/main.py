@@ -1,8 +1,21 @@
 from llm import *
+from fakellm import FakeModel
+from pool import AgentPool
+from cache import *
+from tokens import *
+from fingerprint import *
+from store import *
+from pipeline import *
 from generate_cases import *
 from automodel import *
 from evaluate import *
 from analysis import *
+from robustness import *
+from dynamics import *
+from speculative import *
+from structured import parse_stats
+import telemetry
+import asyncio
 import json
 import os
 
@@ -12,7 +25,21 @@ import os
 if __name__ == "__main__":
 
     key = os.environ.get('GOOGLE_API_KEY')
-    agent = GeminiModel("gemini-2.5-flash", key)
+    cache = ResponseCache("llm_cache.sqlite")  # pass replay_only=True to forbid new API calls
+    estimator = TokenEstimator(calibration_path="token_calibration.json")
+    if os.environ.get("FAKE_LLM"):
+        # offline load testing: deterministic responses after a lognormal latency (FAKE_LLM holds the median in seconds)
+        agent = FakeModel(latency=float(os.environ["FAKE_LLM"]), estimator=TokenEstimator())
+    else:
+        agent = GeminiModel("gemini-2.5-flash", key, cache=cache, estimator=estimator)
+        # several keys and models behind one agent, the stronger model reserved for semantic validation
+        #agent = AgentPool([GeminiModel("gemini-2.5-flash", "GOOGLE_API_KEY", cache=cache, estimator=estimator),
+        #                   GeminiModel("gemini-2.5-flash", "GOOGLE_API_KEY_2", cache=cache, estimator=estimator),
+        #                   GeminiModel("gemini-2.5-pro", "GOOGLE_API_KEY", cache=cache, estimator=estimator)],
+        #                  preferences={"validate_game_semantic": ["gemini-2.5-pro"], "autoformalize_game": ["gemini-2.5-flash"]},
+        #                  usage_path="llm_usage.json")
+    # one event per LLM call, parse and solver run, summarized at the end (or later with python telemetry.py)
+    telemetry.set_sink(telemetry.Telemetry("telemetry.jsonl"))
     
     # Generate cases
     categories = ["predator-prey",
@@ -21,9 +48,12 @@ if __name__ == "__main__":
                   "habitat-selection"]
     for category in categories:
         print("processing category: ", category)
-        cases = get_cases(agent, category)
+        with telemetry.context(category=category):
+            cases = get_cases(agent, category)
         with open(category+".json", "w") as f:
             json.dump(cases, f, indent=4)
+    print(parse_stats())  # parsed / repaired / failed LLM outputs per stage
+    print(telemetry.report("telemetry.jsonl"))  # calls, tokens, generation and throttle time per category and stage
     
 """
     # Get Wikipedia articles and automodel
@@ -38,14 +68,40 @@ if __name__ == "__main__":
             category = json.load(f)
         #category = get_wiki_articles(agent, category) # Get Wikipedia articles
         #category = autoformalize_category(agent, category) # Automodel cases (generate games)
+        #category = asyncio.run(autoformalize_category_concurrent(agent, category)) # Same, keeping the quota saturated
+        #category = autoformalize_category_batched(agent, category, batch_size=5) # Same, several cases per request
+        #category = asyncio.run(speculative_category(agent, category, k=4)) # Same, k candidate utilities per case at different temperatures, keeping the first that validates uniquely
         #category = expected_outcomes_category(agent, category) # Formalize the observed outcomes in nature
+        #category = asyncio.run(expected_outcomes_category_concurrent(agent, category)) # Same, keeping the quota saturated
         #category = validate_category_semantic(agent, category) # Semantic validation
         #category = update_category(agent, category) # Update when there is feedback
+        #category = asyncio.run(update_category_concurrent(agent, category)) # Same, keeping the quota saturated
         if category is not None:
             with open(filename+".json", "w") as f:
                 json.dump(category, f, indent=4)
     
 
+    # Same stages on a record-oriented store: each case is committed as soon as it is processed,
+    # so a crash or exhausted quota mid-category keeps every finished case
+    for filename in files:
+        print(filename)
+        with CaseStore.from_json(filename + ".json") as store:
+            #store.apply(lambda item: get_wiki_article(agent, item), stage="wiki")
+            #store.apply(lambda item: autoformalize_item(agent, item), stage="autoformalize")
+            #store.apply(lambda item: expected_outcomes_item(agent, item), stage="outcomes")
+            #store.apply(lambda item: validate_item_semantic(agent, item)[0], stage="semantic")
+            #store.apply(lambda item: update_item(agent, item), stage="update")
+            store.export_json(filename + ".json")
+
+
+    # Declarative alternative to toggling the stages above: every stage runs only on cases whose inputs changed
+    for filename in files:
+        print(filename)
+        with CaseStore.from_json(filename + ".json") as store, telemetry.context(category=filename):
+            run_pipeline(default_stages(agent, cache=EquilibriumCache()), store, state_path=filename + ".stages.json")
+            store.export_json(filename + ".json")
+
+
     # Game theoretic validation
     # iterate over categories
     files = ['predator-prey',
@@ -59,7 +115,9 @@ if __name__ == "__main__":
             category = json.load(f)
         #category = validate_category(category) # Syntactic validation
         #category = solve_category(category) # Solve nash equilibria and check if outcome is in them
+        #category = solve_category(category, cache=EquilibriumCache()) # Same, solving equivalent games only once
         #category = get_stats_feedback(category, numpass=1) # Get statistics on success rates by pass number
+        #category = dynamics_category(category, dynamic="replicator") # Evolutionary dynamics: attractors, basins and whether the observed outcome is one
         if category is not None:
             with open(filename + ".json", "w") as f:
                 json.dump(category, f, indent=4)
@@ -76,6 +134,8 @@ if __name__ == "__main__":
             category = json.load(f)
         #validated = collect_validated_games(category) # Concentrate validated game models into one file
         #validated = analyze_validated_set(agent, validated) # Perform analysis on validated game models
+        #validated = analyze_validated_set(agent, validated, token_budget=8000) # Same, analyzing large validated sets in chunks under a token budget
+        #validated = robustness_validated(validated, samples=10000, scale=0.1) # Robustness of the observed outcomes to noise in the utilities
         if validated is not None:
             with open(filename + ".json", "w") as f:
                 json.dump(validated, f, indent=4)
@@ -0,0 +1,261 @@
+import string
+import numpy as np
+from scipy.optimize import least_squares
+from typing import Dict, List, Tuple
+
+TOLERANCE = 1e-9
+REGRET_TOLERANCE = 1e-6  # largest gain from deviating that a mixed equilibrium may leave, in normalized payoff units
+
+
+class NGame:
+    """
+    Normal-form game with any number of players, built once from a GameDef.
+
+    The utilities of each player are nested by its own action, then by the action of every other player in
+    game order: {action: {action of next player: {action of the player after it: ... {"outcome", "utility"}}}}.
+    With two players this is the usual GameDef. payoffs[p][a1, ..., aN] is the utility of player p at that profile.
+    """
+    __slots__ = ("names", "actions", "action_index", "payoffs")
+
+    def __init__(self, names, actions, payoffs):
+        self.names = tuple(names)
+        self.actions = tuple(tuple(x) for x in actions)
+        self.action_index = tuple({action: i for i, action in enumerate(x)} for x in self.actions)
+        self.payoffs = np.asarray(payoffs, dtype=float)
+
+    @classmethod
+    def from_json(cls, game_data: List[dict]) -> "NGame":
+        """
+        Raises:
+            ValueError if the definition does not give a numeric utility to every player at every action profile.
+        """
+        if not isinstance(game_data, list) or len(game_data) < 2:
+            raise ValueError("Invalid game data structure: a list of at least two players required.")
+        for player in game_data:
+            if not isinstance(player, dict) or not all(key in player for key in ("name", "actions", "utilities")):
+                raise ValueError(f"Invalid game data structure: every player must be a dict with a name, actions and utilities.")
+        names = [player["name"] for player in game_data]
+        actions = [list(player["actions"]) for player in game_data]
+        payoffs = np.zeros((len(names),) + tuple(len(x) for x in actions))
+        for p, player in enumerate(game_data):
+            # nesting order of this player's utilities: itself, then everyone else in game order
+            order = [p] + [q for q in range(len(names)) if q != p]
+            for profile in np.ndindex(*payoffs.shape[1:]):
+                entry = player["utilities"]
+                path = []
+                for q in order:
+                    action = actions[q][profile[q]]
+                    path.append(action)
+                    if not isinstance(entry, dict) or action not in entry:
+                        raise ValueError(f"Missing utility for {player['name']} at {' / '.join(path)}: "
+                                         f"utilities must be nested by {player['name']}'s action, then by the actions of "
+                                         f"{', '.join(names[q] for q in order[1:])} in that order.")
+                    entry = entry[action]
+                if not isinstance(entry, dict) or not isinstance(entry.get("utility"), (int, float)) or isinstance(entry.get("utility"), bool):
+                    raise ValueError(f"Invalid utility value: utility for {player['name']} at {' / '.join(path)} must be numeric.")
+                payoffs[(p,) + profile] = entry["utility"]
+        return cls(names, actions, payoffs)
+
+    def profile(self, outcome: Dict[str, str]):
+        # action indices of an outcome {player: action}, or None if it does not name an action of each player
+        try:
+            return tuple(self.action_index[p][outcome[name]] for p, name in enumerate(self.names))
+        except (KeyError, TypeError):
+            return None
+
+    def label(self, strategies) -> Dict[str, Dict[str, float]]:
+        # {player: {action: probability}} at the precision equilibria are reported with
+        return {self.names[p]: {self.actions[p][a]: float(abs(round(strategies[p][a], 2))) for a in range(len(self.actions[p]))}
+                for p in range(len(self.names))}
+
+    def __repr__(self):
+        return f"NGame({' x '.join(f'{name} {len(x)}' for name, x in zip(self.names, self.actions))})"
+
+
+def best_response_masks(payoffs: np.ndarray) -> np.ndarray:
+    """
+    Marks, for every player and profile, whether the player's action is a best response to the others' actions.
+    One max over a single axis per player, instead of checking every deviation of every profile.
+
+    Returns:
+        A boolean array shaped like payoffs: (players, n1, ..., nN)
+    """
+    return np.stack([payoffs[p] >= payoffs[p].max(axis=p, keepdims=True) - TOLERANCE for p in range(payoffs.shape[0])])
+
+
+def pure_equilibria_n(payoffs: np.ndarray) -> Tuple[List[tuple], List[bool]]:
+    """
+    Finds all pure Nash equilibria: the profiles where every player's action is a best response.
+
+    Returns:
+        A tuple: ([profiles], [True if every action is the unique best response, per profile])
+    """
+    best = best_response_masks(payoffs)
+    equilibria = best.all(axis=0)
+    strict = equilibria.copy()
+    for p in range(payoffs.shape[0]):
+        strict &= best[p].sum(axis=p, keepdims=True) == 1
+    profiles = [tuple(int(a) for a in x) for x in np.argwhere(equilibria)]
+    return profiles, [bool(strict[x]) for x in profiles]
+
+
+def normalize_payoffs(payoffs: np.ndarray) -> np.ndarray:
+    # each player's utilities rescaled to [0, 1], which keeps the equilibria and makes tolerances comparable
+    low = payoffs.min(axis=tuple(range(1, payoffs.ndim)), keepdims=True)
+    high = payoffs.max(axis=tuple(range(1, payoffs.ndim)), keepdims=True)
+    return (payoffs - low) / np.where(high > low, high - low, 1.0)
+
+
+def action_values(payoffs: np.ndarray, strategies: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    Expected utility of every action of every player against the others' mixed strategies.
+
+    Args:
+        strategies: One array per player of shape (starts, n_p), a batch of mixed strategy profiles.
+
+    Returns:
+        One array per player of shape (starts, n_p).
+    """
+    players = payoffs.shape[0]
+    letters = string.ascii_lowercase[:players]
+    values = []
+    for p in range(players):
+        others = [q for q in range(players) if q != p]
+        # one pass over the profile space; einsum's path search costs more than it saves at these sizes
+        subscripts = f"{letters}," + ",".join(f"z{letters[q]}" for q in others) + f"->z{letters[p]}"
+        values.append(np.einsum(subscripts, payoffs[p], *[strategies[q] for q in others]))
+    return values
+
+
+def regret_n(payoffs: np.ndarray, strategies: List[np.ndarray]) -> np.ndarray:
+    # largest gain any player gets from deviating to a pure action, per profile of the batch
+    values = action_values(payoffs, strategies)
+    return np.max([value.max(axis=-1) - (value * x).sum(axis=-1) for value, x in zip(values, strategies)], axis=0)
+
+
+def polish(payoffs: np.ndarray, strategies: List[np.ndarray], support: List[np.ndarray]):
+    """
+    Turns an approximate equilibrium into an exact one by solving the indifference conditions on a guessed support.
+
+    Args:
+        support: One boolean mask per player of the actions played.
+
+    Returns:
+        The refined list of mixed strategies, or None if no equilibrium with that support is found.
+    """
+    if not all(mask.any() for mask in support):
+        return None
+    supports = [np.flatnonzero(mask) for mask in support]
+    sizes = [len(s) for s in supports]
+    start = np.concatenate([x[s] / x[s].sum() for x, s in zip(strategies, supports)])
+    bounds = np.cumsum([0] + sizes)
+
+    def unpack(z):
+        result = []
+        for p, x in enumerate(strategies):
+            full = np.zeros(len(x))
+            full[supports[p]] = z[bounds[p]:bounds[p + 1]]
+            result.append(full[None, :])
+        return result
+
+    def residuals(z):
+        profile = unpack(z)
+        values = action_values(payoffs, profile)
+        equations = []
+        for p, s in enumerate(supports):
+            # every action in the support earns the same, and the probabilities sum to one
+            equations.extend(values[p][0, s[1:]] - values[p][0, s[0]])
+            equations.append(z[bounds[p]:bounds[p + 1]].sum() - 1)
+        return np.array(equations)
+
+    if all(size == 1 for size in sizes):
+        solution = start
+    else:
+        solution = least_squares(residuals, start, method="lm", xtol=1e-12, ftol=1e-12, max_nfev=20 * (len(start) + 1)).x
+        if solution.min() < -TOLERANCE:
+            # the indifferent mixture needs a negative probability: no equilibrium on this support
+            return None
+        solution = np.clip(solution, 0, None)
+    profile = unpack(solution)
+    if regret_n(payoffs, profile)[0] > REGRET_TOLERANCE:
+        return None
+    return [x[0] for x in profile]
+
+
+def mixed_equilibria_n(payoffs: np.ndarray, starts: int = 32, iterations: int = 1500, seed: int = 0) -> List[List[np.ndarray]]:
+    """
+    Iterative search for Nash equilibria, pure or mixed.
+
+    A batch of starting profiles (the centroid and random draws from the simplices) follows damped logit responses
+    with a rationality raised geometrically to 1e4, tracing logit quantal response equilibria towards Nash equilibria.
+    Each start begins at a different rationality, so the batch does not collapse onto a single branch.
+    End points (and their time averages, in case the responses cycle) that are close to an equilibrium are then
+    refined exactly on their support (see polish) and kept if no player can gain by deviating.
+    The search is not guaranteed to find every mixed equilibrium.
+
+    Returns:
+        Equilibria with distinct supports, each a list of mixed strategies (one array per player).
+    """
+    normalized = normalize_payoffs(payoffs)
+    players = payoffs.shape[0]
+    rng = np.random.default_rng(seed)
+    strategies = []
+    for n in payoffs.shape[1:]:
+        x = rng.exponential(size=(starts, n))
+        x[0] = 1.0
+        strategies.append(x / x.sum(axis=-1, keepdims=True))
+    initial = 10 ** (4 * np.arange(starts) / starts)[:, None]
+    averages = [np.zeros_like(x) for x in strategies]
+    for t in range(iterations):
+        rationality = initial * (1e4 / initial) ** (t / iterations)
+        damping = 0.5 / (1 + rationality / 10)
+        values = action_values(normalized, strategies)
+        for p in range(players):
+            logits = rationality * values[p]
+            response = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            response /= response.sum(axis=-1, keepdims=True)
+            strategies[p] = (1 - damping) * strategies[p] + damping * response
+            if t >= iterations // 2:
+                averages[p] += strategies[p] / (iterations - iterations // 2)
+    found = {}
+    tried = set()
+    for k in range(starts):
+        for candidate in (strategies, averages):
+            profile = [x[k] for x in candidate]
+            batch = [x[None, :] for x in profile]
+            if regret_n(normalized, batch)[0] > 0.05:
+                continue
+            values = action_values(normalized, batch)
+            # likely supports: the actions still played, those played noticeably, and those played that are near-best
+            supports = [[x > 1e-3 for x in profile],
+                        [x > 2e-2 for x in profile],
+                        [x > 1e-1 for x in profile],
+                        [(x > 1e-3) & (value[0] >= value[0].max() - 2e-2) for x, value in zip(profile, values)]]
+            for support in supports:
+                key = tuple(np.concatenate(support)) + tuple(np.round(np.concatenate(profile), 1))
+                if key in tried:
+                    continue
+                tried.add(key)
+                equilibrium = polish(normalized, profile, support)
+                if equilibrium is not None:
+                    # one equilibrium per support: a generic game has at most one, a degenerate one a whole continuum
+                    found.setdefault(tuple(np.concatenate(equilibrium) > TOLERANCE), equilibrium)
+                    break
+    return list(found.values())
+
+
+def solve_n(game: NGame, starts: int = 32, iterations: int = 1500, seed: int = 0) -> Tuple[List[dict], List[tuple], str]:
+    """
+    Solves an N-player game: every pure equilibrium exactly, then mixed ones with the iterative search.
+
+    Returns:
+        A tuple: (equilibria labelled {player: {action: probability}}, pure equilibrium profiles, message)
+    """
+    pure, strict = pure_equilibria_n(game.payoffs)
+    equilibria = [[np.eye(len(game.actions[p]))[a] for p, a in enumerate(profile)] for profile in pure]
+    # every pure equilibrium is already known exactly
+    mixed = [x for x in mixed_equilibria_n(game.payoffs, starts, iterations, seed)
+             if not np.isin(np.round(np.concatenate(x), 2), (0, 1)).all()]
+    message = f"{len(game.names)}-player game. {len(pure)} pure equilibria found by best-response search. "
+    message += f"{len(mixed)} mixed equilibria found by iterative search, which may miss some. "
+    return [game.label(x) for x in equilibria + mixed], pure, message
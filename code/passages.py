@@ -0,0 +1,143 @@
+import math
+import re
+from collections import Counter
+from html.parser import HTMLParser
+from tokens import TokenEstimator
+
+
+BLOCK_TAGS = {"p", "li", "dd", "blockquote"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4"}
+SKIP_TAGS = {"script", "style", "sup", "noscript", "math"}
+SKIP_CLASSES = {"reference", "mw-editsection", "navbox", "infobox", "reflist", "mw-references-wrap", "sidebar", "hatnote"}
+STOPWORDS = set("a an and are as at be by for from has have in is it its of on or that the their them they this to was were which with".split())
+
+
+class _ArticleParser(HTMLParser):
+    # collects the text of paragraphs and list items under their section heading
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.passages = []
+        self.section = ""
+        self.skip = []  # tag names of skipped elements still open
+        self.block = None
+        self.heading = None
+        self.buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip:
+            if tag == self.skip[-1]:
+                self.skip.append(tag)
+            return
+        classes = set((dict(attrs).get("class") or "").split())
+        if tag in SKIP_TAGS or classes & SKIP_CLASSES:
+            self.skip.append(tag)
+        elif tag in HEADING_TAGS:
+            self.heading = tag
+            self.buffer = []
+        elif tag in BLOCK_TAGS and self.block is None:
+            self.block = tag
+            self.buffer = []
+
+    def handle_endtag(self, tag):
+        if self.skip:
+            if tag == self.skip[-1]:
+                self.skip.pop()
+            return
+        if tag == self.heading:
+            self.section = " ".join("".join(self.buffer).split())
+            self.heading = None
+        elif tag == self.block:
+            text = " ".join("".join(self.buffer).split())
+            if text:
+                self.passages.append({"Section": self.section, "Text": text})
+            self.block = None
+
+    def handle_data(self, data):
+        if not self.skip and (self.block is not None or self.heading is not None):
+            self.buffer.append(data)
+
+
+def extract_passages(html, min_length=40):
+    """
+    Parses the HTML of a Wikipedia article into plain-text passages.
+
+    Returns:
+        A list of {"Section": heading, "Text": passage} in document order, skipping
+        scripts, citation markers, navigation boxes, repeated passages and passages shorter than min_length characters.
+    """
+    parser = _ArticleParser()
+    parser.feed(html)
+    parser.close()
+    seen = set()
+    passages = []
+    for x in parser.passages:
+        if len(x["Text"]) >= min_length and x["Text"] not in seen:
+            seen.add(x["Text"])
+            passages.append(x)
+    return passages
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS]
+
+
+def bm25_scores(passages, query, k1=1.5, b=0.75):
+    # Okapi BM25 score of every passage for the query
+    documents = [tokenize(x["Section"] + " " + x["Text"]) for x in passages]
+    if not documents:
+        return []
+    average_length = sum(len(x) for x in documents) / len(documents)
+    frequencies = Counter(word for document in documents for word in set(document))
+    query_words = set(tokenize(query))
+    scores = []
+    for document in documents:
+        counts = Counter(document)
+        score = 0
+        for word in query_words:
+            if counts[word] == 0:
+                continue
+            idf = math.log(1 + (len(documents) - frequencies[word] + 0.5) / (frequencies[word] + 0.5))
+            score += idf * counts[word] * (k1 + 1) / (counts[word] + k1 * (1 - b + b * len(document) / max(average_length, 1)))
+        scores.append(score)
+    return scores
+
+
+def select_passages(html, query, token_budget=4000, top_k=20, estimator=None):
+    """
+    Picks the passages of an article most relevant to a query, under a token budget.
+
+    Args:
+        html: The article HTML.
+        query: Text to rank against, e.g. the case description and species.
+        token_budget: Maximum estimated tokens of the selected passages.
+        top_k: Maximum number of passages.
+        estimator: A tokens.TokenEstimator, a character-based one by default.
+
+    Returns:
+        The selected passages as plain text grouped by section, in document order.
+        If no passage matches the query, the leading passages of the article under the budget.
+    """
+    estimator = estimator if estimator is not None else TokenEstimator()
+    passages = extract_passages(html)
+    scores = bm25_scores(passages, query)
+    # with no passage matching the query, fall back to document order: the lead usually summarizes the article
+    relevant = any(score > 0 for score in scores)
+    ranked = sorted(range(len(passages)), key=lambda i: -scores[i]) if relevant else range(len(passages))
+    chosen = []
+    used = 0
+    for i in ranked:
+        if len(chosen) == top_k or (relevant and scores[i] <= 0):
+            break
+        tokens = estimator.count(passages[i]["Text"])
+        if used + tokens > token_budget:
+            continue
+        chosen.append(i)
+        used += tokens
+    text = []
+    section = None
+    for i in sorted(chosen):
+        if passages[i]["Section"] != section:
+            section = passages[i]["Section"]
+            text.append(f"\n{section}" if section else "")
+        text.append(passages[i]["Text"])
+    return "\n".join(text).strip()
@@ -0,0 +1,206 @@
+import hashlib
+import inspect
+import json
+from store import CaseStore
+import telemetry
+
+
+class Stage:
+    """
+    A node of the stage graph.
+
+    Args:
+        name: Stage name, also the key of its records in each case's "StageHashes".
+        function: Per-case function taking a case and returning the updated case,
+                  or for per_case=False a function taking and returning the whole category.
+        inputs: What the stage reads from a case: field names, or (label, function) pairs projecting the part of a case
+                that matters, e.g. only the game definitions and not the results later stages add to them.
+                A case is reprocessed only when these (or the stage code) change.
+        after: Names of the stages that must run first.
+        code: Functions or modules whose source identifies the stage's code version, defaults to the function itself.
+              LLM stages should list only their own prompt/parsing code, so unrelated code changes never re-call the model.
+        per_case: False for stages that aggregate over the whole category.
+    """
+    def __init__(self, name, function, inputs, after=(), code=None, per_case=True):
+        self.name = name
+        self.function = function
+        self.inputs = [x if isinstance(x, tuple) else (x, lambda case, field=x: case.get(field)) for x in inputs]
+        self.after = list(after)
+        self.code = code if code is not None else [function]
+        self.per_case = per_case
+        self.version = hashlib.sha256("".join(_source(x) for x in self.code).encode("utf-8")).hexdigest()
+
+    def input_hash(self, case):
+        content = json.dumps({"Version": self.version, "Inputs": {label: read(case) for label, read in self.inputs}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _source(code):
+    try:
+        return inspect.getsource(code)
+    except (TypeError, OSError):
+        return repr(code)
+
+
+def game_definitions(case):
+    # the game definitions of a case, without the results of validating and solving them
+    game = case.get("Game")
+    if isinstance(game, list) and all(isinstance(x, dict) and "GameDef" in x for x in game):
+        return [x["GameDef"] for x in game]
+    return game
+
+
+def game_actions(case):
+    # players and actions of the latest game definition, all the observed outcome depends on
+    game = game_definitions(case)
+    if isinstance(game, list) and game and isinstance(game[0], list):
+        game = game[-1]
+    if not isinstance(game, list):
+        return game
+    return [{x.get("name"): x.get("actions")} for x in game if isinstance(x, dict)]
+
+
+def as_passes(case):
+    # autoformalization leaves the raw game definition in "Game", the later stages expect a list of passes [{"GameDef": ...}]
+    game = case.get("Game")
+    if game is None:
+        # no game could be formalized: counted as a failed generation, like a case that never had one
+        case.pop("Game", None)
+    elif isinstance(game, list) and game_definitions(case) is game:
+        case["Game"] = [{"GameDef": game}]
+    return case
+
+
+def game_errors(case):
+    return [x.get("Error") for x in case.get("Game", []) if isinstance(x, dict)]
+
+
+def game_results(case):
+    return [{key: x.get(key) for key in ("GameDef", "Error", "Equilibria", "Validated", "SemanticFeedback", "PrevGame")}
+            for x in case.get("Game", []) if isinstance(x, dict)]
+
+
+def order_stages(stages):
+    # topological order of the stage graph
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Cycle in stage graph at {stage.name}")
+        visiting.add(stage.name)
+        for name in stage.after:
+            visit(by_name[name])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def is_stale(stage, case):
+    # a case is up to date if its inputs are those the stage last saw, or those it left behind itself
+    record = case.get("StageHashes", {}).get(stage.name)
+    return record is None or stage.input_hash(case) not in (record["Input"], record["Output"])
+
+
+def run_pipeline(stages, category, only=None, force=False, state_path=None):
+    """
+    Runs the stage graph over a category, reprocessing only cases whose stage inputs changed.
+
+    Per-case records are kept in each case under "StageHashes"; records of whole-category stages
+    are kept in the JSON file state_path (without it those stages always run).
+
+    Args:
+        stages: list of Stage.
+        category: json list of cases, or a CaseStore (each processed case is committed immediately).
+        only: names of the stages to run, default all.
+        force: reprocess every case.
+
+    Returns:
+        The category (the same list or store).
+    """
+    state = {}
+    if state_path is not None:
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            pass
+    is_store = isinstance(category, CaseStore)
+    for stage in order_stages(stages):
+        if only is not None and stage.name not in only:
+            continue
+        if not stage.per_case:
+            cases = category.to_list() if is_store else category
+            category_hash = hashlib.sha256("".join(stage.input_hash(case) for case in cases).encode("utf-8")).hexdigest()
+            if not force and category_hash in state.get(stage.name, {}).values():
+                print(f"{stage.name}: up to date")
+                continue
+            print(f"{stage.name}: processing category")
+            with telemetry.context(stage=stage.name):
+                cases = stage.function(cases)
+            state[stage.name] = {"Input": category_hash,
+                                 "Output": hashlib.sha256("".join(stage.input_hash(case) for case in cases).encode("utf-8")).hexdigest()}
+            if is_store:
+                for index, case in zip(category.indices(), cases):
+                    category.put(index, case, stage.name)
+            else:
+                category[:] = cases
+            continue
+        processed = 0
+        for index, case in (category if is_store else enumerate(category)):
+            if not force and not is_stale(stage, case):
+                continue
+            input_hash = stage.input_hash(case)
+            print(f"{stage.name}: processing ", index)
+            with telemetry.context(stage=stage.name, case=index):
+                case = stage.function(case)
+            case.setdefault("StageHashes", {})[stage.name] = {"Input": input_hash, "Output": stage.input_hash(case)}
+            if is_store:
+                category.put(index, case, stage.name)
+            else:
+                category[index] = case
+            processed += 1
+        print(f"{stage.name}: {processed} cases processed")
+    if state_path is not None:
+        with open(state_path, "w") as f:
+            json.dump(state, f, indent=4)
+    return category
+
+
+def default_stages(agent, cache=None, numpass=0):
+    """
+    The pipeline of main.py as a stage graph. LLM stages are versioned by their own prompt and parsing code only,
+    while the local solving stage is versioned by the whole solver, so solver changes re-solve without any API calls.
+    """
+    import automodel
+    import dominance
+    import equilibria
+    import evaluate
+    import game
+    import fingerprint
+    import generate_cases
+    import nplayer
+    import repair
+    return [Stage("wiki", lambda item: generate_cases.get_wiki_article(agent, item), ["Query", "Description"],
+                  code=[generate_cases.get_wiki_article, generate_cases.wikimedia_search]),
+            Stage("autoformalize", lambda item: as_passes(automodel.autoformalize_item(agent, item)), ["Article", "Description"], after=["wiki"],
+                  code=[automodel.autoformalize_item, automodel.autoformalize_players_actions, automodel.autoformalize_game, automodel.utilities_prompt]),
+            Stage("outcomes", lambda item: automodel.expected_outcomes_item(agent, item), ["Article", "Description", ("Game", game_actions)], after=["autoformalize"],
+                  code=[automodel.expected_outcomes_item, automodel.autoformalize_expected_outcomes, automodel.current_game]),
+            Stage("semantic", lambda item: evaluate.validate_item_semantic(agent, item)[0], ["Description", ("Game", game_definitions)], after=["outcomes"],
+                  code=[evaluate.validate_item_semantic, evaluate.validate_game_semantic, evaluate.update_game_comment]),
+            Stage("validate", evaluate.validate_item, [("Game", game_definitions)], after=["semantic"],
+                  code=[evaluate.validate_item, evaluate.repair_and_validate, evaluate.validate_game_formal, repair.repair_game]),
+            Stage("solve", lambda item: evaluate.solve_item(item, cache=cache), [("Game", game_definitions), ("Error", game_errors), "Outcome"], after=["validate"],
+                  code=[evaluate, equilibria, dominance, game, nplayer, fingerprint]),
+            Stage("feedback", lambda category: evaluate.get_stats_feedback(category, numpass), ["Article", ("Game", game_results)], after=["solve"],
+                  code=[evaluate.get_stats_feedback, dominance.trace_text], per_case=False),
+            Stage("update", lambda item: automodel.update_item(agent, item), ["Article", "Description", ("Game", game_definitions), "Outcome", "Feedback"], after=["feedback"],
+                  code=[automodel.update_item, automodel.improve_from_feedback])]
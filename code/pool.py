@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from google.api_core.exceptions import ResourceExhausted
+from llm import DailyLimitReached
+import telemetry
+
+
+def key_id(key):
+    # short stable identifier of an API key (or of the name of its environment variable)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12] if key else None
+
+
+class AgentPool:
+    """
+    Several agents (API keys and models) behind the get_response interface of a single GeminiModel.
+
+    Each request goes to the agent of the stage's preferred models that can send it soonest, the one with the most
+    daily quota left among equally fast ones, falling back to the other models once the preferred ones are exhausted.
+    An agent answering with a rate-limit error (429) or out of daily quota is skipped for cooldown seconds and
+    the request is sent to the next one. Requests per day of every agent are saved to usage_path, so a restarted
+    run knows how much quota each key has left today.
+
+    Args:
+        agents: GeminiModel (or FakeModel) objects, each with its own key, model and RateLimiter.
+        preferences: {stage: [models in order of preference]}. The stage of a request is the stage context
+                     (see telemetry.context) or the function that called get_response, e.g.
+                     {"validate_game_semantic": ["gemini-2.5-pro"], "autoformalize_game": ["gemini-2.5-flash"]}.
+        usage_path: JSON file holding the timestamps of each agent's requests in the last day.
+        cooldown: Seconds an agent is skipped after a rate-limit error.
+        max_attempts: Attempts at one request, across agents, before the last rate-limit error is raised.
+    """
+    def __init__(self, agents, preferences=None, usage_path=None, cooldown=60, max_attempts=None):
+        if not agents:
+            raise ValueError("An agent pool needs at least one agent")
+        self.agents = list(agents)
+        # agents are named by a hash of their key, never the key itself, since the names are saved to usage_path
+        self.names = [f"{key_id(getattr(agent, 'key', None)) or i}/{agent.modeltype}" for i, agent in enumerate(self.agents)]
+        if len(set(self.names)) < len(self.names):
+            raise ValueError(f"Every agent of a pool needs its own key and model, got {self.names}")
+        self.preferences = preferences or {}
+        self.usage_path = usage_path
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts if max_attempts is not None else 4 * len(self.agents)
+        self.modeltype = "pool"
+        self.estimator = self.agents[0].estimator
+        # the pool's quota is the sum of its agents', so concurrent stages size themselves to all of it
+        self.rpm = sum(agent.rpm for agent in self.agents)
+        self.tpm = sum(agent.tpm for agent in self.agents)
+        self.rpd = sum(agent.rpd for agent in self.agents)
+        self.cooling = {}  # agent index -> time until which it is skipped
+        self.failovers = 0
+        self.lock = threading.Lock()
+        if usage_path is not None and os.path.exists(usage_path):
+            with open(usage_path) as f:
+                usage = json.load(f)
+            for name, agent in zip(self.names, self.agents):
+                agent.limiter.restore(usage.get(name, []))
+
+    @property
+    def num_requests(self):
+        return sum(agent.num_requests for agent in self.agents)
+
+    @property
+    def tokens_used(self):
+        return sum(agent.tokens_used for agent in self.agents)
+
+    def save_usage(self):
+        if self.usage_path is None:
+            return
+        with self.lock:
+            usage = {name: list(agent.limiter.daily) for name, agent in zip(self.names, self.agents)}
+            tmp_path = self.usage_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(usage, f)
+            os.replace(tmp_path, self.usage_path)
+
+    def tiers(self, stage):
+        # agent indices grouped by the stage's model preference, every other model last
+        preferred = []
+        for name in stage:
+            if name in self.preferences:
+                preferred = self.preferences[name]
+                break
+        rank = lambda i: preferred.index(self.agents[i].modeltype) if self.agents[i].modeltype in preferred else len(preferred)
+        return [[i for i in range(len(self.agents)) if rank(i) == r] for r in sorted(set(rank(i) for i in range(len(self.agents))))]
+
+    def choose(self, stage, tokens):
+        """
+        Picks the agent for a request.
+
+        Returns:
+            A tuple: (agent index, or None if every agent is cooling down or out of daily quota,
+                      seconds until the first cooling agent is available again)
+        """
+        now = time.time()
+        with self.lock:
+            cooling = {i: until for i, until in self.cooling.items() if until > now}
+            self.cooling = cooling
+        for tier in self.tiers(stage):
+            ready = []
+            for i in tier:
+                if i in cooling:
+                    continue
+                wait = self.agents[i].limiter.wait_time(tokens)
+                if wait != float("inf"):
+                    ready.append((wait, -self.agents[i].limiter.remaining_daily(), i))
+            if ready:
+                return min(ready)[2], 0
+        if cooling:
+            return None, min(cooling.values()) - now
+        raise DailyLimitReached(f"Daily limit reached for every agent of the pool: {', '.join(self.names)}")
+
+    def _fail(self, i, error):
+        with self.lock:
+            self.cooling[i] = time.time() + self.cooldown
+            self.failovers += 1
+        print(f"{self.names[i]} unavailable, failing over: {error}")
+
+    def get_response(self, prompt, config=None):
+        stage = (telemetry.current_stage(), telemetry.caller())
+        tokens = self.estimator.count(prompt)
+        attempts = 0
+        while True:
+            i, wait = self.choose(stage, tokens)
+            if i is None:
+                time.sleep(wait)
+                continue
+            try:
+                # the agent's own telemetry is attributed to the caller's stage, not to this method
+                with telemetry.context(stage=stage[0] or stage[1], attempt=attempts + 1):
+                    response = self.agents[i].get_response(prompt, config)
+            except (ResourceExhausted, DailyLimitReached) as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    raise
+                self._fail(i, e)
+                continue
+            self.save_usage()
+            return response
+
+    async def aget_response(self, prompt, config=None):
+        # taken before the first await, while the calling coroutine is still the frame above
+        stage = (telemetry.current_stage(), telemetry.caller())
+        tokens = self.estimator.count(prompt)
+        attempts = 0
+        while True:
+            i, wait = self.choose(stage, tokens)
+            if i is None:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                with telemetry.context(stage=stage[0] or stage[1], attempt=attempts + 1):
+                    response = await self.agents[i].aget_response(prompt, config)
+            except (ResourceExhausted, DailyLimitReached) as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    raise
+                self._fail(i, e)
+                continue
+            self.save_usage()
+            return response
+
+    def stats(self):
+        # requests, tokens and daily quota left per agent
+        return {name: {"Requests": agent.num_requests, "Tokens": agent.tokens_used, "RemainingToday": agent.limiter.remaining_daily(),
+                       "Cooling": self.cooling.get(i, 0) > time.time()}
+                for i, (name, agent) in enumerate(zip(self.names, self.agents))}
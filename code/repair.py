@@ -0,0 +1,162 @@
+import copy
+import difflib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CUTOFF = 0.8  # minimum difflib ratio for a label to be taken as a misspelling of an action
+NUMBER = re.compile(r"[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?")
+
+
+def normalize_label(label: str) -> str:
+    # case, surrounding whitespace and separator style are not meaningful in action names
+    return re.sub(r"[\s_\-]+", " ", str(label)).strip().casefold()
+
+
+def coerce_number(value: Any) -> Optional[float]:
+    """
+    Reads a utility given as a string ("3", " -2.5 ", "+1", "4 points") as a number.
+
+    Returns:
+        An int or float, or None if the value holds no unambiguous number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        return None
+    numbers = NUMBER.findall(value)
+    if len(numbers) != 1:
+        return None
+    text = NUMBER.search(value).group(0)
+    number = float(text)
+    return int(number) if number.is_integer() and re.fullmatch(r"[-+]?\d+", text) else number
+
+
+def match_labels(labels: List[str], actions: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Matches labels to actions one-to-one: exact first, then after normalization, then by closest spelling.
+
+    Returns:
+        A tuple: ({label: action} for every matched label, [labels left unmatched])
+    """
+    mapping = {}
+    free = [action for action in actions if action not in labels]
+    pending = []
+    for label in labels:
+        if label in actions:
+            mapping[label] = label
+        else:
+            pending.append(label)
+    unmatched = []
+    for label in pending:
+        found = [action for action in free if normalize_label(action) == normalize_label(label)]
+        if len(found) == 1:
+            mapping[label] = found[0]
+            free.remove(found[0])
+        else:
+            unmatched.append(label)
+    remaining = []
+    for label in unmatched:
+        normalized = {normalize_label(action): action for action in free}
+        close = difflib.get_close_matches(normalize_label(label), list(normalized), n=1, cutoff=CUTOFF)
+        if close:
+            mapping[label] = normalized[close[0]]
+            free.remove(normalized[close[0]])
+        else:
+            remaining.append(label)
+    return mapping, remaining
+
+
+def repair_game(game_data: list) -> Tuple[list, List[str], List[str]]:
+    """
+    Fixes the mechanical defects of a GameDef locally, without a model call:
+    utilities given as strings or bare numbers, action and response keys that differ from the declared actions by
+    case, whitespace or spelling, and utilities listed out of action order.
+
+    Args:
+        game_data: A JSON game definition, as produced by autoformalization. It is not modified.
+
+    Returns:
+        A tuple: (repaired copy of the game, [changes made], [defects left that need a semantic fix])
+    """
+    if not isinstance(game_data, list) or not all(isinstance(player, dict) for player in game_data):
+        return game_data, [], ["Invalid game data structure: must be a list of player dicts."]
+    game = copy.deepcopy(game_data)
+    changes = []
+    remaining = []
+    if not all(isinstance(player.get("actions"), list) and isinstance(player.get("utilities"), dict) for player in game):
+        return game, changes, ["Every player must have a list of actions and a dict of utilities."]
+    if len(game) != 2:
+        # responses are keyed by the actions of a single other player
+        return game, changes, remaining
+
+    for p, player in enumerate(game):
+        name = player.get("name", f"player {p + 1}")
+        other = game[1 - p]
+        utilities = player["utilities"]
+
+        # own actions
+        mapping, unknown_actions = match_labels(list(utilities), player["actions"])
+        for label in unknown_actions:
+            remaining.append(f"{name} has utilities for '{label}', which is not one of its actions {player['actions']}.")
+        for label, action in mapping.items():
+            if label != action:
+                changes.append(f"{name}: utilities for '{label}' assigned to action '{action}'.")
+        for action in player["actions"]:
+            if action not in mapping.values():
+                remaining.append(f"{name} has no utilities for action '{action}'.")
+
+        repaired = {}
+        for label, action in sorted(mapping.items(), key=lambda x: player["actions"].index(x[1])):
+            responses = utilities[label]
+            if not isinstance(responses, dict):
+                remaining.append(f"Utilities of {name} for action '{action}' must be a dict of responses.")
+                repaired[action] = responses
+                continue
+            response_mapping, unknown = match_labels(list(responses), other["actions"])
+            for response in unknown:
+                remaining.append(f"{name} action '{action}' has a utility for response '{response}', "
+                                 f"which is not one of {other.get('name')}'s actions {other['actions']}.")
+            for response, matched in response_mapping.items():
+                if response != matched:
+                    changes.append(f"{name} action '{action}': response '{response}' renamed to '{matched}'.")
+            entries = {}
+            for response in other["actions"]:
+                labels = [x for x, matched in response_mapping.items() if matched == response]
+                if not labels:
+                    remaining.append(f"Missing utility for {name} action '{action}' given response '{response}'.")
+                    continue
+                entry = responses[labels[0]]
+                if not isinstance(entry, dict):
+                    # a bare value where {"outcome", "utility"} was expected
+                    entry = {"outcome": "", "utility": entry}
+                    changes.append(f"{name} action '{action}' response '{response}': bare utility wrapped in a dict.")
+                if "utility" not in entry:
+                    keys = [key for key in entry if normalize_label(key) in ("utility", "payoff", "value")]
+                    if keys:
+                        entry["utility"] = entry.pop(keys[0])
+                        changes.append(f"{name} action '{action}' response '{response}': '{keys[0]}' renamed to 'utility'.")
+                if "utility" not in entry:
+                    remaining.append(f"Missing utility for {name} action '{action}' given response '{response}'.")
+                elif not isinstance(entry["utility"], (int, float)) or isinstance(entry["utility"], bool):
+                    number = coerce_number(entry["utility"])
+                    if number is None:
+                        remaining.append(f"Utility for {name} action '{action}' given response '{response}' "
+                                         f"is not numeric: {entry['utility']!r}.")
+                    else:
+                        changes.append(f"{name} action '{action}' response '{response}': utility {entry['utility']!r} read as {number}.")
+                        entry["utility"] = number
+                entries[response] = entry
+            if [response_mapping[x] for x in responses if x in response_mapping] != [x for x in other["actions"] if x in entries]:
+                changes.append(f"{name} action '{action}': responses reordered to {other.get('name')}'s action order.")
+            for response in unknown:
+                entries[response] = responses[response]
+            repaired[action] = entries
+        if [mapping[x] for x in utilities if x in mapping] != [x for x in player["actions"] if x in mapping.values()]:
+            changes.append(f"{name}: utilities reordered to action order.")
+        for label in unknown_actions:
+            repaired[label] = utilities[label]
+        player["utilities"] = repaired
+
+    return game, changes, remaining
@@ -0,0 +1,125 @@
+import multiprocessing
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from equilibria import pure_equilibria, unique_equilibrium
+from game import as_game
+
+CHUNK = 4096  # perturbed games solved per vectorized pass, bounds memory for large games
+
+
+def payoff_ranges(A: np.ndarray, B: np.ndarray) -> Tuple[float, float]:
+    # spread of each player's utilities, the unit in which noise is scaled (1 for a player indifferent to everything)
+    return tuple(float(np.ptp(x)) or 1.0 for x in (A, B))
+
+
+def flip_radius(A: np.ndarray, B: np.ndarray, row: int, col: int) -> float:
+    """
+    Exact smallest perturbation, in the max-norm over all utilities, that stops (row, col) from being the only
+    pure equilibrium of the game.
+
+    Each utility can move by at most the radius, so a best-response gap g closes at radius g / 2:
+    the outcome stops being an equilibrium at half its smaller best-response gap, and another profile becomes one at
+    half the larger of its two best-response deficits.
+
+    Returns:
+        The radius, 0 if the outcome is not already the unique strict pure equilibrium.
+    """
+    m, n = A.shape
+    others_A = np.delete(A[:, col], row)
+    others_B = np.delete(B[row, :], col)
+    row_gap = A[row, col] - others_A.max() if m > 1 else np.inf
+    col_gap = B[row, col] - others_B.max() if n > 1 else np.inf
+    own = min(row_gap, col_gap) / 2
+    if own <= 0:
+        return 0.0
+    deficits = np.maximum(A.max(axis=0, keepdims=True) - A, B.max(axis=1, keepdims=True) - B) / 2
+    deficits[row, col] = np.inf
+    return float(min(own, deficits.min()))
+
+
+def perturb(A: np.ndarray, B: np.ndarray, samples: int, scale: float, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draws perturbed copies of a game with independent Gaussian noise on every utility,
+    with standard deviation scale times the player's payoff range.
+
+    Returns:
+        A tuple: (A, B) of shape (samples, m, n)
+    """
+    range_A, range_B = payoff_ranges(A, B)
+    noisy_A = A + rng.normal(0.0, scale * range_A, (samples,) + A.shape)
+    noisy_B = B + rng.normal(0.0, scale * range_B, (samples,) + B.shape)
+    return noisy_A, noisy_B
+
+
+def robustness(game_data, outcome: Dict[str, str], samples: int = 10000, scale: float = 0.1, seed: int = 0) -> Optional[dict]:
+    """
+    Monte Carlo robustness of an observed outcome to noise in the utilities of a game.
+
+    Args:
+        game_data: A GameDef or Game.
+        outcome: The observed outcome {player: action}.
+        samples: Number of perturbed games.
+        scale: Standard deviation of the noise, relative to each player's payoff range.
+        seed: Seed of the noise, so reports are reproducible.
+
+    Returns:
+        None if the outcome does not name an action of each player, otherwise
+        {"Samples", "Scale",
+         "Equilibrium": fraction of samples where the outcome is a pure equilibrium,
+         "UniquePure": fraction where it is the only pure equilibrium,
+         "Unique": fraction where it is certified (by a dominant strategy) to be the only equilibrium, mixed included,
+         "Radius": exact max-norm perturbation that stops it being the only pure equilibrium,
+         "RelativeRadius": the radius over the larger payoff range}
+    """
+    game = as_game(game_data)
+    profile = game.profile(outcome)
+    if profile is None:
+        return None
+    row, col = profile
+    A, B = game.matrices()
+    rng = np.random.default_rng(seed)
+    equilibrium = unique_pure = unique = 0
+    for start in range(0, samples, CHUNK):
+        noisy_A, noisy_B = perturb(A, B, min(CHUNK, samples - start), scale, rng)
+        equilibria, _ = pure_equilibria(noisy_A, noisy_B)
+        at_outcome = equilibria[:, row, col]
+        alone = at_outcome & (equilibria.sum(axis=(1, 2)) == 1)
+        certified, certified_row, certified_col = unique_equilibrium(noisy_A, noisy_B)
+        equilibrium += int(at_outcome.sum())
+        unique_pure += int(alone.sum())
+        unique += int((certified & (certified_row == row) & (certified_col == col)).sum())
+    radius = flip_radius(A, B, row, col)
+    return {"Samples": samples,
+            "Scale": scale,
+            "Equilibrium": equilibrium / samples,
+            "UniquePure": unique_pure / samples,
+            "Unique": unique / samples,
+            "Radius": radius,
+            "RelativeRadius": radius / max(payoff_ranges(A, B))}
+
+
+def _robustness_worker(args):
+    game_data, outcome, samples, scale, seed = args
+    try:
+        return robustness(game_data, outcome, samples, scale, seed)
+    except ValueError as e:
+        print(f"Error in robustness analysis: {e}")
+        return None
+
+
+def robustness_validated(validated: List[dict], samples: int = 10000, scale: float = 0.1, seed: int = 0, workers: int = None) -> List[dict]:
+    """
+    Adds a "Robustness" report to every game of a validated set (see analysis.collect_validated_games).
+
+    Args:
+        workers: Number of processes, one game at a time each. None uses every core, 1 runs in this process.
+    """
+    jobs = [(item["Game"], item["Outcome"], samples, scale, seed) for item in validated]
+    if workers == 1:
+        reports = [_robustness_worker(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            reports = pool.map(_robustness_worker, jobs, chunksize=1)
+    for item, report in zip(validated, reports):
+        item["Robustness"] = report
+    return validated
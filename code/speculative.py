@@ -0,0 +1,195 @@
+import asyncio
+import json
+import numpy as np
+from typing import List, Optional
+from cache import CacheMiss
+from automodel import autoformalize_players_actions, autoformalize_expected_outcomes, utilities_prompt
+from equilibria import solve_pure_batch
+from evaluate import repair_and_validate, create_nashpy_game, calaculate_nash_equilibria
+from game import Game
+from nplayer import NGame, solve_n
+from structured import parse_json, JSON_CONFIG
+import telemetry
+
+
+def default_temperatures(k: int) -> List[float]:
+    # spread over the useful range, so the candidates differ more than their sampling noise
+    return [round(float(t), 2) for t in np.linspace(0.3, 1.3, k)] if k > 1 else [1.0]
+
+
+def judge_candidate(game_data, outcome) -> dict:
+    """
+    Validates and solves a candidate game locally, the way validate_item and solve_category would.
+
+    Returns:
+        {"GameDef": the game after local repairs, "Valid", "Message",
+         "InEquilibrium": True if the observed outcome is a pure equilibrium,
+         "Unique": True if that equilibrium is the game's only one (the criterion of collect_validated_games),
+         "Equilibria": {"Support", "Vertex", "LemkeHawson", "Comments"} for valid games}
+    """
+    game_data, valid, message, changes = repair_and_validate(game_data)
+    result = {"GameDef": game_data, "Valid": valid is True, "Message": message, "InEquilibrium": False, "Unique": False}
+    if valid is not True:
+        return result
+    try:
+        game = NGame.from_json(game_data) if len(game_data) > 2 else Game.from_json(game_data)
+    except (ValueError, KeyError, TypeError) as e:
+        result.update(Valid=False, Message=f"Error setting up utilities: {e}")
+        return result
+    if len(game_data) > 2:
+        equilibria, pure, comments = solve_n(game)
+        result["Equilibria"] = {"Support": equilibria, "Vertex": equilibria, "LemkeHawson": [], "Comments": comments, "Complete": False}
+        result["InEquilibrium"] = game.profile(outcome) in pure
+        result["Unique"] = result["InEquilibrium"] and len(equilibria) == 1
+        return result
+    nashgame, message = create_nashpy_game(game)
+    if nashgame is None:
+        result.update(Valid=False, Message=message)
+        return result
+    pure = solve_pure_batch([game.matrices()])[0]
+    support, vertex, lemke_hawson, comments = calaculate_nash_equilibria(game, nashgame, pure)
+    result["Equilibria"] = {"Support": support, "Vertex": vertex, "LemkeHawson": lemke_hawson, "Comments": comments}
+    result["InEquilibrium"] = game.profile(outcome) in pure["Equilibria"]
+    result["Unique"] = result["InEquilibrium"] and len(support) == len(vertex) == 1
+    return result
+
+
+async def candidate_utilities(agent, description: str, players: List[dict], temperature: float) -> Optional[List[dict]]:
+    """
+    Requests the utilities of every player at one temperature, concurrently.
+
+    Returns:
+        The complete game, or None if any player's utilities could not be parsed.
+    """
+    json_str = json.dumps(players)
+    config = dict(JSON_CONFIG, temperature=temperature)
+
+    async def utilities(player):
+        response = await agent.aget_response(utilities_prompt(description, player["name"], json_str), config)
+        return parse_json(response, "utilities")
+
+    tasks = [asyncio.create_task(utilities(player)) for player in players]
+    try:
+        results = await asyncio.gather(*tasks)
+    except CacheMiss:
+        raise
+    except Exception as e:
+        print(f"Error during speculative autoformalization: {e}")
+        return None
+    finally:
+        # a failed request would otherwise leave the other players' requests running
+        for task in tasks:
+            task.cancel()
+    return [dict(player, utilities=result) for player, result in zip(players, results)]
+
+
+async def speculative_item(agent, item, k: int = 4, temperatures: List[float] = None):
+    """
+    Autoformalizes a case with k candidate utility specifications requested concurrently at different temperatures.
+
+    The players and actions are formalized once, and the observed outcome alongside the candidates unless the case
+    already has one. Every candidate is validated and solved locally as soon as it arrives. The first whose only
+    equilibrium is the observed outcome wins and the requests still outstanding are cancelled.
+    Without a winner the case keeps the first candidate with the outcome in its equilibria, else the first valid one.
+
+    Returns:
+        The case with "Game" (as set by autoformalize_item), "Outcome" and
+        "Speculative": {"Candidates": [{"Temperature", "Valid", "InEquilibrium", "Unique", "Message"}, ...],
+                        "Winner": index of the kept candidate or None, "Unique": True if it matches uniquely,
+                        "Cancelled": candidates cancelled}
+    """
+    if item["Article"] == "Error":
+        return item
+    temperatures = temperatures if temperatures is not None else default_temperatures(k)
+    description = (f"Background: {item['Article']}"
+                   f"\nInteraction of interest: {item['Description']}")
+    players = await asyncio.to_thread(autoformalize_players_actions, agent, description)
+    if players is None:
+        item["Game"] = None
+        return item
+    outcome_task = None
+    if not isinstance(item.get("Outcome"), dict):
+        game_string = json.dumps([{x.get("name"): x.get("actions")} for x in players if isinstance(x, dict)])
+        outcome_task = asyncio.create_task(asyncio.to_thread(autoformalize_expected_outcomes, agent, description, game_string))
+    tasks = {asyncio.create_task(candidate_utilities(agent, description, players, t)): j for j, t in enumerate(temperatures)}
+    outcome = item["Outcome"] if outcome_task is None else None
+
+    async def observed():
+        # the outcome is only needed to judge, so it is awaited once the first candidate is ready
+        nonlocal outcome
+        if outcome is None:
+            outcome = await outcome_task
+            outcome = outcome if isinstance(outcome, dict) else {}
+        return outcome
+
+    candidates = [None] * len(temperatures)
+    judged = {}
+    winner = None
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                j = tasks[task]
+                game = task.result()
+                summary = {"Temperature": temperatures[j], "Valid": False, "InEquilibrium": False, "Unique": False}
+                if game is not None:
+                    # solving may take a while on large games, keep receiving the other candidates meanwhile
+                    judged[j] = await asyncio.to_thread(judge_candidate, game, await observed())
+                    summary.update({key: judged[j][key] for key in ("Valid", "InEquilibrium", "Unique", "Message")})
+                else:
+                    summary["Message"] = "Utilities could not be parsed"
+                candidates[j] = summary
+                if game is not None and judged[j]["Unique"] and winner is None:
+                    winner = j
+    except BaseException:
+        # the outcome is not needed once the case has failed
+        if outcome_task is not None:
+            outcome_task.cancel()
+        raise
+    finally:
+        # cancel the candidates still outstanding, also when the case fails, so none is left running
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    outcome = await observed()
+    if winner is None:
+        ranked = [j for j in sorted(judged) if judged[j]["InEquilibrium"]] + [j for j in sorted(judged) if judged[j]["Valid"]]
+        winner = ranked[0] if ranked else (min(judged) if judged else None)
+    item["Game"] = judged[winner]["GameDef"] if winner is not None else None
+    if outcome:
+        item["Outcome"] = outcome
+    item["Speculative"] = {"Candidates": [x for x in candidates if x is not None],
+                           "Winner": winner,
+                           "Unique": winner is not None and judged[winner]["Unique"],
+                           "Cancelled": len(pending)}
+    telemetry.record("speculative", "speculative", Candidates=len(temperatures), Completed=len(judged),
+                     Cancelled=len(pending), Unique=item["Speculative"]["Unique"])
+    return item
+
+
+async def speculative_category(agent, category, k: int = 4, temperatures: List[float] = None, max_cases: int = None):
+    """
+    speculative_item over a category, with max_cases cases in flight (by default as many as the agent's
+    requests per minute allow with all their candidates outstanding).
+    """
+    if max_cases is None:
+        max_cases = max(1, getattr(agent, "rpm", 10) // (2 * k))
+    semaphore = asyncio.Semaphore(max_cases)
+
+    async def run(i, item):
+        async with semaphore:
+            print("processing ", i)
+            with telemetry.context(case=i):
+                try:
+                    return await speculative_item(agent, item, k, temperatures)
+                except CacheMiss:
+                    raise
+                except Exception as e:
+                    # one failing case leaves the others of the category to finish
+                    print(f"Error during speculative autoformalization of case {i}: {e}")
+                    return item
+
+    category[:] = await asyncio.gather(*[run(i, item) for i, item in enumerate(category)])
+    print(f"unique matches: {sum(bool(item.get('Speculative', {}).get('Unique')) for item in category)} of {len(category)}")
+    return category
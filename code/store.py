@@ -0,0 +1,164 @@
+import json
+import os
+
+
+class CaseStore:
+    """
+    Record-oriented store for the cases of a category.
+
+    Cases live in an append-only JSONL log, one line per committed version of a case:
+        {"Index": i, "Stage": stage name or null, "Case": {...}}
+    The latest line for an index is the current version, earlier lines keep the history of stage results.
+    Every put is flushed and fsynced before returning, so a crash loses at most the case being processed.
+    A side index (path + ".idx") maps each case to the offset of its latest line for random access; it is
+    rewritten periodically and brought up to date from the tail of the log when the store is opened.
+    """
+    def __init__(self, path, index_every=50):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.index_every = index_every
+        self.offsets = {}
+        self.indexed_size = 0
+        self.unsaved = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                stored = json.load(f)
+            self.offsets = {int(i): offset for i, offset in stored["Offsets"].items()}
+            self.indexed_size = stored["Size"]
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+        self._scan(self.indexed_size)
+        self.log = open(self.path, "ab")
+
+    def _scan(self, start):
+        # index lines written after the last saved index; a partially written last line is dropped
+        if start > os.path.getsize(self.path):
+            self.offsets, start = {}, 0
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                self.offsets[record["Index"]] = offset
+                offset += len(line)
+        if offset < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        self.indexed_size = offset
+
+    def save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"Size": self.indexed_size, "Offsets": self.offsets}, f)
+        os.replace(tmp_path, self.index_path)
+        self.unsaved = 0
+
+    def put(self, index, case, stage=None):
+        line = (json.dumps({"Index": index, "Stage": stage, "Case": case}) + "\n").encode("utf-8")
+        offset = self.log.seek(0, os.SEEK_END)
+        self.log.write(line)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.offsets[index] = offset
+        self.indexed_size = offset + len(line)
+        self.unsaved += 1
+        if self.unsaved >= self.index_every:
+            self.save_index()
+
+    def append(self, case, stage=None):
+        index = max(self.offsets, default=-1) + 1
+        self.put(index, case, stage)
+        return index
+
+    def get(self, index):
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[index])
+            return json.loads(f.readline())["Case"]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, index):
+        return index in self.offsets
+
+    def indices(self):
+        return sorted(self.offsets)
+
+    def __iter__(self):
+        # stream (index, case) pairs without loading the whole category
+        with open(self.path, "rb") as f:
+            for index in self.indices():
+                f.seek(self.offsets[index])
+                yield index, json.loads(f.readline())["Case"]
+
+    def history(self, index):
+        # every committed version of a case, oldest first, as (stage, case) pairs
+        versions = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["Index"] == index:
+                    versions.append((record["Stage"], record["Case"]))
+        return versions
+
+    def apply(self, function, stage=None, indices=None):
+        """
+        Runs a per-case stage function over the store, committing each case as soon as it is processed.
+
+        Args:
+            function: callable taking a case and returning the updated case.
+            stage: name recorded with each committed case.
+            indices: restrict the stage to these cases.
+        """
+        for index in (indices if indices is not None else self.indices()):
+            print("processing ", index)
+            self.put(index, function(self.get(index)), stage)
+
+    def to_list(self):
+        return [case for _, case in self]
+
+    def export_json(self, json_path):
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_list(), f, indent=4)
+        os.replace(tmp_path, json_path)
+
+    def compact(self):
+        # drop superseded versions from the log
+        tmp_path = self.path + ".tmp"
+        offsets = {}
+        with open(tmp_path, "wb") as f:
+            for index, case in self:
+                offsets[index] = f.tell()
+                f.write((json.dumps({"Index": index, "Stage": None, "Case": case}) + "\n").encode("utf-8"))
+        self.log.close()
+        os.replace(tmp_path, self.path)
+        self.offsets = offsets
+        self.indexed_size = os.path.getsize(self.path)
+        self.log = open(self.path, "ab")
+        self.save_index()
+
+    def close(self):
+        self.save_index()
+        self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def from_json(cls, json_path, path=None):
+        # import a category saved with json.dump, unless the store already exists
+        path = path if path is not None else os.path.splitext(json_path)[0] + ".jsonl"
+        exists = os.path.exists(path)
+        store = cls(path)
+        if not exists:
+            with open(json_path) as f:
+                for index, case in enumerate(json.load(f)):
+                    store.put(index, case, "import")
+            store.save_index()
+        return store
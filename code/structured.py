@@ -0,0 +1,164 @@
+import json
+import threading
+from collections import defaultdict
+import telemetry
+
+
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+# response schemas for outputs with fixed keys; utilities and outcomes are keyed by
+# action and player names, which a response schema cannot express, so they only request JSON
+PLAYERS_ACTIONS_CONFIG = {"response_mime_type": "application/json",
+                          "response_schema": {"type": "array",
+                                              "items": {"type": "object",
+                                                        "properties": {"name": {"type": "string"},
+                                                                       "actions": {"type": "array", "items": {"type": "string"}}},
+                                                        "required": ["name", "actions"]}}}
+CASES_CONFIG = {"response_mime_type": "application/json",
+                "response_schema": {"type": "array",
+                                    "items": {"type": "object",
+                                              "properties": {"Species": {"type": "array", "items": {"type": "string"}},
+                                                             "Description": {"type": "string"},
+                                                             "Query": {"type": "string"}},
+                                              "required": ["Species", "Description", "Query"]}}}
+STUDY_CONFIG = {"response_mime_type": "application/json",
+                "response_schema": {"type": "object",
+                                    "properties": {key: {"type": "string"} for key in ["Goal", "Hypothesis", "Type", "Method", "Instruments", "Data", "Ethics"]},
+                                    "required": ["Goal", "Hypothesis", "Type", "Method", "Instruments", "Data", "Ethics"]}}
+
+_stats = defaultdict(lambda: {"Parsed": 0, "Repaired": 0, "Failed": 0})
+_lock = threading.Lock()
+
+
+def _count(stage, outcome):
+    with _lock:
+        _stats[stage][outcome] += 1
+
+
+def parse_stats():
+    # parse outcomes per stage since the start of the run
+    with _lock:
+        return {stage: dict(counts) for stage, counts in _stats.items()}
+
+
+def _strip_fences(text):
+    # content of the last ```json (or ```) block, tolerating a missing closing fence
+    if "```" not in text:
+        return text
+    if "```json" in text:
+        text = text.split("```json")[-1]
+    else:
+        parts = text.split("```")
+        text = parts[-2] if len(parts) > 2 else parts[-1]
+    return text.split("```")[0]
+
+
+def _scan(text):
+    """
+    Copies the first JSON value in text, dropping comments and trailing commas and stopping at its end.
+
+    Returns:
+        A tuple: (copied text, complete, inside a string at the end, open containers, positions of commas with the containers open there)
+    """
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        return "", False, False, [], []
+    out = []
+    stack = []
+    commas = []
+    in_string = False
+    escape = False
+    i = start
+    while i < len(text):
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+            out.append(c)
+        elif c == "/" and text[i + 1:i + 2] == "/":
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end
+            continue
+        elif c == "/" and text[i + 1:i + 2] == "*":
+            end = text.find("*/", i + 2)
+            i = len(text) if end < 0 else end + 2
+            continue
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(c)
+            if not stack:
+                return "".join(out), True, False, [], []
+        elif c == ",":
+            commas.append((len(out), list(stack)))
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out), False, in_string, stack, commas
+
+
+def extract_json(text):
+    """
+    Tolerantly extracts a JSON value from a model response.
+
+    Handles code fences, text before and after the JSON, // and /* */ comments, trailing commas
+    and output truncated mid-value (closing open strings and containers, dropping an incomplete last member).
+
+    Returns:
+        A tuple: (value, repaired) where repaired tells whether the text was not valid JSON as is.
+
+    Raises:
+        ValueError if no JSON value can be recovered.
+    """
+    text = _strip_fences(text).strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    copied, complete, in_string, stack, commas = _scan(text)
+    if complete:
+        try:
+            return json.loads(copied), True
+        except ValueError as e:
+            raise ValueError(f"Could not parse JSON: {e}")
+    # truncated: close what is open, or cut back to the last complete member
+    candidates = [copied + ('"' if in_string else "") + "".join(reversed(stack))]
+    candidates += [copied[:position] + "".join(reversed(open_stack)) for position, open_stack in reversed(commas)]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            continue
+    raise ValueError("Could not parse JSON from response")
+
+
+def parse_json(response, stage="unknown"):
+    """
+    Parses a model response into JSON with extract_json, counting parse outcomes per stage.
+
+    Raises:
+        ValueError if the response holds no recoverable JSON.
+    """
+    caller = telemetry.caller()
+    try:
+        value, repaired = extract_json(response)
+    except ValueError:
+        _count(stage, "Failed")
+        telemetry.record("parse", caller, Parser=stage, Outcome="Failed")
+        raise
+    _count(stage, "Repaired" if repaired else "Parsed")
+    telemetry.record("parse", caller, Parser=stage, Outcome="Repaired" if repaired else "Parsed")
+    return value
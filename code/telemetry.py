@@ -0,0 +1,200 @@
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import List, Optional
+
+# where the current work belongs; set by the category loops, the stage runner and get_batched
+_category = contextvars.ContextVar("category", default=None)
+_stage = contextvars.ContextVar("stage", default=None)
+_case = contextvars.ContextVar("case", default=None)
+_attempt = contextvars.ContextVar("attempt", default=None)  # attempt at a request, set by AgentPool on failover
+
+_sink = None
+
+
+class Telemetry:
+    """
+    Append-only JSONL sink of telemetry events, shared by threads and by forked solver processes.
+
+    Every event is one line {"Time", "Run", "Kind", "Category", "Stage", "Case", ...} where Kind is
+    "llm" (one model call: tokens, latency, throttle sleep, cache hit, error, attempt),
+    "parse" (one parse of a model response) or "solve" (one solver invocation: path, size, latency).
+
+    Args:
+        path: The JSONL file, appended to so several runs can be compared (each has its own Run id).
+        run: Identifier of this run, a new one by default.
+    """
+    def __init__(self, path="telemetry.jsonl", run=None):
+        self.path = path
+        self.run = run if run is not None else uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.file = None
+        self.pid = None
+
+    def write(self, event):
+        line = json.dumps(event, default=str) + "\n"
+        with self.lock:
+            # a forked process gets its own handle, and O_APPEND keeps every line whole
+            if self.file is None or self.pid != os.getpid():
+                self.file = open(self.path, "a")
+                self.pid = os.getpid()
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def set_sink(sink: Optional[Telemetry]):
+    # events are dropped while no sink is set
+    global _sink
+    _sink = sink
+    return sink
+
+
+def get_sink():
+    return _sink
+
+
+@contextlib.contextmanager
+def context(category=None, stage=None, case=None, attempt=None):
+    """
+    Attributes the events recorded inside the block (in this thread or task) to a category, stage and case,
+    and the model calls to an attempt at the same request.
+    Arguments left as None keep the enclosing value.
+    """
+    tokens = [(var, var.set(value)) for var, value in ((_category, category), (_stage, stage), (_case, case), (_attempt, attempt))
+              if value is not None]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def current_stage():
+    return _stage.get()
+
+
+def current_attempt():
+    return _attempt.get()
+
+
+def caller(depth=2):
+    # name of the function depth frames up, the stage of a call made outside any stage context
+    try:
+        return sys._getframe(depth).f_code.co_name
+    except ValueError:
+        return None
+
+
+def record(kind, stage=None, case=None, **fields):
+    """
+    Records one event in the current sink, if any. stage and case default to the current context.
+    """
+    sink = _sink
+    if sink is None:
+        return
+    event = {"Time": time.time(),
+             "Run": sink.run,
+             "Kind": kind,
+             "Category": _category.get(),
+             "Stage": _stage.get() or stage,
+             "Case": _case.get() if case is None else case}
+    event.update(fields)
+    sink.write(event)
+
+
+def load_events(path="telemetry.jsonl", run=None) -> List[dict]:
+    # events of a sink file, of one run only if given
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if run is None or event.get("Run") == run:
+                events.append(event)
+    return events
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def summarize(events: List[dict]) -> dict:
+    """
+    Aggregates events per (category, stage), and for the whole run under ("All", "All").
+
+    Returns:
+        {(category, stage): {"Calls", "Cached", "Errors", "Retries": calls after a first attempt, "PromptTokens", "ResponseTokens",
+                             "Latency": total seconds generating, "P95Latency", "Sleep": total seconds throttled,
+                             "Parsed", "Repaired", "ParseFailed", "Solves", "SolveTime", "SolveTimeouts"}}
+    """
+    groups = defaultdict(lambda: {"Calls": 0, "Cached": 0, "Errors": 0, "Retries": 0, "PromptTokens": 0, "ResponseTokens": 0,
+                                  "Latency": 0.0, "P95Latency": 0.0, "Sleep": 0.0,
+                                  "Parsed": 0, "Repaired": 0, "ParseFailed": 0,
+                                  "Solves": 0, "SolveTime": 0.0, "SolveTimeouts": 0})
+    latencies = defaultdict(list)
+    for event in events:
+        for key in ((event.get("Category") or "-", event.get("Stage") or "-"), ("All", "All")):
+            group = groups[key]
+            if event["Kind"] == "llm":
+                group["Calls"] += 1
+                group["Cached"] += bool(event.get("Cached"))
+                group["Errors"] += event.get("Error") is not None
+                group["Retries"] += (event.get("Attempt") or 1) > 1
+                group["PromptTokens"] += event.get("PromptTokens", 0)
+                group["ResponseTokens"] += event.get("ResponseTokens", 0)
+                group["Latency"] += event.get("Latency", 0.0)
+                group["Sleep"] += event.get("Sleep", 0.0)
+                if not event.get("Cached"):
+                    latencies[key].append(event.get("Latency", 0.0))
+            elif event["Kind"] == "parse":
+                group[{"Parsed": "Parsed", "Repaired": "Repaired"}.get(event.get("Outcome"), "ParseFailed")] += 1
+            elif event["Kind"] == "solve":
+                group["Solves"] += 1
+                group["SolveTime"] += event.get("Latency", 0.0)
+                group["SolveTimeouts"] += event.get("Status") == "timed out"
+    for key, values in latencies.items():
+        groups[key]["P95Latency"] = _percentile(values, 0.95)
+    return dict(groups)
+
+
+def format_summary(summary: dict) -> str:
+    # one line per (category, stage), the whole run last
+    lines = [f"{'category':24} {'stage':30} {'calls':>6} {'cached':>6} {'errors':>6} {'retry':>6} {'tokens in/out':>17} "
+             f"{'generating':>10} {'p95':>7} {'throttled':>10} {'parse ok/rep/fail':>17} {'solves':>6} {'solving':>9}"]
+    for (category, stage), x in sorted(summary.items(), key=lambda item: (item[0] == ("All", "All"), str(item[0]))):
+        lines.append(f"{str(category)[:24]:24} {str(stage)[:30]:30} {x['Calls']:6d} {x['Cached']:6d} {x['Errors']:6d} {x['Retries']:6d} "
+                     f"{x['PromptTokens']:>8d}/{x['ResponseTokens']:<8d} {x['Latency']:9.1f}s {x['P95Latency']:6.2f}s "
+                     f"{x['Sleep']:9.1f}s {x['Parsed']:>5d}/{x['Repaired']}/{x['ParseFailed']:<7d} {x['Solves']:6d} {x['SolveTime']:8.2f}s")
+    return "\n".join(lines)
+
+
+def report(path="telemetry.jsonl", run=None) -> str:
+    """
+    Summary table of a sink file, for the current run by default (all runs with run="all").
+    """
+    if run is None and _sink is not None:
+        run = _sink.run
+    return format_summary(summarize(load_events(path, None if run == "all" else run)))
+
+
+if __name__ == "__main__":
+    # python telemetry.py [telemetry.jsonl] [run id | all]
+    print(report(sys.argv[1] if len(sys.argv) > 1 else "telemetry.jsonl", sys.argv[2] if len(sys.argv) > 2 else "all"))
@@ -0,0 +1,93 @@
+import json
+import math
+import os
+import threading
+
+
+class TokenEstimator:
+    """
+    Offline token counter used for rate limiting instead of count_tokens round trips.
+
+    The backend produces a raw size for a text (characters, words, or the token count of a local
+    tokenizer file) which is scaled by a ratio calibrated against the exact counts returned in the
+    usage metadata of generate_content. The calibration sample is stored on disk, so the ratio
+    survives restarts.
+
+    Args:
+        backend: "chars", "words" or "tokenizer".
+        calibration_path: JSON file holding the calibration sample (optional).
+        tokenizer_path: a HuggingFace tokenizer.json or a SentencePiece model file, for the "tokenizer" backend.
+        recalibrate_every: number of observations between ratio updates.
+        sample_size: number of most recent observations kept for calibration.
+    """
+    default_ratios = {"chars": 0.25, "words": 1.3, "tokenizer": 1.0}
+
+    def __init__(self, backend="chars", calibration_path=None, tokenizer_path=None, recalibrate_every=20, sample_size=500):
+        if backend not in self.default_ratios:
+            raise ValueError(f"Unknown token estimator backend: {backend}")
+        self.backend = backend
+        self.calibration_path = calibration_path
+        self.recalibrate_every = recalibrate_every
+        self.sample_size = sample_size
+        self.ratio = self.default_ratios[backend]
+        self.sample = []  # [raw size, actual tokens]
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.tokenizer = None
+        if backend == "tokenizer":
+            self.tokenizer = self._load_tokenizer(tokenizer_path)
+        if calibration_path is not None and os.path.exists(calibration_path):
+            with open(calibration_path) as f:
+                stored = json.load(f)
+            if stored.get("backend") == backend:
+                self.sample = stored["sample"][-sample_size:]
+                self._recalibrate()
+
+    @staticmethod
+    def _load_tokenizer(path):
+        if path is None:
+            raise ValueError("The tokenizer backend requires tokenizer_path")
+        if path.endswith(".json"):
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_file(path)
+            return lambda text: len(tokenizer.encode(text).ids)
+        import sentencepiece
+        tokenizer = sentencepiece.SentencePieceProcessor(model_file=path)
+        return lambda text: len(tokenizer.encode(text))
+
+    def raw_size(self, text):
+        if self.backend == "chars":
+            return len(text)
+        if self.backend == "words":
+            return len(text.split())
+        return self.tokenizer(text)
+
+    def count(self, text):
+        return math.ceil(self.raw_size(text) * self.ratio)
+
+    def observe(self, text, actual_tokens):
+        # feed back an exact count, e.g. usage_metadata.prompt_token_count of a response
+        size = self.raw_size(text)
+        if size == 0 or not actual_tokens:
+            return
+        with self.lock:
+            self.sample.append([size, actual_tokens])
+            del self.sample[:-self.sample_size]
+            self.pending += 1
+            if self.pending >= self.recalibrate_every:
+                self._recalibrate()
+                self.save()
+
+    def _recalibrate(self):
+        total_size = sum(size for size, _ in self.sample)
+        if total_size > 0:
+            self.ratio = sum(actual for _, actual in self.sample) / total_size
+        self.pending = 0
+
+    def save(self):
+        if self.calibration_path is None:
+            return
+        tmp_path = self.calibration_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"backend": self.backend, "ratio": self.ratio, "sample": self.sample}, f)
+        os.replace(tmp_path, self.calibration_path)